@@ -7,9 +7,15 @@ from telegram.ext import Application
 from telegram.warnings import PTBUserWarning
 
 from dasovbot.config import load_config
+from dasovbot.constants import ROLE_FRONT, ROLE_WORKER
 from dasovbot.downloader import init_downloader
 from dasovbot.handlers import register_handlers
+from dasovbot.loop_monitor import get_loop_monitor, init_loop_monitor
+from dasovbot.media_budget import init_media_budget
 from dasovbot.state import BotState
+from dasovbot.transcoder import init_transcoder
+from dasovbot.upload_pool import init_upload_pool
+from dasovbot.webhook import init_webhook, serve_webhook
 
 
 def main():
@@ -31,17 +37,33 @@ def main():
 
     config = load_config()
     init_downloader(config)
+    init_transcoder(config)
+    init_media_budget(config)
+    init_upload_pool(config)
+    init_loop_monitor(config)
+    init_webhook(config)
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    if config.loop_lag_threshold_ms:
+        get_loop_monitor().start(loop)
+    worker = config.role == ROLE_WORKER
+    state_class = BotState
+    if worker:
+        from dasovbot.services.worker import WorkerState, run_worker
+        state_class = WorkerState
+    elif config.role == ROLE_FRONT:
+        from dasovbot.services.worker import FrontState
+        state_class = FrontState
     try:
-        state = loop.run_until_complete(BotState.create(config))
+        state = loop.run_until_complete(state_class.create(config))
     except Exception as e:
         logging.error(f"Failed to initialize state: {e}")
         return
 
-    from dasovbot.dashboard.server import start_dashboard
-    loop.run_until_complete(start_dashboard(state))
+    if not worker:
+        from dasovbot.dashboard.server import start_dashboard
+        loop.run_until_complete(start_dashboard(state))
 
     try:
         loop.run_until_complete(state.migrate_and_load())
@@ -53,20 +75,30 @@ def main():
         from dasovbot.services.background import start_background_tasks
         start_background_tasks(app.bot, app.bot_data['state'])
 
-    application = (
+    builder = (
         Application.builder()
         .token(config.bot_token)
         .base_url(config.base_url)
         .read_timeout(config.read_timeout)
+        .local_mode(config.local_mode)
         .post_init(post_init)
-        .build()
     )
+    if worker:
+        # workers only send; updates are received by the front process
+        loop.run_until_complete(run_worker(builder.updater(None).build(), state))
+        return
+    if config.webhook_url:
+        builder = builder.updater(None).concurrent_updates(config.webhook_concurrency)
+    application = builder.build()
 
     application.bot_data['state'] = state
 
     register_handlers(application)
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if config.webhook_url:
+        loop.run_until_complete(serve_webhook(application, config))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,10 @@
 import os
-from dataclasses import dataclass
+import socket
+from dataclasses import dataclass, field
 
 import dotenv
 
-from dasovbot.constants import DATETIME_FORMAT, DATE_FORMAT, VIDEO_FORMAT
+from dasovbot.constants import DATETIME_FORMAT, DATE_FORMAT, FORMAT_LADDER, VIDEO_FORMAT
 
 
 @dataclass
@@ -18,6 +19,32 @@ class Config:
     config_folder: str = "/"
     empty_media_folder: bool = False
     cookies_file: str = ""
+    prefetch_inline: bool = False
+    prefetch_max_duration: int = 600
+    playlist_max_items: int = 100
+    prefetch_max_pending: int = 2
+    local_mode: bool = False
+    local_media_folder: str = ""
+    transcode_concurrency: int = 1
+    transcode_nice: int = 10
+    split_large_videos: bool = False
+    upload_concurrency: int = 2
+    pipeline_queue_size: int = 2
+    media_budget_mb: int = 0
+    media_min_free_mb: int = 1024
+    fingerprint_mb: int = 8
+    trace_retention_days: int = 14
+    loop_lag_threshold_ms: int = 500
+    dashboard_mode: str = 'inline'
+    webhook_url: str = ""
+    webhook_secret: str = ""
+    webhook_concurrency: int = 8
+    role: str = 'all'
+    worker_id: str = ""
+    lease_sec: int = 60
+    helper_bot_tokens: list[str] = field(default_factory=list)
+    storage_chat_id: str = ""
+    helper_upload_concurrency: int = 1
 
     @property
     def video_info_file(self) -> str:
@@ -43,6 +70,10 @@ class Config:
     def db_file(self) -> str:
         return f'{self.config_folder}/data/bot.db'
 
+    @property
+    def control_socket(self) -> str:
+        return f'{self.config_folder}/data/control.sock'
+
     @property
     def media_folder(self) -> str:
         return f'{self.config_folder}/media'
@@ -70,6 +101,32 @@ def load_config() -> Config:
         config_folder=config_folder,
         empty_media_folder=os.getenv('EMPTY_MEDIA_FOLDER', 'false').lower() == 'true',
         cookies_file=os.getenv('COOKIES_FILE') or '',
+        prefetch_inline=os.getenv('PREFETCH_INLINE', 'false').lower() == 'true',
+        prefetch_max_duration=int(os.getenv('PREFETCH_MAX_DURATION') or 600),
+        prefetch_max_pending=int(os.getenv('PREFETCH_MAX_PENDING') or 2),
+        playlist_max_items=int(os.getenv('PLAYLIST_MAX_ITEMS') or 100),
+        local_mode=os.getenv('LOCAL_MODE', 'false').lower() == 'true',
+        local_media_folder=os.getenv('LOCAL_MEDIA_FOLDER') or '',
+        transcode_concurrency=int(os.getenv('TRANSCODE_CONCURRENCY') or 1),
+        transcode_nice=int(os.getenv('TRANSCODE_NICE') or 10),
+        split_large_videos=os.getenv('SPLIT_LARGE_VIDEOS', 'false').lower() == 'true',
+        upload_concurrency=int(os.getenv('UPLOAD_CONCURRENCY') or 2),
+        pipeline_queue_size=int(os.getenv('PIPELINE_QUEUE_SIZE') or 2),
+        media_budget_mb=int(os.getenv('MEDIA_BUDGET_MB') or 0),
+        media_min_free_mb=int(os.getenv('MEDIA_MIN_FREE_MB') or 1024),
+        fingerprint_mb=int(os.getenv('FINGERPRINT_MB') or 8),
+        trace_retention_days=int(os.getenv('TRACE_RETENTION_DAYS') or 14),
+        loop_lag_threshold_ms=int(os.getenv('LOOP_LAG_THRESHOLD_MS') or 500),
+        dashboard_mode=os.getenv('DASHBOARD_MODE') or 'inline',
+        webhook_url=os.getenv('WEBHOOK_URL') or '',
+        webhook_secret=os.getenv('WEBHOOK_SECRET') or '',
+        webhook_concurrency=int(os.getenv('WEBHOOK_CONCURRENCY') or 8),
+        role=os.getenv('ROLE') or 'all',
+        worker_id=os.getenv('WORKER_ID') or f'{socket.gethostname()}-{os.getpid()}',
+        lease_sec=int(os.getenv('LEASE_SEC') or 60),
+        helper_bot_tokens=[token.strip() for token in (os.getenv('HELPER_BOT_TOKENS') or '').split(',') if token.strip()],
+        storage_chat_id=os.getenv('STORAGE_CHAT_ID') or '',
+        helper_upload_concurrency=int(os.getenv('HELPER_UPLOAD_CONCURRENCY') or 1),
     )
 
 
@@ -79,22 +136,28 @@ def match_filter(info, *, incomplete):
         return f"{now()} # ignore_video {info.get('url')}"
 
 
+def make_format(height: int = FORMAT_LADDER[0]) -> str:
+    video_format = VIDEO_FORMAT.format(height=height)
+    return f"{video_format}+ba[ext=m4a] / {video_format}+ba[ext=mp4] / b[ext=mp4][height<=?{height}]"
+
+
 def make_ydl_opts(config: Config) -> dict:
     media_folder = config.media_folder
     opts = {
-        'format': f"{VIDEO_FORMAT}+ba[ext=m4a] / {VIDEO_FORMAT}+ba[ext=mp4] / b[ext=mp4][height<=?720]",
-        'outtmpl': f'{media_folder}/%(timestamp>{DATETIME_FORMAT},upload_date>{DATE_FORMAT}_u,epoch>{DATE_FORMAT}_e)s - %(title).80s [%(id).20s].%(ext)s',
+        'format': make_format(),
+        'outtmpl': f'{media_folder}/%(timestamp>{DATETIME_FORMAT},upload_date>{DATE_FORMAT}_u|undated)s - %(title).80s [%(id).20s].%(ext)s',
         'retries': 5,
         'fragment_retries': 5,
+        'continuedl': True,
         'extractor_retries': 5,
         'merge_output_format': 'mp4',
         'noplaylist': True,
         'extract_flat': 'in_playlist',
-        'playlist_items': '1-20',
+        # inline answers page through these 50 at a time; subscriptions only look at the newest few
+        'playlist_items': f'1-{config.playlist_max_items}',
         'match_filter': match_filter,
         'no_warnings': True,
         'quiet': True,
-        'postprocessors': [{'key': 'FFmpegMetadata'}],
     }
     if config.cookies_file:
         opts['cookiefile'] = config.cookies_file
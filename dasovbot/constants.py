@@ -15,13 +15,42 @@ VIDEO_ERROR_MESSAGES = [
 # Intervals
 INTERVAL_SEC = 60 * 60  # an hour
 TIMEOUT_SEC = 60 * 10  # 10 minutes
+INLINE_DEBOUNCE_SEC = 0.7  # wait for the user to stop typing before extracting
+
+# Process roles: `all` runs everything, `front` handles Telegram updates, `worker` processes leased intents
+ROLE_ALL = 'all'
+ROLE_FRONT = 'front'
+ROLE_WORKER = 'worker'
+
+# Webhook route on the dashboard server, appended to WEBHOOK_URL
+WEBHOOK_PATH = '/telegram/webhook'
+
+# /start payload that sends every part of a split video, see inline_parts_caption
+PARTS_START_PREFIX = 'parts_'
 
 # Sources
 SOURCE_SUBSCRIPTION = 'subscription'
 SOURCE_DOWNLOAD = 'download'
 SOURCE_INLINE = 'inline'
 
+# Intent trace outcomes
+OUTCOME_DELIVERED = 'delivered'
+OUTCOME_CACHED = 'cached'
+OUTCOME_DEDUPLICATED = 'deduplicated'
+OUTCOME_DEFERRED = 'deferred'
+OUTCOME_NO_INFO = 'no_info'
+OUTCOME_DOWNLOAD_FAILED = 'download_failed'
+OUTCOME_TOO_LARGE = 'too_large'
+OUTCOME_UPLOAD_FAILED = 'upload_failed'
+OUTCOME_DROPPED = 'dropped'
+OUTCOME_ERROR = 'error'
+OUTCOME_CANCELLED = 'cancelled'
+
 # Format strings
 DATETIME_FORMAT = '%Y%m%d_%H%M%S'
 DATE_FORMAT = '%Y%m%d'
-VIDEO_FORMAT = 'bv*[ext=mp4][height<=?720][filesize_approx<=?2G]'
+VIDEO_FORMAT = 'bv*[ext=mp4][height<=?{height}][filesize_approx<=?2G]'
+
+# Upload limits
+MAX_UPLOAD_SIZE = 2000 << 20  # Bot API upload limit
+FORMAT_LADDER = (720, 480, 360, 240)  # preferred heights, best first
@@ -0,0 +1,20 @@
+import asyncio
+import logging
+
+from dasovbot.config import load_config
+from dasovbot.dashboard.server import run_dashboard_process
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s %(name)s %(levelname)s %(message)s',
+        level=logging.INFO,
+    )
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    config = load_config()
+    asyncio.run(run_dashboard_process(config))
+
+
+if __name__ == "__main__":
+    main()
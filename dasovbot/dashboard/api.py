@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from functools import partial
+from typing import Callable
+
+from aiohttp import web
+
+from dasovbot.dashboard.views import check_etag, get_control, get_state, query_subscriptions, query_videos, user_label
+from dasovbot.events import intent_event
+from dasovbot.services.intent_processor import filter_intents
+
+API_PREFIX = '/api/v1'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+INTENT_STATUSES = ('active', 'ignored', 'all')
+VIDEO_SORTS = ('processed_at', 'upload_date')
+
+
+def bad_request(message: str) -> web.HTTPBadRequest:
+    return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+
+def encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> list | None:
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise bad_request('invalid cursor')
+    if not isinstance(key, list):
+        raise bad_request('invalid cursor')
+    return key
+
+
+def parse_limit(request: web.Request) -> int:
+    try:
+        limit = int(request.query.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise bad_request('invalid limit')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(request: web.Request, items: list[dict], key: Callable[[dict], list], reverse: bool = False) -> dict:
+    # keyset pagination: the cursor is the sort key of the last item on the previous page,
+    # so entries added or removed ahead of it don't shift the pages
+    cursor = decode_cursor(request.query.get('cursor'))
+    limit = parse_limit(request)
+    items.sort(key=key, reverse=reverse)
+    if cursor is not None:
+        try:
+            items = [item for item in items if (key(item) < cursor if reverse else key(item) > cursor)]
+        except TypeError:
+            raise bad_request('invalid cursor')
+    page = items[:limit]
+    return {
+        'items': page,
+        'next_cursor': encode_cursor(key(page[-1])) if len(items) > limit else None,
+    }
+
+
+def api_response(data: dict, etag: str | None = None) -> web.Response:
+    headers = {'Cache-Control': 'no-cache'}
+    if etag:
+        headers['ETag'] = etag
+    return web.json_response(data, headers=headers, dumps=partial(json.dumps, ensure_ascii=False, default=str))
+
+
+async def api_intents(request: web.Request) -> web.Response:
+    state = get_state(request)
+    status = request.query.get('status', 'active')
+    if status not in INTENT_STATUSES:
+        raise bad_request(f'status must be one of {", ".join(INTENT_STATUSES)}')
+    etag = check_etag(request, state, 'intents', 'videos')
+    if status == 'active':
+        selected = filter_intents(state.intents)
+    elif status == 'ignored':
+        selected = {url: intent for url, intent in state.intents.items() if intent.ignored}
+    else:
+        selected = state.intents
+    items = [intent_event(url, intent, state.videos.get(url)) for url, intent in selected.items()]
+    page = paginate(request, items, key=lambda item: [item['priority'], item['url']], reverse=True)
+    return api_response({**page, 'total': len(items)}, etag)
+
+
+async def api_videos(request: web.Request) -> web.Response:
+    state = get_state(request)
+    sort_by = request.query.get('sort', 'processed_at')
+    if sort_by not in VIDEO_SORTS:
+        raise bad_request(f'sort must be one of {", ".join(VIDEO_SORTS)}')
+    etag = check_etag(request, state, 'videos')
+    items = query_videos(state, request.query.get('source', 'all'), request.query.get('q', '').strip())
+    page = paginate(request, items, key=lambda item: [item[sort_by], item['url']], reverse=True)
+    return api_response({**page, 'total': len(items)}, etag)
+
+
+async def api_subscriptions(request: web.Request) -> web.Response:
+    state = get_state(request)
+    etag = check_etag(request, state, 'subscriptions', 'users')
+    items = []
+    for item in query_subscriptions(state):
+        chat_ids = item.pop('chat_ids')
+        items.append({**item, 'subscribers': [{'id': cid, 'label': user_label(state, cid)} for cid in chat_ids]})
+    page = paginate(request, items, key=lambda item: [(item['title'] or '').lower(), item['url']])
+    return api_response({**page, 'total': len(items)}, etag)
+
+
+async def api_system(request: web.Request) -> web.Response:
+    status = await get_control(request).call('status')
+    loop = status['loop']
+    # live counters change every poll, so this endpoint has no ETag
+    return api_response({
+        **status,
+        'loop': {**loop, 'recent': [{**stall, 'stack': None} for stall in loop['recent']]},
+        'versions': dict(get_state(request).versions),
+    })
+
+
+def add_api_routes(app: web.Application):
+    app.router.add_get(f'{API_PREFIX}/intents', api_intents)
+    app.router.add_get(f'{API_PREFIX}/videos', api_videos)
+    app.router.add_get(f'{API_PREFIX}/subscriptions', api_subscriptions)
+    app.router.add_get(f'{API_PREFIX}/system', api_system)
@@ -4,6 +4,7 @@ import secrets
 
 from aiohttp import web
 
+from dasovbot.constants import WEBHOOK_PATH
 
 COOKIE_NAME = 'dasovbot_token'
 
@@ -29,11 +30,37 @@ def check_token(request: web.Request) -> bool:
     return token == make_token(get_password())
 
 
+def check_bearer_token(request: web.Request, env_var: str) -> bool:
+    expected = os.getenv(env_var)
+    if not expected:
+        return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and secrets.compare_digest(token.encode(), expected.encode())
+
+
+def check_metrics_token(request: web.Request) -> bool:
+    return check_bearer_token(request, 'METRICS_TOKEN')
+
+
+def check_api_token(request: web.Request) -> bool:
+    return check_bearer_token(request, 'API_TOKEN')
+
+
 @web.middleware
 async def auth_middleware(request: web.Request, handler):
     if request.path == '/login':
         return await handler(request)
+    if request.path == WEBHOOK_PATH:
+        # verified by the receiver against the secret token registered with Telegram
+        return await handler(request)
+    if request.path == '/metrics' and check_metrics_token(request):
+        return await handler(request)
+    is_api = request.path.startswith('/api/')
+    if is_api and check_api_token(request):
+        return await handler(request)
     if not check_token(request):
+        if is_api:
+            raise web.HTTPUnauthorized(text='{"error": "unauthorized"}', content_type='application/json')
         raise web.HTTPFound('/login')
     return await handler(request)
 
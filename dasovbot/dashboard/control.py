@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import logging
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+import aiohttp
+from aiohttp import web
+
+from dasovbot.dashboard.views import get_state, system_snapshot
+from dasovbot.loop_monitor import get_loop_monitor
+from dasovbot.media_budget import get_media_budget
+from dasovbot.services.background import run_populate_subscriptions
+from dasovbot.services.pipeline import get_pipeline
+from dasovbot.transcoder import get_transcoder
+from dasovbot.upload_pool import get_upload_pool
+
+if TYPE_CHECKING:
+    from dasovbot.state import BotState
+
+logger = logging.getLogger(__name__)
+
+CONTROL_PREFIX = '/control'
+CALL_TIMEOUT = 10
+# headers passed through when a page served by the bot process is proxied
+PROXY_REQUEST_HEADERS = ('Accept', 'Content-Type', 'Last-Event-ID', 'X-Telegram-Bot-Api-Secret-Token')
+PROXY_RESPONSE_HEADERS = (
+    'Cache-Control', 'Content-Disposition', 'Content-Type', 'Location', 'Retry-After', 'X-Accel-Buffering',
+    'X-Content-Type-Options',
+)
+
+
+async def status(state: BotState) -> dict:
+    pipeline = get_pipeline()
+    uploads = get_upload_pool()
+    return {
+        **system_snapshot(state),
+        'tasks': dict(state.background_task_status),
+        'migration': state.migration_progress,
+        'pipeline': pipeline.stats() if pipeline else None,
+        'transcoder': get_transcoder().stats(),
+        'uploads': uploads.stats() if uploads else None,
+        'media': get_media_budget().stats(),
+        'fingerprints': state.fingerprint_index.stats(),
+        'loop': get_loop_monitor().stats(),
+    }
+
+
+async def queue_size(state: BotState) -> int:
+    return state.download_queue.qsize()
+
+
+async def ignored_inline(state: BotState) -> list[dict]:
+    items = []
+    for url, tiq in state.temporary_inline_queries.items():
+        if tiq.ignored:
+            title = url
+            for result in tiq.results:
+                if hasattr(result, 'title') and result.title:
+                    title = result.title
+                    break
+            items.append({
+                'url': url,
+                'title': title,
+                'source': 'inline',
+                'type': 'inline',
+            })
+    return items
+
+
+async def retry_ignored(state: BotState, url: str, type: str):
+    if type == 'intent' and url in state.intents:
+        await state.retry_intent(url)
+        state.download_queue.put_nowait(url)
+    elif type == 'inline' and url in state.temporary_inline_queries:
+        state.temporary_inline_queries[url].ignored = False
+
+
+async def remove_ignored(state: BotState, url: str, type: str):
+    if type == 'intent':
+        await state.pop_intent(url)
+    elif type == 'inline':
+        state.pop_temporary_inline_query(url)
+
+
+async def remove_intent(state: BotState, url: str):
+    await state.pop_intent(url)
+
+
+async def remove_subscription(state: BotState, url: str, chat_id: str = ''):
+    if chat_id:
+        await state.remove_subscriber(url, chat_id)
+    else:
+        await state.pop_subscription(url)
+
+
+async def populate(state: BotState):
+    asyncio.create_task(run_populate_subscriptions(state))
+
+
+# everything the dashboard may ask of the bot; reads of the bot's in-memory runtime and all mutations
+HANDLERS = {
+    'status': status,
+    'queue_size': queue_size,
+    'ignored_inline': ignored_inline,
+    'retry_ignored': retry_ignored,
+    'remove_ignored': remove_ignored,
+    'remove_intent': remove_intent,
+    'remove_subscription': remove_subscription,
+    'populate': populate,
+}
+
+
+class LocalControl:
+    def __init__(self, state: BotState):
+        self.state = state
+
+    async def call(self, name: str, **params) -> Any:
+        return await HANDLERS[name](self.state, **params)
+
+
+# control calls to the bot process over its local unix socket
+class RemoteControl:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self.socket_path),
+                base_url='http://bot',
+            )
+        return self._session
+
+    async def call(self, name: str, **params) -> Any:
+        try:
+            async with self.session.post(
+                f'{CONTROL_PREFIX}/{name}', json=params, timeout=aiohttp.ClientTimeout(total=CALL_TIMEOUT),
+            ) as response:
+                response.raise_for_status()
+                return (await response.json())['result']
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning('Control call %s failed: %s', name, e)
+            raise web.HTTPServiceUnavailable(text='Bot is not reachable')
+
+    async def proxy(self, request: web.Request) -> web.StreamResponse:
+        headers = {name: request.headers[name] for name in PROXY_REQUEST_HEADERS if name in request.headers}
+        try:
+            upstream = await self.session.request(
+                request.method, request.path_qs,
+                headers=headers,
+                data=await request.read() or None,
+                allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(total=None, connect=CALL_TIMEOUT),
+            )
+        except aiohttp.ClientError as e:
+            logger.warning('Proxying %s failed: %s', request.path, e)
+            raise web.HTTPServiceUnavailable(text='Bot is not reachable')
+        async with upstream:
+            response = web.StreamResponse(
+                status=upstream.status,
+                headers={name: upstream.headers[name] for name in PROXY_RESPONSE_HEADERS if name in upstream.headers},
+            )
+            await response.prepare(request)
+            try:
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+            except (aiohttp.ClientError, ConnectionResetError):
+                pass
+        return response
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def proxy(request: web.Request) -> web.StreamResponse:
+    return await request.app['control'].proxy(request)
+
+
+async def handle_control(request: web.Request) -> web.Response:
+    handler = HANDLERS.get(request.match_info['name'])
+    if handler is None:
+        raise web.HTTPNotFound(text='Unknown control call')
+    params = await request.json() if request.can_read_body else {}
+    state = get_state(request)
+    try:
+        inspect.signature(handler).bind(state, **params)
+    except TypeError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    result = await handler(state, **params)
+    return web.json_response({'result': result}, dumps=partial(json.dumps, ensure_ascii=False, default=str))
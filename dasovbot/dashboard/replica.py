@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+from dasovbot.config import Config
+from dasovbot.state import BotState
+
+logger = logging.getLogger(__name__)
+
+# upper bound on how often a busy dashboard reloads the collections while the bot keeps writing
+REFRESH_INTERVAL = 2.0
+
+
+@dataclass
+class ReplicaState(BotState):
+    # read-only copy for a dashboard in its own process; changes go to the bot over
+    # the control channel and show up here on the next refresh
+    data_version: int | None = None
+    video_rowid: int = 0
+    refreshed_at: float = 0.0
+    stale: bool = True
+    refresh_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @classmethod
+    async def open(cls, config: Config) -> 'ReplicaState':
+        from dasovbot.database import open_readonly
+        while not os.path.exists(config.db_file):
+            logger.info('Waiting for the bot to create %s', config.db_file)
+            await asyncio.sleep(1)
+        return cls(config=config, db=await open_readonly(config.db_file))
+
+    async def refresh(self):
+        from dasovbot.database import data_version, load_subscriptions, load_users, load_videos_since
+        async with self.refresh_lock:
+            if not self.stale and time.monotonic() - self.refreshed_at < REFRESH_INTERVAL:
+                return
+            self.stale = False
+            self.refreshed_at = time.monotonic()
+            try:
+                version = await data_version(self.db)
+                if version == self.data_version:
+                    return
+                # workers commit download progress every few seconds; only what changed is
+                # reloaded and touched, so ETags of untouched collections stay valid
+                videos, rowid = await load_videos_since(self.db, self.video_rowid)
+                users = await load_users(self.db)
+                subscriptions = await load_subscriptions(self.db)
+                await self.reload_intents()
+            except sqlite3.Error as e:
+                logger.warning('Dashboard replica refresh failed: %s', e)
+                return
+            self.video_rowid = rowid
+            self.add_videos(videos)
+            if users != self.users:
+                self.users = users
+                self.touch('users')
+            if subscriptions != self.subscriptions:
+                self.subscriptions = subscriptions
+                self.touch('subscriptions')
+            self.data_version = version
+
+
+@web.middleware
+async def replica_middleware(request: web.Request, handler):
+    state = request.app['state']
+    await state.refresh()
+    try:
+        return await handler(request)
+    finally:
+        if request.method == 'POST':
+            # the bot has committed by the time a control call returns; show it on the redirect
+            state.stale = True
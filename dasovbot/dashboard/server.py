@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+from contextlib import suppress
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -9,10 +11,19 @@ import aiohttp_jinja2
 import jinja2
 from aiohttp import web
 
+from dasovbot.dashboard.api import add_api_routes
 from dasovbot.dashboard.auth import auth_middleware, login_page, login_post, logout, get_password
-from dasovbot.dashboard.views import index, videos, ignored, retry_ignored, remove_ignored, remove_intent, force_populate, subscriptions, remove_subscription, system
+from dasovbot.dashboard.control import CONTROL_PREFIX, LocalControl, RemoteControl, handle_control, proxy
+from dasovbot.dashboard.replica import ReplicaState, replica_middleware
+from dasovbot.constants import WEBHOOK_PATH
+from dasovbot.dashboard.views import index, videos, ignored, retry_ignored, remove_ignored, remove_intent, force_populate, subscriptions, remove_subscription, system, metrics, traces, events, telegram_webhook
+from dasovbot.dashboard.views import (
+    profile, profile_cpu_start, profile_cpu_stop, profile_cpu_download, profile_tasks,
+    profile_memory_start, profile_memory_stop, profile_memory_download,
+)
 
 if TYPE_CHECKING:
+    from dasovbot.config import Config
     from dasovbot.state import BotState
 
 logger = logging.getLogger(__name__)
@@ -33,12 +44,54 @@ def format_duration(seconds: int) -> str:
     return f'0:{s:02d}'
 
 
-def create_app(state: BotState) -> web.Application:
-    app = web.Application(middlewares=[auth_middleware])
+def format_seconds(seconds: float | None) -> str:
+    if seconds is None:
+        return ''
+    if seconds < 10:
+        return f'{seconds:.2f}s'
+    if seconds < 60:
+        return f'{seconds:.1f}s'
+    return format_duration(int(seconds))
+
+
+def format_megabytes(size: int | None) -> str:
+    if size is None:
+        return ''
+    if size >= 10 << 30:
+        return f'{size / (1 << 30):.0f} GB'
+    if size >= 1 << 30:
+        return f'{size / (1 << 30):.1f} GB'
+    return f'{size >> 20} MB'
+
+
+# pages that read the bot's own process rather than its data; a separate dashboard process proxies them
+PROCESS_ROUTES = [
+    ('GET', '/metrics', metrics),
+    ('GET', '/events', events),
+    ('GET', '/profile', profile),
+    ('POST', '/profile/cpu/start', profile_cpu_start),
+    ('POST', '/profile/cpu/stop', profile_cpu_stop),
+    ('GET', r'/profile/cpu.{ext:prof|txt}', profile_cpu_download),
+    ('GET', '/profile/tasks.txt', profile_tasks),
+    ('POST', '/profile/memory/start', profile_memory_start),
+    ('POST', '/profile/memory/stop', profile_memory_stop),
+    ('GET', '/profile/memory.txt', profile_memory_download),
+    ('POST', WEBHOOK_PATH, telegram_webhook),
+]
+
+
+def create_app(state: BotState, control: RemoteControl | None = None, auth: bool = True) -> web.Application:
+    middlewares = [auth_middleware] if auth else []
+    if isinstance(state, ReplicaState):
+        middlewares.append(replica_middleware)
+    app = web.Application(middlewares=middlewares)
     app['state'] = state
+    app['control'] = control or LocalControl(state)
 
     env = aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(str(TEMPLATES_DIR)))
     env.filters['duration'] = format_duration
+    env.filters['megabytes'] = format_megabytes
+    env.filters['seconds'] = format_seconds
 
     app.router.add_static('/static', STATIC_DIR, name='static')
     app.router.add_get('/login', login_page)
@@ -54,19 +107,62 @@ def create_app(state: BotState) -> web.Application:
     app.router.add_post('/subscriptions/remove', remove_subscription)
     app.router.add_post('/system/populate', force_populate)
     app.router.add_get('/system', system)
+    add_api_routes(app)
+    app.router.add_get('/traces', traces)
+    remote = isinstance(control, RemoteControl)
+    for method, path, handler in PROCESS_ROUTES:
+        app.router.add_route(method, path, proxy if remote else handler)
 
     return app
 
 
+# served on a unix socket only reachable from this host, so it skips the session check
+def create_control_app(state: BotState) -> web.Application:
+    app = create_app(state, auth=False)
+    app.router.add_post(f'{CONTROL_PREFIX}/{{name}}', handle_control)
+    return app
+
+
 async def start_dashboard(state: BotState):
+    if state.config.dashboard_mode == 'process':
+        await start_control_server(state)
+        return
+    await serve_dashboard(create_app(state))
+
+
+async def serve_dashboard(app: web.Application) -> web.AppRunner:
     if not os.getenv('DASHBOARD_PASSWORD'):
         password = get_password()
         logger.info('DASHBOARD_PASSWORD not set, generated password: %s', password)
 
     port = int(os.getenv('DASHBOARD_PORT', '8080'))
-    app = create_app(state)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
     logger.info('Dashboard started on port %d', port)
+    return runner
+
+
+async def start_control_server(state: BotState):
+    path = state.config.control_socket
+    with suppress(FileNotFoundError):
+        os.unlink(path)
+    runner = web.AppRunner(create_control_app(state))
+    await runner.setup()
+    site = web.UnixSite(runner, path)
+    await site.start()
+    os.chmod(path, 0o600)
+    logger.info('Dashboard control channel listening on %s', path)
+
+
+async def run_dashboard_process(config: Config):
+    state = await ReplicaState.open(config)
+    control = RemoteControl(config.control_socket)
+    runner = await serve_dashboard(create_app(state, control))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await control.close()
+        await state.db.close()
@@ -0,0 +1,93 @@
+// Patches dashboard pages in place from the /events stream.
+// Pages set window.live = {intent: fn, intent_removed: fn, done: fn, failed: fn} before loading this file.
+(function () {
+    var handlers = window.live || {};
+    var source = new EventSource('/events');
+
+    function patch(data) {
+        document.querySelectorAll('[data-live]').forEach(function (el) {
+            var value = data[el.dataset.live];
+            if (value !== undefined && value !== null) {
+                el.textContent = value;
+            }
+        });
+    }
+
+    ['counts', 'system'].forEach(function (type) {
+        source.addEventListener(type, function (e) {
+            patch(JSON.parse(e.data));
+        });
+    });
+
+    source.addEventListener('task', function (e) {
+        var data = JSON.parse(e.data);
+        document.querySelectorAll('[data-task="' + data.name + '"]').forEach(function (el) {
+            el.textContent = data.last_run;
+        });
+        document.querySelectorAll('[data-task-relative="' + data.name + '"]').forEach(function (el) {
+            el.textContent = '0s ago';
+        });
+    });
+
+    ['intent', 'intent_removed', 'done', 'failed'].forEach(function (type) {
+        source.addEventListener(type, function (e) {
+            if (handlers[type]) {
+                handlers[type](JSON.parse(e.data));
+            }
+        });
+    });
+
+    // the server lost track of what this page has seen, so start over
+    source.addEventListener('reload', function () {
+        source.close();
+        location.reload();
+    });
+
+    window.liveRows = {
+        find: function (tbody, url) {
+            var rows = tbody.querySelectorAll('tr[data-url]');
+            for (var i = 0; i < rows.length; i++) {
+                if (rows[i].dataset.url === url) {
+                    return rows[i];
+                }
+            }
+            return null;
+        },
+        create: function (templateId) {
+            return document.getElementById(templateId).content.firstElementChild.cloneNode(true);
+        },
+        remove: function (tbody, url) {
+            var row = this.find(tbody, url);
+            if (row) {
+                row.remove();
+            }
+            this.toggleEmpty(tbody);
+        },
+        toggleEmpty: function (tbody) {
+            var empty = tbody.querySelector('tr.empty');
+            var count = tbody.querySelectorAll('tr[data-url]').length;
+            if (empty) {
+                empty.style.display = count ? 'none' : '';
+            }
+            return count;
+        },
+        setLink: function (link, url) {
+            link.href = url;
+            link.textContent = url.length > 60 ? url.slice(0, 60) + '...' : url;
+        },
+        setBadge: function (cell, source) {
+            cell.textContent = '';
+            if (source) {
+                var badge = document.createElement('span');
+                badge.className = 'badge badge-' + source;
+                badge.textContent = source;
+                cell.appendChild(badge);
+            }
+        },
+        setInputs: function (row, url) {
+            row.querySelectorAll('input[name="url"]').forEach(function (input) {
+                input.value = url;
+            });
+        }
+    };
+})();
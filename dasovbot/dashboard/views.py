@@ -1,6 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import secrets
+import time
+from collections import Counter
 from datetime import datetime
 from typing import TYPE_CHECKING
 
@@ -8,10 +12,20 @@ import aiohttp_jinja2
 from aiohttp import web
 
 from dasovbot.constants import DATETIME_FORMAT
-from dasovbot.services.background import run_populate_subscriptions
+from dasovbot.events import EVENT_SYSTEM, Event, intent_event
+from dasovbot.loop_monitor import get_loop_monitor
+from dasovbot.media_budget import get_media_budget
+from dasovbot.profiling import MAX_PROFILE_SECONDS, dump_tasks, get_profiler
+from dasovbot.metrics import (
+    INTENT_QUEUE_DEPTH, MEDIA_BYTES, PIPELINE_ACTIVE, PIPELINE_QUEUE_DEPTH, REGISTRY, TRANSCODE_QUEUED,
+)
 from dasovbot.services.intent_processor import filter_intents
+from dasovbot.services.pipeline import STAGES, get_pipeline
+from dasovbot.tracing import latency_breakdown, slowest_traces, trace_durations
+from dasovbot.transcoder import get_transcoder
 
 if TYPE_CHECKING:
+    from dasovbot.dashboard.control import LocalControl, RemoteControl
     from dasovbot.state import BotState
 
 
@@ -19,6 +33,37 @@ def get_state(request: web.Request) -> BotState:
     return request.app['state']
 
 
+def get_control(request: web.Request) -> LocalControl | RemoteControl:
+    from dasovbot.dashboard.control import LocalControl
+    return request.app.get('control') or LocalControl(get_state(request))
+
+
+# distinguishes ETags of this process from those handed out before a restart
+INSTANCE = secrets.token_hex(4)
+
+
+def make_etag(request: web.Request, state: BotState, *collections: str) -> str:
+    version = '.'.join(str(state.versions[collection]) for collection in collections)
+    query = hashlib.sha1(request.query_string.encode()).hexdigest()[:12]
+    return f'"{INSTANCE}-{version}-{query}"'
+
+
+def not_modified(request: web.Request, etag: str) -> bool:
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag in tags or '*' in tags
+
+
+# answers 304 before anything is rendered
+def check_etag(request: web.Request, state: BotState, *collections: str) -> str:
+    etag = make_etag(request, state, *collections)
+    if not_modified(request, etag):
+        raise web.HTTPNotModified(headers={'ETag': etag})
+    return etag
+
+
 def parse_timestamp(ts: str | None) -> datetime | None:
     if not ts:
         return None
@@ -50,38 +95,23 @@ async def index(request: web.Request) -> web.Response:
     state = get_state(request)
 
     filtered = filter_intents(state.intents)
-    intents = []
-    for url, intent in sorted(filtered.items(), key=lambda x: x[1].priority, reverse=True):
-        video = state.videos.get(url)
-        intents.append({
-            'url': url,
-            'title': intent.title or (video.title if video else ''),
-            'upload_date': intent.upload_date or (video.upload_date or '' if video else ''),
-            'priority': intent.priority,
-            'chat_ids_count': len(intent.chat_ids),
-            'inline_msg_ids_count': len(intent.inline_message_ids),
-            'messages_count': len(intent.messages),
-            'source': intent.source or '',
-        })
+    intents = [
+        intent_event(url, intent, state.videos.get(url))
+        for url, intent in sorted(filtered.items(), key=lambda x: x[1].priority, reverse=True)
+    ]
 
     context = {
         'video_count': len(state.videos),
         'subscription_count': len(state.subscriptions),
         'intent_count': len(filtered),
         'user_count': len(state.users),
+        'queue_size': await get_control(request).call('queue_size'),
         'intents': intents,
     }
     return aiohttp_jinja2.render_template('index.html', request, context)
 
 
-async def videos(request: web.Request) -> web.Response:
-    state = get_state(request)
-    sort_by = request.query.get('sort', 'processed_at')
-    source_filter = request.query.get('source', 'all')
-    page = max(1, int(request.query.get('page', '1')))
-    per_page = 50
-    search_query = request.query.get('q', '').strip()
-
+def query_videos(state: BotState, source_filter: str = 'all', search_query: str = '') -> list[dict]:
     items = []
     q_lower = search_query.lower()
     for url, info in state.videos.items():
@@ -111,7 +141,19 @@ async def videos(request: web.Request) -> web.Response:
             'source': info.source or '',
             'duration': info.duration,
         })
+    return items
+
 
+async def videos(request: web.Request) -> web.Response:
+    state = get_state(request)
+    etag = check_etag(request, state, 'videos')
+    sort_by = request.query.get('sort', 'processed_at')
+    source_filter = request.query.get('source', 'all')
+    page = max(1, int(request.query.get('page', '1')))
+    per_page = 50
+    search_query = request.query.get('q', '').strip()
+
+    items = query_videos(state, source_filter, search_query)
     if sort_by == 'upload_date':
         items.sort(key=lambda x: x['upload_date'], reverse=True)
     else:
@@ -131,7 +173,44 @@ async def videos(request: web.Request) -> web.Response:
         'total_items': total_items,
         'search_query': search_query,
     }
-    return aiohttp_jinja2.render_template('videos.html', request, context)
+    response = aiohttp_jinja2.render_template('videos.html', request, context)
+    response.headers.update({'ETag': etag, 'Cache-Control': 'no-cache'})
+    return response
+
+
+TRACE_WINDOWS = {'1h': 3600, '24h': 86400, '7d': 7 * 86400}
+
+
+async def traces(request: web.Request) -> web.Response:
+    from dasovbot.database import load_traces
+    state = get_state(request)
+    window = request.query.get('window', '24h')
+    if window not in TRACE_WINDOWS:
+        window = '24h'
+    items = await load_traces(state.db, time.time() - TRACE_WINDOWS[window])
+    slowest = [
+        {
+            'query': trace.query,
+            'finished': datetime.fromtimestamp(trace.finished).strftime(DATETIME_FORMAT),
+            'source': trace.source or '',
+            'outcome': trace.outcome,
+            'size': trace.size,
+            'format': trace.format or '',
+            'total': trace.total,
+            'durations': {stage: duration for stage, duration in trace_durations(trace).items() if stage != 'total'},
+        }
+        for trace in slowest_traces(items)
+    ]
+    context = {
+        'window': window,
+        'windows': list(TRACE_WINDOWS),
+        'trace_count': len(items),
+        'outcomes': sorted(Counter(trace.outcome for trace in items).items()),
+        'breakdown': latency_breakdown(items, STAGES),
+        'slowest': slowest,
+        'retention_days': state.config.trace_retention_days,
+    }
+    return aiohttp_jinja2.render_template('traces.html', request, context)
 
 
 async def ignored(request: web.Request) -> web.Response:
@@ -147,67 +226,37 @@ async def ignored(request: web.Request) -> web.Response:
                 'source': intent.source or '',
                 'type': 'intent',
             })
-    for url, tiq in state.temporary_inline_queries.items():
-        if tiq.ignored:
-            title = url
-            for result in tiq.results:
-                if hasattr(result, 'title') and result.title:
-                    title = result.title
-                    break
-            items.append({
-                'url': url,
-                'title': title,
-                'source': 'inline',
-                'type': 'inline',
-            })
+    items.extend(await get_control(request).call('ignored_inline'))
 
     return aiohttp_jinja2.render_template('ignored.html', request, {'items': items})
 
 
 async def retry_ignored(request: web.Request) -> web.Response:
-    state = get_state(request)
     data = await request.post()
     url = data.get('url', '')
-    item_type = data.get('type', '')
-
     if url:
-        if item_type == 'intent' and url in state.intents:
-            state.intents[url].ignored = False
-            await state.save_intent(url)
-            state.download_queue.put_nowait(url)
-        elif item_type == 'inline' and url in state.temporary_inline_queries:
-            state.temporary_inline_queries[url].ignored = False
-
+        await get_control(request).call('retry_ignored', url=url, type=data.get('type', ''))
     raise web.HTTPFound('/ignored')
 
 
 async def remove_ignored(request: web.Request) -> web.Response:
-    state = get_state(request)
     data = await request.post()
     url = data.get('url', '')
-    item_type = data.get('type', '')
-
     if url:
-        if item_type == 'intent':
-            await state.pop_intent(url)
-        elif item_type == 'inline':
-            state.temporary_inline_queries.pop(url, None)
-
+        await get_control(request).call('remove_ignored', url=url, type=data.get('type', ''))
     raise web.HTTPFound('/ignored')
 
 
 async def remove_intent(request: web.Request) -> web.Response:
-    state = get_state(request)
     data = await request.post()
     url = data.get('url', '')
     if url:
-        await state.pop_intent(url)
+        await get_control(request).call('remove_intent', url=url)
     raise web.HTTPFound('/')
 
 
 async def force_populate(request: web.Request) -> web.Response:
-    state = get_state(request)
-    asyncio.create_task(run_populate_subscriptions(state))
+    await get_control(request).call('populate')
     referer = request.headers.get('Referer', '')
     redirect = '/' if referer.endswith('/') else '/system'
     raise web.HTTPFound(redirect)
@@ -220,31 +269,33 @@ USER_COLORS = [
 ]
 
 
-async def subscriptions(request: web.Request) -> web.Response:
-    state = get_state(request)
-
-    all_chat_ids = sorted({cid for sub in state.subscriptions.values() for cid in sub.chat_ids})
-    color_map = {cid: USER_COLORS[i % len(USER_COLORS)] for i, cid in enumerate(all_chat_ids)}
+def user_label(state: BotState, chat_id: str) -> str:
+    user_data = state.users.get(chat_id, {})
+    label = ' '.join(part for part in [user_data.get('first_name', ''), user_data.get('last_name', '')] if part)
+    return f'{label} ({chat_id})' if label else chat_id
 
-    users = []
-    for cid in all_chat_ids:
-        user_data = state.users.get(cid, {})
-        parts = [p for p in [user_data.get('first_name', ''), user_data.get('last_name', '')] if p]
-        label = ' '.join(parts)
-        if label:
-            label = f'{label} ({cid})'
-        else:
-            label = cid
-        users.append({'id': cid, 'color': color_map[cid], 'label': label})
 
-    items = []
-    for url, sub in sorted(state.subscriptions.items(), key=lambda x: x[1].title.lower()):
-        items.append({
+def query_subscriptions(state: BotState) -> list[dict]:
+    return [
+        {
             'url': url,
             'title': sub.title or sub.uploader or url,
             'uploader': sub.uploader,
             'chat_ids': sub.chat_ids,
-        })
+        }
+        for url, sub in sorted(state.subscriptions.items(), key=lambda x: x[1].title.lower())
+    ]
+
+
+async def subscriptions(request: web.Request) -> web.Response:
+    state = get_state(request)
+    etag = check_etag(request, state, 'subscriptions', 'users')
+
+    all_chat_ids = sorted({cid for sub in state.subscriptions.values() for cid in sub.chat_ids})
+    color_map = {cid: USER_COLORS[i % len(USER_COLORS)] for i, cid in enumerate(all_chat_ids)}
+
+    users = [{'id': cid, 'color': color_map[cid], 'label': user_label(state, cid)} for cid in all_chat_ids]
+    items = query_subscriptions(state)
 
     user_labels = {u['id']: u['label'] for u in users}
 
@@ -254,24 +305,21 @@ async def subscriptions(request: web.Request) -> web.Response:
         'color_map': color_map,
         'user_labels': user_labels,
     }
-    return aiohttp_jinja2.render_template('subscriptions.html', request, context)
+    response = aiohttp_jinja2.render_template('subscriptions.html', request, context)
+    response.headers.update({'ETag': etag, 'Cache-Control': 'no-cache'})
+    return response
 
 
 async def remove_subscription(request: web.Request) -> web.Response:
-    state = get_state(request)
     data = await request.post()
     url = data.get('url', '')
-    chat_id = data.get('chat_id', '')
     if url:
-        if chat_id:
-            await state.remove_subscriber(url, chat_id)
-        else:
-            await state.pop_subscription(url)
+        await get_control(request).call('remove_subscription', url=url, chat_id=data.get('chat_id', ''))
     raise web.HTTPFound('/subscriptions')
 
 
 async def system(request: web.Request) -> web.Response:
-    state = get_state(request)
+    status = await get_control(request).call('status')
 
     tasks = [
         {'name': 'populate_subscriptions', 'description': 'Checks subscriptions for new videos', 'interval': '1 hour'},
@@ -279,18 +327,165 @@ async def system(request: web.Request) -> web.Response:
         {'name': 'monitor_process_intents', 'description': 'Processes download queue', 'interval': 'continuous'},
     ]
     for task in tasks:
-        last_run = state.background_task_status.get(task['name'], '')
+        last_run = status['tasks'].get(task['name'], '')
         task['last_run'] = last_run
         task['last_run_relative'] = relative_time(last_run)
 
-    context = {
-        'tasks': tasks,
+    context = {**status, 'tasks': tasks}
+    return aiohttp_jinja2.render_template('system.html', request, context)
+
+
+SYSTEM_EVENT_INTERVAL = 5
+
+
+# cheap counters for live pages; nothing here walks the intent or video collections
+def system_snapshot(state: BotState) -> dict:
+    from dasovbot.dashboard.server import format_seconds
+    snapshot = {
+        'queue_size': state.download_queue.qsize(),
         'video_count': len(state.videos),
         'subscription_count': len(state.subscriptions),
         'user_count': len(state.users),
         'intent_count': len(state.intents),
         'tiq_count': len(state.temporary_inline_queries),
-        'queue_size': state.download_queue.qsize(),
-        'migration': state.migration_progress,
+        'transcoder_queued': get_transcoder().queued,
+        'loop_lag': format_seconds(get_loop_monitor().last_lag),
     }
-    return aiohttp_jinja2.render_template('system.html', request, context)
+    pipeline = get_pipeline()
+    if pipeline:
+        for stage in pipeline.stats()['stages']:
+            snapshot[f'stage_{stage["name"]}_active'] = stage['active']
+            snapshot[f'stage_{stage["name"]}_queued'] = stage['queued']
+        snapshot['pipeline_completed'] = pipeline.completed
+        snapshot['pipeline_dropped'] = pipeline.dropped
+    return snapshot
+
+
+async def events(request: web.Request) -> web.StreamResponse:
+    state = get_state(request)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_id = None
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    queue = state.events.subscribe(last_id)
+    next_snapshot = 0.0
+    try:
+        while True:
+            timeout = next_snapshot - time.monotonic()
+            if timeout <= 0:
+                # doubles as a keep-alive for proxies that drop idle streams
+                await response.write(Event(type=EVENT_SYSTEM, data=system_snapshot(state)).encode())
+                next_snapshot = time.monotonic() + SYSTEM_EVENT_INTERVAL
+                continue
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            await response.write(event.encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        state.events.unsubscribe(queue)
+    return response
+
+
+def collect_state_metrics(state: BotState):
+    INTENT_QUEUE_DEPTH.clear()
+    for source, count in Counter(intent.source or 'unknown' for intent in filter_intents(state.intents).values()).items():
+        INTENT_QUEUE_DEPTH.set(count, source=source)
+    pipeline = get_pipeline()
+    if pipeline:
+        for stage in pipeline.stats()['stages']:
+            PIPELINE_QUEUE_DEPTH.set(stage['queued'], stage=stage['name'])
+            PIPELINE_ACTIVE.set(stage['active'], stage=stage['name'])
+    TRANSCODE_QUEUED.set(get_transcoder().queued)
+    media = get_media_budget().stats()
+    MEDIA_BYTES.set(media['used'], kind='used')
+    MEDIA_BYTES.set(media['reserved'], kind='reserved')
+    if media['free'] is not None:
+        MEDIA_BYTES.set(media['free'], kind='free')
+
+
+async def telegram_webhook(request: web.Request) -> web.Response:
+    from dasovbot.webhook import get_webhook
+    receiver = get_webhook()
+    if receiver is None:
+        raise web.HTTPNotFound()
+    return await receiver.handle(request)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    collect_state_metrics(get_state(request))
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+
+def download(body: str | bytes, filename: str, content_type: str = 'text/plain') -> web.Response:
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if isinstance(body, str):
+        return web.Response(text=body, content_type=content_type, charset='utf-8', headers=headers)
+    return web.Response(body=body, content_type=content_type, headers=headers)
+
+
+def download_name(kind: str, ext: str) -> str:
+    return f'dasovbot-{kind}-{datetime.now().strftime(DATETIME_FORMAT)}.{ext}'
+
+
+async def profile(request: web.Request) -> web.Response:
+    context = {
+        'profiler': get_profiler().stats(),
+        'error': request.query.get('error', ''),
+        'task_count': len(asyncio.all_tasks()),
+    }
+    return aiohttp_jinja2.render_template('profile.html', request, context)
+
+
+async def profile_cpu_start(request: web.Request) -> web.Response:
+    data = await request.post()
+    try:
+        seconds = int(data.get('seconds') or 30)
+    except ValueError:
+        seconds = 30
+    if not get_profiler().start(min(seconds, MAX_PROFILE_SECONDS)):
+        raise web.HTTPFound('/profile?error=busy')
+    raise web.HTTPFound('/profile')
+
+
+async def profile_cpu_stop(request: web.Request) -> web.Response:
+    get_profiler().stop()
+    raise web.HTTPFound('/profile')
+
+
+async def profile_cpu_download(request: web.Request) -> web.Response:
+    result = get_profiler().result
+    if result is None:
+        raise web.HTTPNotFound(text='No profile recorded yet')
+    if request.match_info['ext'] == 'prof':
+        return download(result.stats, download_name('cpu', 'prof'), 'application/octet-stream')
+    return download(result.text, download_name('cpu', 'txt'))
+
+
+async def profile_tasks(request: web.Request) -> web.Response:
+    return download(dump_tasks(), download_name('tasks', 'txt'))
+
+
+async def profile_memory_start(request: web.Request) -> web.Response:
+    get_profiler().start_memory()
+    raise web.HTTPFound('/profile')
+
+
+async def profile_memory_stop(request: web.Request) -> web.Response:
+    get_profiler().stop_memory()
+    raise web.HTTPFound('/profile')
+
+
+async def profile_memory_download(request: web.Request) -> web.Response:
+    text = get_profiler().snapshot_memory()
+    if text is None:
+        raise web.HTTPConflict(text='tracemalloc is not running')
+    return download(text, download_name('memory', 'txt'))
@@ -6,7 +6,8 @@ import time
 import aiosqlite
 
 from dasovbot.config import Config
-from dasovbot.models import VideoInfo, Intent, Subscription
+from dasovbot.metrics import DB_WRITE_SECONDS
+from dasovbot.models import VideoInfo, Intent, IntentTrace, Subscription
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +18,9 @@ CREATE TABLE IF NOT EXISTS videos (
 );
 CREATE TABLE IF NOT EXISTS intents (
     key TEXT PRIMARY KEY,
-    data TEXT NOT NULL
+    data TEXT NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0
 );
 CREATE TABLE IF NOT EXISTS users (
     chat_id TEXT PRIMARY KEY,
@@ -27,17 +30,55 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     key TEXT PRIMARY KEY,
     data TEXT NOT NULL
 );
+CREATE TABLE IF NOT EXISTS traces (
+    id INTEGER PRIMARY KEY,
+    finished REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traces_finished ON traces (finished);
 """
 
+# columns added after the first release; databases created before them get them via ALTER TABLE
+ADDED_COLUMNS = {
+    'intents': {
+        'lease_owner': 'TEXT',
+        'lease_expires': 'REAL NOT NULL DEFAULT 0',
+    },
+}
+
 
 async def init_db(db_path: str) -> aiosqlite.Connection:
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     db = await aiosqlite.connect(db_path)
+    # WAL lets a dashboard process read while the bot writes
+    await db.execute("PRAGMA journal_mode=WAL")
     await db.executescript(SCHEMA)
+    await migrate_schema(db)
     await db.commit()
     return db
 
 
+async def migrate_schema(db: aiosqlite.Connection):
+    for table, columns in ADDED_COLUMNS.items():
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in await cursor.fetchall()}
+        for name, declaration in columns.items():
+            if name not in existing:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+                logger.info("Schema: added %s.%s", table, name)
+
+
+async def open_readonly(db_path: str) -> aiosqlite.Connection:
+    return await aiosqlite.connect(f'file:{db_path}?mode=ro', uri=True)
+
+
+async def data_version(db: aiosqlite.Connection) -> int:
+    # changes whenever another connection commits to the database
+    cursor = await db.execute("PRAGMA data_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
 async def migrate_from_json(db: aiosqlite.Connection, config: Config, progress: dict | None = None):
     cursor = await db.execute("SELECT COUNT(*) FROM videos")
     row = await cursor.fetchone()
@@ -117,19 +158,24 @@ async def migrate_from_json(db: aiosqlite.Connection, config: Config, progress:
         progress['status'] = 'completed' if migrated else 'skipped'
 
 
+async def _write(db: aiosqlite.Connection, table: str, sql: str, params: tuple):
+    with DB_WRITE_SECONDS.time(table=table):
+        await db.execute(sql, params)
+        await db.commit()
+
+
 # --- Videos ---
 
 async def upsert_video(db: aiosqlite.Connection, key: str, video: VideoInfo):
-    await db.execute(
+    await _write(
+        db, 'videos',
         "INSERT OR REPLACE INTO videos (key, data) VALUES (?, ?)",
         (key, json.dumps(video.to_dict())),
     )
-    await db.commit()
 
 
 async def delete_video(db: aiosqlite.Connection, key: str):
-    await db.execute("DELETE FROM videos WHERE key = ?", (key,))
-    await db.commit()
+    await _write(db, 'videos', "DELETE FROM videos WHERE key = ?", (key,))
 
 
 async def load_videos(db: aiosqlite.Connection) -> dict[str, VideoInfo]:
@@ -138,19 +184,33 @@ async def load_videos(db: aiosqlite.Connection) -> dict[str, VideoInfo]:
     return {key: VideoInfo.from_dict(json.loads(data)) for key, data in rows}
 
 
+async def load_videos_since(db: aiosqlite.Connection, rowid: int) -> tuple[dict[str, VideoInfo], int]:
+    # INSERT OR REPLACE gives a rewritten row a new rowid, so rewrites show up as well
+    cursor = await db.execute("SELECT rowid, key, data FROM videos WHERE rowid > ? ORDER BY rowid", (rowid,))
+    rows = await cursor.fetchall()
+    videos = {key: VideoInfo.from_dict(json.loads(data)) for _, key, data in rows}
+    return videos, rows[-1][0] if rows else rowid
+
+
+async def max_video_rowid(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute("SELECT COALESCE(MAX(rowid), 0) FROM videos")
+    row = await cursor.fetchone()
+    return row[0]
+
+
 # --- Intents ---
 
 async def upsert_intent(db: aiosqlite.Connection, key: str, intent: Intent):
-    await db.execute(
-        "INSERT OR REPLACE INTO intents (key, data) VALUES (?, ?)",
+    # an update keeps the lease of a worker that is processing the intent
+    await _write(
+        db, 'intents',
+        "INSERT INTO intents (key, data) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET data = excluded.data",
         (key, json.dumps(intent.to_dict())),
     )
-    await db.commit()
 
 
 async def delete_intent(db: aiosqlite.Connection, key: str):
-    await db.execute("DELETE FROM intents WHERE key = ?", (key,))
-    await db.commit()
+    await _write(db, 'intents', "DELETE FROM intents WHERE key = ?", (key,))
 
 
 async def load_intents(db: aiosqlite.Connection) -> dict[str, Intent]:
@@ -159,14 +219,130 @@ async def load_intents(db: aiosqlite.Connection) -> dict[str, Intent]:
     return {key: Intent.from_dict(json.loads(data)) for key, data in rows}
 
 
+async def load_intent(db: aiosqlite.Connection, key: str) -> Intent | None:
+    cursor = await db.execute("SELECT data FROM intents WHERE key = ?", (key,))
+    row = await cursor.fetchone()
+    return Intent.from_dict(json.loads(row[0])) if row else None
+
+
+async def merge_intent_requesters(db: aiosqlite.Connection, key: str, intent: Intent) -> bool:
+    # the front process's fields only; download progress and ignored belong to the worker
+    with DB_WRITE_SECONDS.time(table='intents'):
+        cursor = await db.execute(
+            """
+            UPDATE intents SET data = json_set(
+                data,
+                '$.chat_ids', json(?),
+                '$.inline_message_ids', json(?),
+                '$.messages', json(?),
+                '$.priority', ?,
+                '$.speculative', json(?),
+                '$.source', ?,
+                '$.title', ?,
+                '$.upload_date', ?
+            )
+            WHERE key = ?
+            """,
+            (
+                json.dumps(intent.chat_ids), json.dumps(intent.inline_message_ids),
+                json.dumps([m.to_dict() for m in intent.messages]), intent.priority, json.dumps(intent.speculative),
+                intent.source, intent.title, intent.upload_date, key,
+            ),
+        )
+        updated = cursor.rowcount
+        await db.commit()
+    return updated > 0
+
+
+async def delete_unleased_intent(db: aiosqlite.Connection, key: str) -> bool:
+    # an intent a worker is processing stays until the worker completes it
+    with DB_WRITE_SECONDS.time(table='intents'):
+        cursor = await db.execute(
+            "DELETE FROM intents WHERE key = ? AND (lease_owner IS NULL OR lease_expires < ?)", (key, time.time()),
+        )
+        deleted = cursor.rowcount
+        await db.commit()
+    return deleted > 0
+
+
+async def clear_intent_ignored(db: aiosqlite.Connection, key: str):
+    await _write(db, 'intents', "UPDATE intents SET data = json_set(data, '$.ignored', json('false')) WHERE key = ?", (key,))
+
+
+# --- Intent leases ---
+
+async def claim_intent(db: aiosqlite.Connection, owner: str, lease_sec: float, exclude: list[str]) -> tuple[str, Intent] | None:
+    # a single UPDATE ... RETURNING, so two workers can never claim the same intent
+    claimed_at = time.time()
+    with DB_WRITE_SECONDS.time(table='intents'):
+        cursor = await db.execute(
+            """
+            UPDATE intents SET lease_owner = ?, lease_expires = ?
+            WHERE key = (
+                SELECT key FROM intents
+                WHERE (lease_owner IS NULL OR lease_expires < ?)
+                    AND NOT COALESCE(json_extract(data, '$.ignored'), 0)
+                    AND key NOT IN (SELECT value FROM json_each(?))
+                ORDER BY json_extract(data, '$.priority') DESC
+                LIMIT 1
+            )
+            RETURNING key, data
+            """,
+            (owner, claimed_at + lease_sec, claimed_at, json.dumps(exclude)),
+        )
+        row = await cursor.fetchone()
+        await db.commit()
+    return (row[0], Intent.from_dict(json.loads(row[1]))) if row else None
+
+
+async def renew_intent_leases(db: aiosqlite.Connection, owner: str, lease_sec: float, keys: list[str]) -> set[str]:
+    with DB_WRITE_SECONDS.time(table='intents'):
+        cursor = await db.execute(
+            "UPDATE intents SET lease_expires = ? WHERE lease_owner = ? AND key IN (SELECT value FROM json_each(?)) RETURNING key",
+            (time.time() + lease_sec, owner, json.dumps(keys)),
+        )
+        rows = await cursor.fetchall()
+        await db.commit()
+    return {key for key, in rows}
+
+
+async def release_intent(db: aiosqlite.Connection, owner: str, key: str | None = None):
+    sql = "UPDATE intents SET lease_owner = NULL, lease_expires = 0 WHERE lease_owner = ?"
+    params = (owner,)
+    if key is not None:
+        sql += " AND key = ?"
+        params += (key,)
+    await _write(db, 'intents', sql, params)
+
+
+async def complete_intent(db: aiosqlite.Connection, owner: str, key: str) -> Intent | None:
+    # returns the intent as stored, with requesters added since the claim
+    with DB_WRITE_SECONDS.time(table='intents'):
+        cursor = await db.execute(
+            "DELETE FROM intents WHERE key = ? AND lease_owner = ? RETURNING data", (key, owner),
+        )
+        row = await cursor.fetchone()
+        await db.commit()
+    return Intent.from_dict(json.loads(row[0])) if row else None
+
+
+async def save_intent_progress(db: aiosqlite.Connection, owner: str, key: str, intent: Intent):
+    # only the fields a worker owns; requesters and priority belong to the front process
+    await _write(
+        db, 'intents',
+        "UPDATE intents SET data = json_set(data, '$.download', json(?), '$.ignored', json(?)) WHERE key = ? AND lease_owner = ?",
+        (json.dumps(intent.download.to_dict() if intent.download else None), json.dumps(intent.ignored), key, owner),
+    )
+
+
 # --- Users ---
 
 async def upsert_user(db: aiosqlite.Connection, chat_id: str, data: dict):
-    await db.execute(
+    await _write(
+        db, 'users',
         "INSERT OR REPLACE INTO users (chat_id, data) VALUES (?, ?)",
         (chat_id, json.dumps(data)),
     )
-    await db.commit()
 
 
 async def load_users(db: aiosqlite.Connection) -> dict[str, dict]:
@@ -178,19 +354,39 @@ async def load_users(db: aiosqlite.Connection) -> dict[str, dict]:
 # --- Subscriptions ---
 
 async def upsert_subscription(db: aiosqlite.Connection, key: str, sub: Subscription):
-    await db.execute(
+    await _write(
+        db, 'subscriptions',
         "INSERT OR REPLACE INTO subscriptions (key, data) VALUES (?, ?)",
         (key, json.dumps(sub.to_dict())),
     )
-    await db.commit()
 
 
 async def delete_subscription(db: aiosqlite.Connection, key: str):
-    await db.execute("DELETE FROM subscriptions WHERE key = ?", (key,))
-    await db.commit()
+    await _write(db, 'subscriptions', "DELETE FROM subscriptions WHERE key = ?", (key,))
 
 
 async def load_subscriptions(db: aiosqlite.Connection) -> dict[str, Subscription]:
     cursor = await db.execute("SELECT key, data FROM subscriptions")
     rows = await cursor.fetchall()
     return {key: Subscription.from_dict(json.loads(data)) for key, data in rows}
+
+
+# --- Traces ---
+
+async def insert_trace(db: aiosqlite.Connection, trace: IntentTrace, retention_sec: float):
+    with DB_WRITE_SECONDS.time(table='traces'):
+        await db.execute(
+            "INSERT INTO traces (finished, data) VALUES (?, ?)",
+            (trace.finished, json.dumps(trace.to_dict(), separators=(',', ':'))),
+        )
+        await db.execute("DELETE FROM traces WHERE finished < ?", (trace.finished - retention_sec,))
+        await db.commit()
+
+
+async def load_traces(db: aiosqlite.Connection, since: float, limit: int = 10000) -> list[IntentTrace]:
+    cursor = await db.execute(
+        "SELECT data FROM traces WHERE finished >= ? ORDER BY finished DESC LIMIT ?",
+        (since, limit),
+    )
+    rows = await cursor.fetchall()
+    return [IntentTrace.from_dict(json.loads(data)) for data, in rows]
@@ -1,19 +1,30 @@
 from __future__ import annotations
 
 import asyncio
+import glob
+import json
 import logging
+import math
 import os
 import re
 import subprocess
+import threading
+import time
+from dataclasses import replace
 from datetime import datetime
 from functools import partial
-from typing import TYPE_CHECKING
+from http.client import IncompleteRead
+from typing import TYPE_CHECKING, Awaitable, Callable
 
 import yt_dlp
+from yt_dlp.networking.exceptions import RequestError
+from yt_dlp.utils import ContentTooShortError, DownloadCancelled
 
-from dasovbot.config import Config, make_ydl_opts
-from dasovbot.constants import DATETIME_FORMAT, TIMEOUT_SEC, VIDEO_ERROR_MESSAGES
-from dasovbot.models import VideoInfo
+from dasovbot.config import Config, make_format, make_ydl_opts
+from dasovbot.constants import DATETIME_FORMAT, FORMAT_LADDER, MAX_UPLOAD_SIZE, TIMEOUT_SEC, VIDEO_ERROR_MESSAGES
+from dasovbot.metrics import record_cache, track
+from dasovbot.models import DownloadProgress, VideoInfo
+from dasovbot.transcoder import get_transcoder, transcode_preset
 
 if TYPE_CHECKING:
     from dasovbot.state import BotState
@@ -21,13 +32,20 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 _ydl: yt_dlp.YoutubeDL | None = None
+_ydl_opts: dict = {}
 _lock = asyncio.Lock()
 
+PROGRESS_REPORT_SEC = 5
+STALL_CHECK_SEC = 5
+# failures that leave a resumable .part behind; download_video raises DOWNLOAD_INTERRUPTED for them
+NETWORK_ERRORS = (RequestError, ContentTooShortError, IncompleteRead, ConnectionError, TimeoutError)
+DOWNLOAD_INTERRUPTED = (TimeoutError, ConnectionError)
+
 
 def init_downloader(config: Config):
-    global _ydl
-    ydl_opts = make_ydl_opts(config)
-    _ydl = yt_dlp.YoutubeDL(ydl_opts)
+    global _ydl, _ydl_opts
+    _ydl_opts = make_ydl_opts(config)
+    _ydl = yt_dlp.YoutubeDL(_ydl_opts)
 
 
 def get_ydl() -> yt_dlp.YoutubeDL:
@@ -96,6 +114,7 @@ def process_info(info) -> VideoInfo | None:
         filename=filename,
         format=info.get('format'),
         entries=info.get('entries'),
+        filesize_approx=estimate_media_size(info),
     )
 
 
@@ -128,17 +147,151 @@ def add_scaled_after_title(value: str | dict) -> str | dict:
     return value
 
 
+def estimate_filesize(fmt: dict, duration: float) -> int | None:
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = fmt.get('tbr')
+    if tbr and duration:
+        # tbr is in kbit/s
+        return int(tbr * 125 * duration)
+    return None
+
+
+def _best_format(formats: list[dict], height: int, video: bool, audio: bool, exts: tuple[str, ...]) -> dict | None:
+    candidates = [
+        f for f in formats
+        if f.get('ext') in exts
+        and (f.get('vcodec') not in (None, 'none')) == video
+        and (f.get('acodec') not in (None, 'none')) == audio
+        and (not video or (f.get('height') or 0) <= height)
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+
+
+def estimate_download_size(formats: list[dict], height: int, duration: float) -> int | None:
+    video = _best_format(formats, height, video=True, audio=False, exts=('mp4',))
+    audio = _best_format(formats, height, video=False, audio=True, exts=('m4a', 'mp4'))
+    if video and audio:
+        sizes = [estimate_filesize(video, duration), estimate_filesize(audio, duration)]
+    else:
+        combined = _best_format(formats, height, video=True, audio=True, exts=('mp4',))
+        sizes = [estimate_filesize(combined, duration)] if combined else [None]
+    if None in sizes:
+        return None
+    return sum(sizes)
+
+
+def select_format_height(raw_info: dict, limit: int = MAX_UPLOAD_SIZE) -> int:
+    formats = raw_info.get('formats') or []
+    duration = raw_info.get('duration') or 0
+    for height in FORMAT_LADDER:
+        size = estimate_download_size(formats, height, duration)
+        if size is None or size <= limit:
+            return height
+    return FORMAT_LADDER[-1]
+
+
+def estimate_media_size(raw_info: dict) -> int | None:
+    formats = raw_info.get('formats')
+    if not formats:
+        return None
+    height = select_format_height(raw_info)
+    return estimate_download_size(formats, height, raw_info.get('duration') or 0)
+
+
+def _ydl_for_height(height: int, progress_hooks: list | None = None) -> yt_dlp.YoutubeDL:
+    if (height == FORMAT_LADDER[0] and not progress_hooks) or not _ydl_opts:
+        return _ydl
+    opts = {**_ydl_opts, 'format': make_format(height)}
+    if height != FORMAT_LADDER[0]:
+        opts['outtmpl'] = add_scaled_after_title(opts['outtmpl'])
+    if progress_hooks:
+        opts['progress_hooks'] = progress_hooks
+    return yt_dlp.YoutubeDL(opts)
+
+
+def progress_hook(progress: DownloadProgress, report: Callable[[DownloadProgress], None]) -> Callable[[dict], None]:
+    streams: dict[str, tuple[int, int | None]] = {}
+    formats: list[str] = []
+    last_report = 0.0
+
+    def hook(d: dict):
+        nonlocal last_report
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        streams[d.get('filename') or ''] = (d.get('downloaded_bytes') or total or 0, total)
+        format_id = (d.get('info_dict') or {}).get('format_id')
+        if format_id and format_id not in formats:
+            formats.append(format_id)
+        progress.format = '+'.join(formats) or None
+        progress.downloaded_bytes = sum(downloaded for downloaded, _ in streams.values())
+        totals = [total for _, total in streams.values()]
+        progress.total_bytes = int(sum(totals)) if all(totals) else None
+        now = time.monotonic()
+        if d.get('status') == 'finished' or now - last_report >= PROGRESS_REPORT_SEC:
+            last_report = now
+            report(replace(progress))
+
+    return hook
+
+
+class DownloadWatch:
+    def __init__(self):
+        self.active = time.monotonic()
+        self.stop = threading.Event()
+
+    # yt-dlp only checks for cancellation between chunks, so a stop takes effect at the next progress call
+    def hook(self, d: dict):
+        self.active = time.monotonic()
+        if self.stop.is_set():
+            raise DownloadCancelled('download stopped')
+
+    def stalled(self, timeout: float) -> bool:
+        return time.monotonic() - self.active > timeout
+
+
+def is_network_error(e: BaseException) -> bool:
+    if isinstance(e, yt_dlp.DownloadError) and e.exc_info:
+        e = e.exc_info[1]
+    return isinstance(e, NETWORK_ERRORS)
+
+
+def _download(query: str, resume: DownloadProgress | None = None,
+              report: Callable[[DownloadProgress], None] | None = None,
+              watch: DownloadWatch | None = None) -> dict:
+    raw_info = _ydl.extract_info(query, download=False)
+    # a resumed download keeps its ladder rung so yt-dlp continues the same .part files
+    height = resume.height if resume and resume.height in FORMAT_LADDER else select_format_height(raw_info)
+    if height != FORMAT_LADDER[0]:
+        logger.info("extract_info format ladder: %s height=%d", query, height)
+    hooks = [watch.hook] if watch else []
+    if not report:
+        return _ydl_for_height(height, progress_hooks=hooks).process_ie_result(raw_info, download=True)
+    progress = DownloadProgress(path='', height=height)
+    ydl = _ydl_for_height(height, progress_hooks=[*hooks, progress_hook(progress, report)])
+    progress.path = ydl.prepare_filename(raw_info)
+    if resume:
+        logger.info("extract_info resuming: %s %s (%d bytes)", query, resume.path, resume.downloaded_bytes)
+    report(replace(progress))
+    return ydl.process_ie_result(raw_info, download=True)
+
+
 async def extract_info(query: str, download: bool, state: BotState) -> VideoInfo | None:
     info = state.videos.get(query)
     if info and (info.file_id or not download):
+        record_cache('video', True)
         return info
 
     if not info:
         try:
             loop = asyncio.get_running_loop()
-            raw_info = await loop.run_in_executor(None, partial(_ydl.extract_info, query, download=False))
+            with track('extract'):
+                raw_info = await loop.run_in_executor(None, partial(_ydl.extract_info, query, download=False))
             url = extract_url(raw_info)
             info_url = state.videos.get(url)
+            record_cache('video', info_url is not None)
             if info_url:
                 await state.set_video(query, info_url)
                 return info_url
@@ -148,42 +301,143 @@ async def extract_info(query: str, download: bool, state: BotState) -> VideoInfo
                 intent = state.intents.get(query) or state.temporary_inline_queries.get(query)
                 if intent:
                     intent.ignored = True
+                    await state.save_intent(query)
                 return None
             logger.error("extract_info error: %s", query)
 
     needs_download = download and (not info or not info.file_id)
     if needs_download:
         try:
-            async with _lock:
-                logger.debug("lock_acquire")
-                loop = asyncio.get_running_loop()
-                future = loop.run_in_executor(None, partial(_ydl.extract_info, query, download=True))
-                raw_info = await asyncio.wait_for(future, TIMEOUT_SEC)
-                logger.info("extract_info downloaded: %s", query)
-                info = process_info(raw_info)
-        except asyncio.TimeoutError:
-            logger.warning("extract_info timeout: %s", query)
-        except Exception as e:
-            logger.error("extract_info download error: %s", query, exc_info=e)
-        finally:
-            logger.debug("lock_release")
+            info = await download_video(query) or info
+        except DOWNLOAD_INTERRUPTED:
+            pass
 
     return info
 
 
-def _run_ffmpeg(input_path: str, output_path: str, codec_args: list[str]) -> bool:
+async def download_video(query: str, resume: DownloadProgress | None = None,
+                         on_progress: Callable[[DownloadProgress], Awaitable] | None = None) -> VideoInfo | None:
+    loop = asyncio.get_running_loop()
+    report = None
+    if on_progress:
+        def report(progress: DownloadProgress):
+            asyncio.run_coroutine_threadsafe(on_progress(progress), loop)
+    watch = DownloadWatch()
+    try:
+        async with _lock:
+            logger.debug("lock_acquire")
+            with track('download'):
+                future = loop.run_in_executor(None, _download, query, resume, report, watch)
+                try:
+                    # the timeout runs from the last progress, so a long transfer that keeps moving isn't cut off
+                    while not (await asyncio.wait({future}, timeout=STALL_CHECK_SEC))[0]:
+                        if watch.stalled(TIMEOUT_SEC):
+                            watch.stop.set()
+                            # hold the lock until the thread stops writing, so nothing collects its .part under it
+                            await asyncio.wait({future}, timeout=TIMEOUT_SEC)
+                            raise TimeoutError(f'no download progress for {TIMEOUT_SEC} s')
+                finally:
+                    watch.stop.set()
+                raw_info = future.result()
+            logger.info("extract_info downloaded: %s", query)
+            return process_info(raw_info)
+    except Exception as e:
+        if is_network_error(e):
+            logger.warning("extract_info download interrupted: %s %s", query, e)
+            if isinstance(e, DOWNLOAD_INTERRUPTED):
+                raise
+            raise ConnectionError(str(e)) from e
+        logger.error("extract_info download error: %s", query, exc_info=e)
+    finally:
+        logger.debug("lock_release")
+    return None
+
+
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'ac3', 'eac3', 'flac', 'alac'}
+PLAN_NOOP = 'noop'
+PLAN_REMUX = 'remux'
+PLAN_TRANSCODE = 'transcode'
+TRANSCODE_AUDIO_ARGS = ['-c:a', 'aac']
+
+
+def transcode_video_args(duration: int = 0) -> list[str]:
+    return ['-c:v', 'libx264', '-preset', transcode_preset(duration)]
+
+
+def video_metadata(info: VideoInfo) -> dict:
+    metadata = {
+        'title': info.title,
+        'date': info.upload_date,
+        'description': info.description,
+        'comment': info.webpage_url,
+        'purl': info.webpage_url,
+    }
+    return {key: value for key, value in metadata.items() if value}
+
+
+def probe_streams(path: str) -> dict | None:
     try:
         result = subprocess.run(
-            ['ffmpeg', '-y', '-i', input_path, *codec_args, '-movflags', '+faststart', output_path],
-            capture_output=True, timeout=600,
+            ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name', '-of', 'json', path],
+            capture_output=True, timeout=60,
         )
-        return result.returncode == 0 and os.path.exists(output_path) and os.path.getsize(output_path) > 0
-    except (subprocess.TimeoutExpired, OSError):
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        if result.returncode != 0:
+            return None
+        streams = json.loads(result.stdout).get('streams', [])
+    except (subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+    codecs = {}
+    for stream in streams:
+        codecs.setdefault(stream.get('codec_type'), stream.get('codec_name'))
+    return codecs
+
+
+def is_faststart(path: str) -> bool:
+    try:
+        with open(path, 'rb') as file:
+            while True:
+                header = file.read(8)
+                if len(header) < 8:
+                    return False
+                size = int.from_bytes(header[:4], 'big')
+                box = header[4:]
+                if box == b'moov':
+                    return True
+                if box == b'mdat':
+                    return False
+                if size == 1:
+                    size = int.from_bytes(file.read(8), 'big') - 8
+                elif size == 0:
+                    return False
+                file.seek(size - 8, os.SEEK_CUR)
+    except OSError:
         return False
 
 
+def plan_postprocess(path: str, codecs: dict | None, duration: int = 0, metadata: dict | None = None) -> tuple[str, list[str]]:
+    if codecs is None:
+        return PLAN_REMUX, ['-c', 'copy']
+    audio = codecs.get('audio')
+    copy_video = codecs.get('video') in MP4_VIDEO_CODECS
+    copy_audio = not audio or audio in MP4_AUDIO_CODECS
+    if not copy_video or not copy_audio:
+        video_args = ['-c:v', 'copy'] if copy_video else transcode_video_args(duration)
+        audio_args = ['-c:a', 'copy'] if copy_audio else TRANSCODE_AUDIO_ARGS
+        return PLAN_TRANSCODE, video_args + audio_args
+    # tags are only written by ffmpeg, so a faststart mp4 is left alone only when there are none
+    if not metadata and path.lower().endswith('.mp4') and is_faststart(path):
+        return PLAN_NOOP, []
+    return PLAN_REMUX, ['-c', 'copy']
+
+
+def _metadata_args(metadata: dict | None) -> list[str]:
+    args = []
+    for key, value in (metadata or {}).items():
+        args += ['-metadata', f'{key}={value}']
+    return args
+
+
 def _cleanup_original(original: str, new: str):
     try:
         os.remove(original)
@@ -191,25 +445,69 @@ def _cleanup_original(original: str, new: str):
         logger.warning("cleanup_original failed: %s", original)
 
 
-async def convert_to_mp4(filepath: str | None) -> str | None:
-    if not filepath or filepath.lower().endswith('.mp4'):
+async def convert_to_mp4(filepath: str | None, metadata: dict | None = None, duration: int = 0) -> str | None:
+    if not filepath:
         return filepath
 
-    output_path = os.path.splitext(filepath)[0] + '.mp4'
     loop = asyncio.get_running_loop()
+    codecs = await loop.run_in_executor(None, probe_streams, filepath)
+    plan, codec_args = plan_postprocess(filepath, codecs, duration, metadata)
+    if plan == PLAN_NOOP:
+        logger.info("convert_to_mp4 noop: %s", filepath)
+        return filepath
+
+    base = os.path.splitext(filepath)[0]
+    in_place = filepath.lower().endswith('.mp4')
+    final_path = filepath if in_place else base + '.mp4'
+    output_path = base + '.pp.mp4' if in_place else final_path
+    metadata_args = _metadata_args(metadata)
+    transcoder = get_transcoder()
+
+    if await transcoder.run(filepath, output_path, codec_args + metadata_args, duration=duration, kind=plan):
+        logger.info("convert_to_mp4 %s: %s", plan, filepath)
+    else:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        if plan == PLAN_TRANSCODE or not await transcoder.run(
+            filepath, output_path, transcode_video_args(duration) + TRANSCODE_AUDIO_ARGS + metadata_args,
+            duration=duration, kind=PLAN_TRANSCODE,
+        ):
+            logger.warning("convert_to_mp4 failed, using original: %s", filepath)
+            return filepath
+        logger.info("convert_to_mp4 transcoded after failed %s: %s", plan, filepath)
+
+    if in_place:
+        os.replace(output_path, final_path)
+    else:
+        _cleanup_original(filepath, final_path)
+    return final_path
+
+
+SPLIT_MARGIN = 0.9  # keyframe cuts overshoot the segment time
+
+
+def split_segment_time(size: int, duration: int, limit: int = MAX_UPLOAD_SIZE) -> int:
+    count = math.ceil(size / (limit * SPLIT_MARGIN))
+    return max(1, math.ceil(duration / count))
 
-    if await loop.run_in_executor(None, _run_ffmpeg, filepath, output_path, ['-c', 'copy']):
-        logger.info("convert_to_mp4 remuxed: %s", filepath)
-        _cleanup_original(filepath, output_path)
-        return output_path
 
-    if os.path.exists(output_path):
-        os.remove(output_path)
+def split_part_paths(filepath: str) -> list[str]:
+    base = glob.escape(os.path.splitext(filepath)[0])
+    return sorted(glob.glob(f'{base}.part[0-9][0-9][0-9].mp4'))
 
-    if await loop.run_in_executor(None, _run_ffmpeg, filepath, output_path, ['-c:v', 'libx264', '-preset', 'fast', '-c:a', 'aac']):
-        logger.info("convert_to_mp4 transcoded: %s", filepath)
-        _cleanup_original(filepath, output_path)
-        return output_path
 
-    logger.warning("convert_to_mp4 failed, using original: %s", filepath)
-    return filepath
+async def split_video(filepath: str, duration: int, limit: int = MAX_UPLOAD_SIZE) -> list[str]:
+    if not filepath or not duration:
+        return []
+    segment_time = split_segment_time(os.path.getsize(filepath), duration, limit)
+    pattern = os.path.splitext(filepath)[0] + '.part%03d.mp4'
+    args = ['-c', 'copy', '-f', 'segment', '-segment_time', str(segment_time), '-reset_timestamps', '1']
+    ok = await get_transcoder().run(filepath, pattern, args, duration=duration, kind='split', segmented=True)
+    parts = split_part_paths(filepath)
+    if ok and parts and all(os.path.getsize(part) <= limit for part in parts):
+        logger.info("split_video: %s parts=%d segment_time=%d", filepath, len(parts), segment_time)
+        return parts
+    logger.warning("split_video failed: %s", filepath)
+    for part in parts:
+        os.remove(part)
+    return []
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass
+
+from dasovbot.models import Intent, VideoInfo
+
+EVENT_BACKLOG = 256
+SUBSCRIBER_QUEUE = 256
+
+EVENT_INTENT = 'intent'
+EVENT_INTENT_REMOVED = 'intent_removed'
+EVENT_DONE = 'done'
+EVENT_FAILED = 'failed'
+EVENT_COUNTS = 'counts'
+EVENT_TASK = 'task'
+EVENT_SYSTEM = 'system'
+EVENT_RELOAD = 'reload'
+
+
+@dataclass
+class Event:
+    type: str
+    data: dict
+    id: int | None = None
+
+    def encode(self) -> bytes:
+        lines = [] if self.id is None else [f'id: {self.id}']
+        lines.append(f'event: {self.type}')
+        lines.append(f'data: {json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))}')
+        return ('\n'.join(lines) + '\n\n').encode()
+
+
+def intent_event(url: str, intent: Intent, video: VideoInfo | None) -> dict:
+    return {
+        'url': url,
+        'title': intent.title or (video.title if video else ''),
+        'upload_date': intent.upload_date or (video.upload_date or '' if video else ''),
+        'priority': intent.priority,
+        'chat_ids_count': len(intent.chat_ids),
+        'inline_msg_ids_count': len(intent.inline_message_ids),
+        'messages_count': len(intent.messages),
+        'source': intent.source or '',
+        'ignored': intent.ignored,
+        'download': {
+            'downloaded_mb': intent.download.downloaded_bytes >> 20,
+            'total_mb': intent.download.total_bytes >> 20 if intent.download.total_bytes else None,
+        } if intent.download else None,
+    }
+
+
+# payloads are only built and kept while someone is listening; a client resuming past
+# the backlog is told to reload instead of silently missing changes
+class EventBus:
+    def __init__(self, backlog: int = EVENT_BACKLOG, queue_size: int = SUBSCRIBER_QUEUE):
+        self.last_id = 0
+        self.queue_size = queue_size
+        self._backlog: deque[Event] = deque(maxlen=backlog)
+        self._subscribers: set[asyncio.Queue] = set()
+
+    @property
+    def listening(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, type: str, data: dict | None = None):
+        self.last_id += 1
+        if not self._subscribers:
+            return
+        event = Event(type=type, data=data or {}, id=self.last_id)
+        self._backlog.append(event)
+        for queue in self._subscribers:
+            self._put(queue, event)
+
+    def _put(self, queue: asyncio.Queue, event: Event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a stalled client gets a fresh page instead of an unbounded queue
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(Event(type=EVENT_RELOAD, data={}, id=self.last_id))
+
+    def subscribe(self, last_id: int | None = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if last_id is not None and last_id != self.last_id:
+            missed = [event for event in self._backlog if event.id > last_id]
+            if last_id < self.last_id and missed and missed[0].id == last_id + 1:
+                for event in missed:
+                    self._put(queue, event)
+            else:
+                self._put(queue, Event(type=EVENT_RELOAD, data={}, id=self.last_id))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
@@ -0,0 +1,47 @@
+import hashlib
+
+from dasovbot.metrics import record_cache
+from dasovbot.models import VideoInfo
+
+
+def fingerprint_file(filepath: str, duration: int, width: int | None, height: int | None, head_bytes: int) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(filepath, 'rb') as file:
+            digest.update(file.read(head_bytes))
+    except OSError:
+        return None
+    return f'{digest.hexdigest()[:32]}:{duration or 0}:{width or 0}x{height or 0}'
+
+
+class FingerprintIndex:
+    def __init__(self):
+        self._videos: dict[str, VideoInfo] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self._videos)
+
+    def add(self, video: VideoInfo):
+        if video.fingerprint and video.file_id:
+            self._videos[video.fingerprint] = video
+
+    def lookup(self, fingerprint: str, size: int = 0) -> VideoInfo | None:
+        video = self._videos.get(fingerprint)
+        record_cache('fingerprint', video is not None)
+        if video is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += size
+        return video
+
+    def stats(self) -> dict:
+        return {
+            'indexed': len(self._videos),
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_saved': self.bytes_saved,
+        }
@@ -22,7 +22,7 @@ def register_handlers(application: Application):
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
 
-    application.add_handler(InlineQueryHandler(inline_query_handler))
+    application.add_handler(InlineQueryHandler(inline_query_handler, block=False))
     application.add_handler(ChosenInlineResultHandler(chosen_query))
     application.add_handler(CommandHandler(['subscriptions', 'subs'], subscription_list))
     application.add_handler(ConversationHandler(
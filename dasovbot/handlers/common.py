@@ -2,13 +2,20 @@ import logging
 
 from telegram import Update, ReplyKeyboardRemove
 
+from dasovbot.constants import PARTS_START_PREFIX
 from dasovbot.helpers import extract_user
+from dasovbot.services.intent_processor import find_parts, send_video_parts
 
 logger = logging.getLogger(__name__)
 
 
-async def start(update: Update, _):
+async def start(update: Update, context):
     message = update.message
+    if context and context.args and context.args[0].startswith(PARTS_START_PREFIX):
+        video = find_parts(context.bot_data['state'], context.args[0])
+        if video:
+            await send_video_parts(context.bot, message.chat_id, video.file_id, video.caption, video.parts)
+            return
     username = message.from_user['username']
     await message.reply_text(f"Hey, @{username}.\n"
                              "Welcome to Download and Share Online Video bot\n"
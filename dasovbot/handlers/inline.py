@@ -1,18 +1,22 @@
+import asyncio
 import logging
 from uuid import uuid4
 
 from telegram import Update, InputMediaVideo, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultCachedVideo
 from telegram.error import BadRequest
 
-from dasovbot.constants import SOURCE_INLINE
+from dasovbot.constants import INLINE_DEBOUNCE_SEC, SOURCE_INLINE
 from dasovbot.downloader import extract_info, extract_url, process_info, process_entries
-from dasovbot.helpers import extract_user, now
+from dasovbot.helpers import extract_user, looks_like_url, now
+from dasovbot.metrics import INLINE_ANSWER_SECONDS, record_cache
 from dasovbot.models import VideoInfo, TemporaryInlineQuery
 from dasovbot.state import BotState
-from dasovbot.services.intent_processor import append_intent
+from dasovbot.services.intent_processor import append_intent, inline_parts_caption
 
 logger = logging.getLogger(__name__)
 
+INLINE_PAGE_SIZE = 50
+
 
 def inline_video(info: VideoInfo, inline_queries: dict, animation_file_id: str) -> InlineQueryResultCachedVideo:
     id = str(uuid4())
@@ -20,7 +24,7 @@ def inline_video(info: VideoInfo, inline_queries: dict, animation_file_id: str)
     file_id = info.file_id
     video_file_id = file_id or animation_file_id
     reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(text='loading', url=url)]]) if not file_id else None
-    inline_queries[id] = {'url': url, 'upload_date': info.upload_date}
+    inline_queries[id] = {'url': url, 'title': info.title, 'upload_date': info.upload_date}
 
     return InlineQueryResultCachedVideo(
         id=id,
@@ -32,6 +36,56 @@ def inline_video(info: VideoInfo, inline_queries: dict, animation_file_id: str)
     )
 
 
+def search_video(info: VideoInfo, index: int) -> InlineQueryResultCachedVideo:
+    return InlineQueryResultCachedVideo(
+        id=f'search_{index}_{info.file_id[-32:]}',
+        video_file_id=info.file_id,
+        title=info.title,
+        description=info.description,
+        caption=info.caption,
+    )
+
+
+def parse_offset(offset: str | None) -> int:
+    try:
+        return max(0, int(offset or 0))
+    except ValueError:
+        return 0
+
+
+def page_results(results: list, offset: int) -> tuple[list, str]:
+    end = offset + INLINE_PAGE_SIZE
+    return results[offset:end], str(end) if end < len(results) else ''
+
+
+async def answer_search(query_obj, query: str, state: BotState):
+    offset = parse_offset(query_obj.offset)
+    videos, next_offset = state.video_index.search(query, offset=offset, limit=INLINE_PAGE_SIZE)
+    results = [search_video(info, offset + i) for i, info in enumerate(videos)]
+    try:
+        await query_obj.answer(
+            results=results,
+            cache_time=1,
+            next_offset=str(next_offset) if next_offset is not None else '',
+        )
+    except Exception as e:
+        logger.error("inline_query search answer error: %s", query, exc_info=e)
+
+
+async def _debounced_extract_info(query: str, state: BotState) -> VideoInfo | None:
+    await asyncio.sleep(INLINE_DEBOUNCE_SEC)
+    return await extract_info(query, download=False, state=state)
+
+
+def start_inline_extraction(user_id: int, query: str, state: BotState) -> asyncio.Task:
+    previous = state.inline_extractions.get(user_id)
+    if previous and not previous.done():
+        previous.cancel()
+    task = asyncio.create_task(_debounced_extract_info(query, state), name=f"inline_extract_{user_id}")
+    state.inline_extractions[user_id] = task
+    return task
+
+
 async def inline_query_handler(update: Update, context):
     state: BotState = context.bot_data['state']
     query_obj = update.inline_query
@@ -43,6 +97,16 @@ async def inline_query_handler(update: Update, context):
     if not query:
         return
 
+    if not looks_like_url(query):
+        with INLINE_ANSWER_SECONDS.time(kind='search'):
+            await answer_search(query_obj, query, state)
+        return
+
+    with INLINE_ANSWER_SECONDS.time(kind='url'):
+        await answer_url(query_obj, query, user, context, state)
+
+
+async def answer_url(query_obj, query: str, user, context, state: BotState):
     temporary_inline_query = state.temporary_inline_queries.get(query)
     if not temporary_inline_query:
         temporary_inline_query = TemporaryInlineQuery(timestamp=now())
@@ -56,17 +120,33 @@ async def inline_query_handler(update: Update, context):
             pass
         return
 
+    offset = parse_offset(query_obj.offset)
     results = temporary_inline_query.results
     info = state.videos.get(query)
+    record_cache('inline', bool(results and not info))
     if results and not info:
         context.user_data['inline_queries'] = temporary_inline_query.inline_queries
+        page, next_offset = page_results(results, offset)
         try:
-            await query_obj.answer(results=results, cache_time=1)
+            await query_obj.answer(results=page, cache_time=1, next_offset=next_offset)
         except Exception:
             pass
         return
 
-    info = await extract_info(query, download=False, state=state)
+    if info:
+        info = await extract_info(query, download=False, state=state)
+    else:
+        extraction = start_inline_extraction(user.id, query, state)
+        try:
+            info = await extraction
+        except asyncio.CancelledError:
+            if state.inline_extractions.get(user.id) is extraction:
+                raise
+            logger.info("%s # inline_query superseded: %s", extract_user(user), query)
+            return
+        finally:
+            if state.inline_extractions.get(user.id) is extraction:
+                del state.inline_extractions[user.id]
     if not info:
         logger.info("inline_query no info: %s", query)
         try:
@@ -83,6 +163,7 @@ async def inline_query_handler(update: Update, context):
     else:
         results = [inline_video(info, inline_queries, state.animation_file_id)]
 
+    state.set_inline_results(query, inline_queries)
     temporary_inline_query.results = results
     temporary_inline_query.inline_queries = inline_queries
 
@@ -91,8 +172,9 @@ async def inline_query_handler(update: Update, context):
     if not results:
         logger.info("inline_query no results: %s", query)
 
+    page, next_offset = page_results(results, offset)
     try:
-        await query_obj.answer(results=results, cache_time=1)
+        await query_obj.answer(results=page, cache_time=1, next_offset=next_offset)
     except BadRequest as e:
         logger.error("inline_query BadRequest: %s", query, exc_info=e)
     except Exception as e:
@@ -100,6 +182,10 @@ async def inline_query_handler(update: Update, context):
         logger.error("inline_query answer error: %s, single: %s", query, single_video, exc_info=e)
         if single_video:
             await _populate_video(query, chat_ids=[user.id], state=state)
+        return
+
+    if not entries:
+        await _prefetch_video(info, state)
 
 
 async def chosen_query(update: Update, context):
@@ -108,16 +194,20 @@ async def chosen_query(update: Update, context):
     inline_message_id = inline_result.inline_message_id
     inline_queries = context.user_data.pop('inline_queries', None)
 
-    if not inline_message_id or not inline_queries:
+    if not inline_message_id:
         return
-    query_data = inline_queries[inline_result.result_id]
+    query_data = state.inline_results.get(inline_result.result_id)
+    if not query_data and inline_queries:
+        query_data = inline_queries.get(inline_result.result_id)
     if not query_data:
         return
     if isinstance(query_data, str):
         query = query_data
+        title = None
         upload_date = None
     else:
         query = query_data['url']
+        title = query_data.get('title')
         upload_date = query_data.get('upload_date')
     user = inline_result.from_user
 
@@ -129,25 +219,33 @@ async def chosen_query(update: Update, context):
         await context.bot.edit_message_media(
             media=InputMediaVideo(
                 media=file_id,
-                caption=info.caption,
+                caption=inline_parts_caption(context.bot, info.caption, info.parts),
             ),
             inline_message_id=inline_message_id,
         )
         logger.info("%s # chosen_query fnsh: %s", extract_user(user), query)
         return
 
-    title = None
-    for tiq in state.temporary_inline_queries.values():
-        for result in tiq.results:
-            if result.id == inline_result.result_id:
-                title = result.title
-                break
-        if title:
-            break
     await append_intent(query, state, inline_message_id=inline_message_id, source=SOURCE_INLINE, title=title, upload_date=upload_date)
     logger.info("%s # chosen_query aint: %s", extract_user(user), query)
 
 
+async def _prefetch_video(info: VideoInfo, state: BotState):
+    config = state.config
+    if not config or not config.prefetch_inline or info.file_id:
+        return
+    url = extract_url(info)
+    if url in state.intents:
+        return
+    if not info.duration or info.duration > config.prefetch_max_duration:
+        return
+    pending = sum(1 for intent in state.intents.values() if intent.speculative)
+    if pending >= config.prefetch_max_pending:
+        return
+    await append_intent(url, state, source=SOURCE_INLINE, title=info.title, upload_date=info.upload_date, speculative=True)
+    logger.info("inline_query prefetch: %s", url)
+
+
 async def _populate_video(query: str, chat_ids: list, state: BotState):
     info = state.videos.get(query)
     file_id = info.file_id if info else None
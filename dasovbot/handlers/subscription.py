@@ -15,6 +15,7 @@ from dasovbot.helpers import (
 )
 from dasovbot.models import Subscription
 from dasovbot.state import BotState
+from dasovbot.services.intent_processor import send_video_parts
 
 logger = logging.getLogger(__name__)
 
@@ -276,7 +277,7 @@ async def subscribe_show(update: Update, context) -> int:
                 video = state.videos.get(extract_url(entry))
                 file_id = video.file_id if video else None
                 if file_id:
-                    await context.bot.send_video(chat_id, file_id, caption=video.caption)
+                    await send_video_parts(context.bot, chat_id, file_id, video.caption, video.parts)
         except Exception:
             pass
     return ConversationHandler.END
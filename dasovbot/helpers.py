@@ -18,6 +18,10 @@ def extract_user(user: User) -> str:
     return f"{now()} {user.username} ({user.id})"
 
 
+def looks_like_url(query: str) -> bool:
+    return bool(re.match(r'^(https?://)?([\w-]+\.)+[a-z]{2,}(:\d+)?(/\S*)?$', query, re.IGNORECASE))
+
+
 def remove_command_prefix(command: str) -> str:
     return re.sub(r'^/\w+', '', command).lstrip()
 
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import aiosqlite
+
+from dasovbot.models import Intent
+
+
+# intent leases for worker processes sharing one database; another shared store
+# (e.g. a server database with FOR UPDATE SKIP LOCKED) can stand in with the same methods
+class LeaseStore:
+    def __init__(self, db: aiosqlite.Connection, owner: str, lease_sec: float = 60):
+        self.db = db
+        self.owner = owner
+        self.lease_sec = lease_sec
+
+    async def claim(self, exclude: list[str] | None = None) -> tuple[str, Intent] | None:
+        from dasovbot.database import claim_intent
+        return await claim_intent(self.db, self.owner, self.lease_sec, exclude or [])
+
+    async def renew(self, keys: list[str]) -> set[str]:
+        from dasovbot.database import renew_intent_leases
+        if not keys:
+            return set()
+        return await renew_intent_leases(self.db, self.owner, self.lease_sec, keys)
+
+    async def release(self, key: str):
+        from dasovbot.database import release_intent
+        await release_intent(self.db, self.owner, key)
+
+    async def release_all(self):
+        from dasovbot.database import release_intent
+        await release_intent(self.db, self.owner)
+
+    async def complete(self, key: str) -> Intent | None:
+        from dasovbot.database import complete_intent
+        return await complete_intent(self.db, self.owner, key)
+
+    async def save_progress(self, key: str, intent: Intent):
+        from dasovbot.database import save_intent_progress
+        await save_intent_progress(self.db, self.owner, key, intent)
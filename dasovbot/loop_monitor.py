@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+
+from dasovbot.config import Config
+from dasovbot.helpers import now
+from dasovbot.metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 40
+RECENT_STALLS = 20
+
+
+@dataclass
+class Stall:
+    at: str
+    stack: str
+    where: str = ''
+    duration: float | None = None
+
+
+def capture_stack(thread_id: int) -> Stall:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return Stall(at=now(), stack='')
+    frames = traceback.extract_stack(frame, limit=STACK_LIMIT)
+    innermost = frames[-1]
+    return Stall(
+        at=now(),
+        stack=''.join(frames.format()),
+        where=f'{innermost.name} ({innermost.filename}:{innermost.lineno})',
+    )
+
+
+# a heartbeat coroutine records how late it wakes up; a watchdog thread grabs the loop
+# thread's stack once the heartbeat falls behind, so the blocking call is named even if it never returns
+class LoopMonitor:
+    def __init__(self, threshold: float = 0.5, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.recent: deque[Stall] = deque(maxlen=RECENT_STALLS)
+        self.beat = time.monotonic()
+        self._pending: Stall | None = None
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._thread_id = threading.get_ident()
+        self.beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat(), name='loop_monitor')
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._record(time.monotonic() - started - self.interval)
+
+    def _record(self, lag: float):
+        lag = max(0.0, lag)
+        with self._lock:
+            self.beat = time.monotonic()
+            stall, self._pending = self._pending, None
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        LOOP_LAG_SECONDS.observe(lag)
+        if lag < self.threshold and stall is None:
+            return
+        if stall is None:
+            # blocked between two watchdog checks, so there is no stack to show
+            stall = Stall(at=now(), stack='')
+        stall.duration = lag
+        self.stalls += 1
+        self.recent.appendleft(stall)
+        LOOP_STALLS.inc()
+        logger.warning("event loop blocked for %.2fs in %s", lag, stall.where or 'unknown')
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            if not self._loop.is_running():
+                continue
+            with self._lock:
+                if self._pending is not None or self._lag() < self.threshold:
+                    continue
+                self._pending = capture_stack(self._thread_id)
+                stack = self._pending.stack
+            logger.warning("event loop blocked for over %.2fs, loop thread stack:\n%s", self.threshold, stack)
+
+    def _lag(self) -> float:
+        return time.monotonic() - self.beat - self.interval
+
+    def blocked_for(self) -> float | None:
+        with self._lock:
+            if self._pending is None:
+                return None
+            return self._lag()
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self._task is not None,
+            'threshold': self.threshold,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'stalls': self.stalls,
+            'blocked_for': self.blocked_for(),
+            'recent': [
+                {'at': stall.at, 'duration': stall.duration, 'where': stall.where, 'stack': stall.stack}
+                for stall in self.recent
+            ],
+        }
+
+
+_monitor: LoopMonitor | None = None
+
+
+def init_loop_monitor(config: Config):
+    global _monitor
+    _monitor = LoopMonitor(threshold=config.loop_lag_threshold_ms / 1000)
+
+
+def get_loop_monitor() -> LoopMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopMonitor()
+    return _monitor
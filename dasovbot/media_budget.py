@@ -0,0 +1,123 @@
+import logging
+import os
+import shutil
+
+from dasovbot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# the downloaded file and its converted (or split) copy coexist until post-processing ends
+TRANSCODE_SIZE_FACTOR = 2.0
+UNKNOWN_SIZE_ESTIMATE = 512 << 20
+
+
+def estimate_media_bytes(filesize_approx: int | None) -> int:
+    return int((filesize_approx or UNKNOWN_SIZE_ESTIMATE) * TRANSCODE_SIZE_FACTOR)
+
+
+def folder_size(folder: str) -> int:
+    total = 0
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return total
+
+
+class MediaBudget:
+    def __init__(self, folder: str, limit: int = 0, min_free: int = 0):
+        self.folder = folder
+        self.limit = limit
+        self.min_free = min_free
+        self.reservations: dict[str, int] = {}
+        # deferred key -> its estimate, so a retry doesn't need another extraction to know whether it fits
+        self.deferred: dict[str, int] = {}
+
+    @property
+    def reserved(self) -> int:
+        return sum(self.reservations.values())
+
+    def _free(self) -> int | None:
+        try:
+            return shutil.disk_usage(self.folder).free
+        except OSError:
+            return None
+
+    def available(self) -> int | None:
+        available = None
+        free = self._free()
+        if free is not None:
+            available = free - self.min_free - self.reserved
+        if self.limit:
+            budget = self.limit - folder_size(self.folder) - self.reserved
+            available = budget if available is None else min(available, budget)
+        return available
+
+    def fits(self, size: int) -> bool:
+        available = self.available()
+        return available is None or size <= available or not self.reservations
+
+    def reserve(self, key: str, size: int) -> bool:
+        if key in self.reservations:
+            return True
+        available = self.available()
+        if available is not None and size > available:
+            if self.reservations:
+                if key not in self.deferred:
+                    logger.info("media_budget deferred: %s needs %d MB, %d MB available", key, size >> 20, available >> 20)
+                self.deferred[key] = size
+                return False
+            # nothing to wait for, so a lone oversized download is admitted rather than starved
+            logger.warning("media_budget over budget: %s needs %d MB, %d MB available", key, size >> 20, available >> 20)
+        self.reservations[key] = size
+        self.deferred.pop(key, None)
+        return True
+
+    # reserves a deferred key with its stored estimate; keys that were never deferred pass
+    def retry(self, key: str) -> bool:
+        size = self.deferred.get(key)
+        return size is None or self.reserve(key, size)
+
+    def release(self, key: str) -> bool:
+        return self.reservations.pop(key, None) is not None
+
+    # hands a reservation over to work that outlives its job, such as a background export copy
+    def transfer(self, key: str, new_key: str) -> bool:
+        size = self.reservations.pop(key, None)
+        if size is None:
+            return False
+        self.reservations[new_key] = size
+        return True
+
+    def stats(self) -> dict:
+        free = self._free()
+        return {
+            'used': folder_size(self.folder),
+            'reserved': self.reserved,
+            'free': free,
+            'limit': self.limit,
+            'min_free': self.min_free,
+            'reservations': [{'key': key, 'size': size} for key, size in self.reservations.items()],
+            'deferred': len(self.deferred),
+        }
+
+
+_budget: MediaBudget | None = None
+
+
+def init_media_budget(config: Config):
+    global _budget
+    _budget = MediaBudget(config.media_folder, limit=config.media_budget_mb << 20, min_free=config.media_min_free_mb << 20)
+
+
+def get_media_budget() -> MediaBudget:
+    global _budget
+    if _budget is None:
+        _budget = MediaBudget('/')
+    return _budget
@@ -0,0 +1,195 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, TypeVar
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}'
+
+    def render(self) -> list[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}', *self.samples()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def clear(self):
+        self._values.clear()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                labels = format_labels((*self.labelnames, 'le'), (*key, format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {format_value(self._sums[key])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+M = TypeVar('M', bound=Metric)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.register(Histogram(
+    'dasovbot_operation_seconds', 'Duration of extract, download, convert, upload and fan-out operations', ('operation',),
+))
+OPERATION_FAILURES = REGISTRY.register(Counter(
+    'dasovbot_operation_failures_total', 'Failed extract, download, convert, upload and fan-out operations', ('operation',),
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'dasovbot_pipeline_stage_seconds', 'Time an intent spends in each pipeline stage handler', ('stage',),
+))
+INLINE_ANSWER_SECONDS = REGISTRY.register(Histogram(
+    'dasovbot_inline_answer_seconds', 'Inline query handling time until the answer is sent', ('kind',),
+))
+DB_WRITE_SECONDS = REGISTRY.register(Histogram(
+    'dasovbot_db_write_seconds', 'SQLite write and commit latency', ('table',), buckets=DB_BUCKETS,
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'dasovbot_cache_requests_total', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result'),
+))
+INTENT_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'dasovbot_intent_queue_depth', 'Pending intents waiting for delivery', ('source',),
+))
+PIPELINE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'dasovbot_pipeline_queue_depth', 'Jobs queued in front of each pipeline stage', ('stage',),
+))
+PIPELINE_ACTIVE = REGISTRY.register(Gauge(
+    'dasovbot_pipeline_active_jobs', 'Jobs being handled by each pipeline stage', ('stage',),
+))
+TRANSCODE_QUEUED = REGISTRY.register(Gauge(
+    'dasovbot_transcode_queued', 'ffmpeg jobs waiting for a transcode pool slot',
+))
+MEDIA_BYTES = REGISTRY.register(Gauge(
+    'dasovbot_media_bytes', 'Media folder usage and reservations in bytes', ('kind',),
+))
+
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    'dasovbot_event_loop_lag_seconds', 'How late the event loop heartbeat woke up', buckets=LAG_BUCKETS,
+))
+LOOP_STALLS = REGISTRY.register(Counter(
+    'dasovbot_event_loop_stalls_total', 'Times the event loop was blocked longer than LOOP_LAG_THRESHOLD_MS',
+))
+WEBHOOK_UPDATES = REGISTRY.register(Counter(
+    'dasovbot_webhook_updates_total', 'Webhook deliveries by result (accepted, busy, invalid, forbidden)', ('result',),
+))
+UPLOADS = REGISTRY.register(Counter(
+    'dasovbot_uploads_total', 'Video uploads by uploader bot and result (uploaded, failed)', ('uploader', 'result'),
+))
+
+
+@contextmanager
+def track(operation: str):
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        OPERATION_FAILURES.inc(operation=operation)
+        raise
+    finally:
+        OPERATION_SECONDS.observe(time.monotonic() - started, operation=operation)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
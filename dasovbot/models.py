@@ -45,6 +45,9 @@ class VideoInfo:
     origin: VideoOrigin | None = None
     source: str | None = None
     processed_at: str | None = None
+    parts: list[str] | None = None
+    filesize_approx: int | None = None
+    fingerprint: str | None = None
 
     def to_dict(self) -> dict:
         d = {
@@ -67,9 +70,13 @@ class VideoInfo:
             'entries': self.entries,
             'source': self.source,
             'processed_at': self.processed_at,
+            'filesize_approx': self.filesize_approx,
+            'fingerprint': self.fingerprint,
         }
         if self.origin is not None:
             d['origin'] = self.origin.to_dict()
+        if self.parts:
+            d['parts'] = list(self.parts)
         return d
 
     @classmethod
@@ -97,6 +104,9 @@ class VideoInfo:
             origin=origin,
             source=data.get('source'),
             processed_at=data.get('processed_at'),
+            parts=data.get('parts'),
+            filesize_approx=data.get('filesize_approx'),
+            fingerprint=data.get('fingerprint'),
         )
 
 
@@ -113,6 +123,34 @@ class IntentMessage:
         return cls(chat=data['chat'], message=data['message'])
 
 
+@dataclass
+class DownloadProgress:
+    path: str
+    height: int | None = None
+    format: str | None = None
+    downloaded_bytes: int = 0
+    total_bytes: int | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'height': self.height,
+            'format': self.format,
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DownloadProgress':
+        return cls(
+            path=data.get('path', ''),
+            height=data.get('height'),
+            format=data.get('format'),
+            downloaded_bytes=data.get('downloaded_bytes', 0),
+            total_bytes=data.get('total_bytes'),
+        )
+
+
 @dataclass
 class Intent:
     chat_ids: list[str] = field(default_factory=list)
@@ -123,6 +161,9 @@ class Intent:
     source: str | None = None
     title: str | None = None
     upload_date: str | None = None
+    speculative: bool = False
+    download: DownloadProgress | None = None
+    created: float | None = None
 
     def to_dict(self) -> dict:
         return {
@@ -134,11 +175,15 @@ class Intent:
             'source': self.source,
             'title': self.title,
             'upload_date': self.upload_date,
+            'speculative': self.speculative,
+            'download': self.download.to_dict() if self.download else None,
+            'created': self.created,
         }
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Intent':
         messages = [IntentMessage.from_dict(m) for m in data.get('messages', [])]
+        download_data = data.get('download')
         return cls(
             chat_ids=data.get('chat_ids', []),
             inline_message_ids=data.get('inline_message_ids', []),
@@ -148,6 +193,9 @@ class Intent:
             source=data.get('source'),
             title=data.get('title'),
             upload_date=data.get('upload_date'),
+            speculative=data.get('speculative', False),
+            download=DownloadProgress.from_dict(download_data) if download_data else None,
+            created=data.get('created'),
         )
 
 
@@ -183,3 +231,44 @@ class TemporaryInlineQuery:
     inline_queries: dict = field(default_factory=dict)
     marked: bool = False
     ignored: bool = False
+
+
+@dataclass
+class IntentTrace:
+    query: str
+    created: float
+    finished: float
+    outcome: str
+    source: str | None = None
+    size: int | None = None
+    format: str | None = None
+    spans: dict[str, list[float]] = field(default_factory=dict)
+
+    @property
+    def total(self) -> float:
+        return self.finished - self.created
+
+    def to_dict(self) -> dict:
+        return {
+            'query': self.query,
+            'created': self.created,
+            'finished': self.finished,
+            'outcome': self.outcome,
+            'source': self.source,
+            'size': self.size,
+            'format': self.format,
+            'spans': self.spans,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'IntentTrace':
+        return cls(
+            query=data['query'],
+            created=data['created'],
+            finished=data['finished'],
+            outcome=data['outcome'],
+            source=data.get('source'),
+            size=data.get('size'),
+            format=data.get('format'),
+            spans=data.get('spans', {}),
+        )
@@ -1,6 +1,9 @@
 import json
 import logging
 import os
+import re
+import shutil
+from typing import Iterable
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +34,78 @@ def remove(filepath: str):
         pass
 
 
-def empty_media_folder_files(media_folder: str):
+# linux FICLONE ioctl: shares the source extents, so a copy on btrfs/xfs costs no data writes
+FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        remove(dst)
+        return False
+
+
+# places src at dst without copying data; returns the method used, or None
+def link_file(src: str, dst: str) -> str | None:
+    remove(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    if reflink(src, dst):
+        return 'reflink'
+    return None
+
+
+def copy_file(src: str, dst: str):
+    tmp_path = dst + '.tmp'
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except Exception:
+        remove(tmp_path)
+        raise
+
+
+PARTIAL_FILE_RE = re.compile(r'\.(part|ytdl)$|\.part-Frag\d+')
+
+
+def _download_stems(paths: Iterable[str]) -> list[str]:
+    return [os.path.splitext(os.path.basename(path))[0] for path in paths if path]
+
+
+def _is_referenced(file: str, stems: list[str]) -> bool:
+    return any(file == stem or file.startswith(stem + '.') for stem in stems)
+
+
+def empty_media_folder_files(media_folder: str, keep: Iterable[str] = ()):
+    stems = _download_stems(keep)
     for file in os.listdir(media_folder):
+        if _is_referenced(file, stems):
+            continue
         file_path = os.path.join(media_folder, file)
         remove(file_path)
+
+
+def gc_partial_downloads(media_folder: str, keep: Iterable[str] = ()) -> list[str]:
+    stems = _download_stems(keep)
+    removed = []
+    try:
+        files = os.listdir(media_folder)
+    except OSError:
+        return removed
+    for file in files:
+        if PARTIAL_FILE_RE.search(file) and not _is_referenced(file, stems):
+            remove(os.path.join(media_folder, file))
+            removed.append(file)
+    if removed:
+        logger.info("gc_partial_downloads removed: %s", removed)
+    return removed
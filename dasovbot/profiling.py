@@ -0,0 +1,175 @@
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from dataclasses import dataclass
+
+from dasovbot.helpers import now
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 300
+PROFILE_PREVIEW_LINES = 40
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+@dataclass
+class ProfileResult:
+    at: str
+    duration: float
+    stats: bytes
+    text: str
+    preview: str
+
+
+def format_stats(profile: cProfile.Profile, limit: int | None = None) -> str:
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(*([limit] if limit else []))
+    return stream.getvalue()
+
+
+# cProfile sessions on the event loop thread and tracemalloc snapshots, one at a time
+class Profiler:
+    def __init__(self):
+        self.result: ProfileResult | None = None
+        self._profile: cProfile.Profile | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._started = 0.0
+        self._seconds = 0
+        self._snapshot: tracemalloc.Snapshot | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def remaining(self) -> float:
+        if not self.running:
+            return 0.0
+        return max(0.0, self._started + self._seconds - time.monotonic())
+
+    def start(self, seconds: int) -> bool:
+        if self.running:
+            return False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler (e.g. a debugger) owns the profiling hook
+            logger.warning("profiler start failed", exc_info=True)
+            return False
+        self._profile = profile
+        self._started = time.monotonic()
+        self._seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+        self._timer = asyncio.get_running_loop().call_later(self._seconds, self.stop)
+        logger.info("profiler started for %ds", self._seconds)
+        return True
+
+    def stop(self) -> ProfileResult | None:
+        if not self.running:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        profile.create_stats()
+        duration = time.monotonic() - self._started
+        self.result = ProfileResult(
+            at=now(),
+            duration=duration,
+            stats=marshal.dumps(profile.stats),
+            text=format_stats(profile),
+            preview=format_stats(profile, PROFILE_PREVIEW_LINES),
+        )
+        logger.info("profiler stopped after %.1fs", duration)
+        return self.result
+
+    @property
+    def tracing_memory(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_memory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = None
+            logger.info("tracemalloc started")
+
+    def stop_memory(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._snapshot = None
+            logger.info("tracemalloc stopped")
+
+    def snapshot_memory(self, limit: int = TOP_ALLOCATIONS) -> str | None:
+        # top allocators, plus the biggest growth since the previous snapshot
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f'{now()} traced {current >> 10} KiB, peak {peak >> 10} KiB', '', f'Top {limit} allocators:']
+        lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:limit])
+        if self._snapshot is not None:
+            lines.extend(['', f'Top {limit} changes since previous snapshot:'])
+            lines.extend(str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:limit])
+        lines.extend(['', 'Largest allocation tracebacks:'])
+        for stat in snapshot.statistics('traceback')[:5]:
+            lines.append(f'{stat.count} blocks, {stat.size >> 10} KiB')
+            lines.extend(stat.traceback.format())
+        self._snapshot = snapshot
+        return '\n'.join(lines) + '\n'
+
+    def stats(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'running': self.running,
+            'remaining': self.remaining(),
+            'max_seconds': MAX_PROFILE_SECONDS,
+            'result': self.result,
+            'tracing_memory': self.tracing_memory,
+            'traced': current,
+            'traced_peak': peak,
+        }
+
+
+# stacks of every asyncio task, then of every thread (executor threads run yt-dlp and file copies)
+def dump_tasks() -> str:
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    lines = [f'{now()} {len(tasks)} tasks', '']
+    for task in tasks:
+        stream = io.StringIO()
+        task.print_stack(file=stream)
+        lines.append(stream.getvalue())
+    frames = sys._current_frames()
+    threads = threading.enumerate()
+    lines.append(f'{len(threads)} threads')
+    lines.append('')
+    for thread in threads:
+        frame = frames.get(thread.ident)
+        lines.append(f'Thread {thread.name} (daemon={thread.daemon}):')
+        lines.append(''.join(traceback.format_stack(frame)) if frame else '  no frame\n')
+    return '\n'.join(lines)
+
+
+_profiler: Profiler | None = None
+
+
+def get_profiler() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
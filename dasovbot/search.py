@@ -0,0 +1,109 @@
+import re
+from bisect import bisect_left, insort
+from urllib.parse import urlparse
+
+from dasovbot.models import VideoInfo
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str | None) -> list[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def uploader_tokens(uploader_url: str | None) -> list[str]:
+    if not uploader_url:
+        return []
+    segments = [s for s in urlparse(uploader_url).path.split('/') if s]
+    return tokenize(segments[-1]) if segments else []
+
+
+class VideoIndex:
+    def __init__(self):
+        self._videos: dict[str, VideoInfo] = {}
+        self._video_tokens: dict[str, set[str]] = {}
+        self._postings: dict[str, set[str]] = {}
+        self._sorted_tokens: list[str] = []
+        # several keys can share a file_id (see fingerprint dedup), so a file_id is
+        # only dropped when the last key pointing at it moves to another one
+        self._key_file_ids: dict[str, str] = {}
+        self._file_keys: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._videos)
+
+    def add(self, video: VideoInfo, key: str | None = None):
+        file_id = video.file_id
+        if key is not None:
+            self._move_key(key, file_id)
+        if not file_id:
+            return
+        self._unindex(file_id)
+        tokens = set(tokenize(video.title)) | set(uploader_tokens(video.uploader_url))
+        self._videos[file_id] = video
+        self._video_tokens[file_id] = tokens
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                insort(self._sorted_tokens, token)
+            posting.add(file_id)
+
+    def _move_key(self, key: str, file_id: str | None):
+        previous = self._key_file_ids.pop(key, None)
+        if previous and previous != file_id:
+            keys = self._file_keys.get(previous, set())
+            keys.discard(key)
+            if not keys:
+                self.remove(previous)
+        if file_id:
+            self._key_file_ids[key] = file_id
+            self._file_keys.setdefault(file_id, set()).add(key)
+
+    def remove(self, file_id: str):
+        for key in self._file_keys.pop(file_id, ()):
+            self._key_file_ids.pop(key, None)
+        self._unindex(file_id)
+
+    def _unindex(self, file_id: str):
+        if self._videos.pop(file_id, None) is None:
+            return
+        for token in self._video_tokens.pop(file_id, ()):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.discard(file_id)
+            if not posting:
+                del self._postings[token]
+                i = bisect_left(self._sorted_tokens, token)
+                if i < len(self._sorted_tokens) and self._sorted_tokens[i] == token:
+                    del self._sorted_tokens[i]
+
+    def _prefix_matches(self, prefix: str) -> set[str]:
+        matches = set()
+        i = bisect_left(self._sorted_tokens, prefix)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(prefix):
+            matches |= self._postings[self._sorted_tokens[i]]
+            i += 1
+        return matches
+
+    def search(self, query: str, offset: int = 0, limit: int = 50) -> tuple[list[VideoInfo], int | None]:
+        tokens = tokenize(query)
+        if not tokens:
+            return [], None
+        matches = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            token_matches = self._prefix_matches(token)
+            matches = token_matches if matches is None else matches & token_matches
+            if not matches:
+                return [], None
+        videos = sorted(
+            (self._videos[file_id] for file_id in matches),
+            key=lambda v: v.processed_at or '',
+            reverse=True,
+        )
+        page = videos[offset:offset + limit]
+        next_offset = offset + limit if offset + limit < len(videos) else None
+        return page, next_offset
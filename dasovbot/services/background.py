@@ -9,8 +9,7 @@ from telegram import Bot
 
 from dasovbot.constants import SOURCE_SUBSCRIPTION
 from dasovbot.downloader import extract_info, extract_url, filter_entries, get_ydl
-from dasovbot.helpers import now
-from dasovbot.services.intent_processor import append_intent, post_process
+from dasovbot.services.intent_processor import append_intent, post_process, send_video_file
 
 if TYPE_CHECKING:
     from dasovbot.state import BotState
@@ -28,7 +27,7 @@ async def run_populate_subscriptions(state: BotState):
             await populate_playlist(url, chat_ids, state)
         else:
             await state.pop_subscription(url)
-    state.background_task_status['populate_subscriptions'] = now()
+    state.mark_task('populate_subscriptions')
 
 
 async def populate_subscriptions(state: BotState):
@@ -71,9 +70,8 @@ async def populate_animation(bot: Bot, state: BotState):
 
     info = await extract_info(query, download=True, state=state)
 
-    message = await bot.send_video(
-        chat_id=state.config.developer_chat_id,
-        video=info.filepath,
+    message = await send_video_file(
+        bot, state, info.filepath,
         filename=info.filename,
         duration=info.duration,
         width=info.width,
@@ -86,17 +84,28 @@ async def populate_animation(bot: Bot, state: BotState):
     logger.info("animation_file_id = %s", state.animation_file_id)
 
 
+async def run_clear_temporary_inline_queries(state: BotState):
+    from dasovbot.services.pipeline import get_pipeline
+    pipeline = get_pipeline()
+    for url in list(state.temporary_inline_queries.keys()):
+        tiq = state.temporary_inline_queries.get(url)
+        if not tiq:
+            continue
+        if tiq.marked:
+            state.pop_temporary_inline_query(url)
+            for data in tiq.inline_queries.values():
+                intent = state.intents.get(data['url'])
+                # a prefetch already in the pipeline finishes and lands in the cache
+                if intent and intent.speculative and not (pipeline and data['url'] in pipeline):
+                    await state.pop_intent(data['url'])
+        else:
+            tiq.marked = True
+    state.mark_task('clear_temporary_inline_queries')
+
+
 async def clear_temporary_inline_queries(state: BotState):
     while True:
-        for url in list(state.temporary_inline_queries.keys()):
-            tiq = state.temporary_inline_queries.get(url)
-            if not tiq:
-                continue
-            if tiq.marked:
-                del state.temporary_inline_queries[url]
-            else:
-                tiq.marked = True
-        state.background_task_status['clear_temporary_inline_queries'] = now()
+        await run_clear_temporary_inline_queries(state)
         await asyncio.sleep(10 * 60)
 
 
@@ -106,12 +115,18 @@ def _log_task_exception(task: asyncio.Task):
 
 
 def start_background_tasks(bot: Bot, state: BotState):
+    from dasovbot.constants import ROLE_FRONT
     from dasovbot.services.intent_processor import monitor_process_intents
+    from dasovbot.services.worker import sync_shared_state
 
+    if state.config.role == ROLE_FRONT:
+        process = asyncio.create_task(sync_shared_state(state), name="sync_shared_state")
+    else:
+        process = asyncio.create_task(monitor_process_intents(bot, state), name="monitor_process_intents")
     tasks = [
         asyncio.create_task(populate_animation(bot, state), name="populate_animation"),
         asyncio.create_task(populate_subscriptions(state), name="populate_subscriptions"),
-        asyncio.create_task(monitor_process_intents(bot, state), name="monitor_process_intents"),
+        process,
         asyncio.create_task(clear_temporary_inline_queries(state), name="clear_temporary_inline_queries"),
     ]
     for task in tasks:
@@ -1,24 +1,39 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import logging
 import os
-import shutil
+import time
 from functools import partial
+from pathlib import Path
 from typing import TYPE_CHECKING
 
-import yt_dlp
 from telegram import Bot, InputMediaVideo, Message
-from telegram.error import NetworkError
+from telegram.constants import MediaGroupLimit
+from telegram.error import BadRequest
 
-from dasovbot.config import make_ydl_opts
+from dasovbot.config import Config
+from dasovbot.constants import (
+    MAX_UPLOAD_SIZE, PARTS_START_PREFIX, OUTCOME_CACHED, OUTCOME_DEDUPLICATED, OUTCOME_DEFERRED, OUTCOME_DELIVERED,
+    OUTCOME_DOWNLOAD_FAILED, OUTCOME_DROPPED, OUTCOME_NO_INFO, OUTCOME_TOO_LARGE,
+    OUTCOME_UPLOAD_FAILED,
+)
 from dasovbot.downloader import (
-    extract_info, extract_url, process_info,
-    add_scaled_after_title, convert_to_mp4,
+    DOWNLOAD_INTERRUPTED, extract_info, extract_url, convert_to_mp4, download_video, split_video, video_metadata,
 )
+from dasovbot.events import EVENT_DONE, EVENT_FAILED
+from dasovbot.fingerprint import fingerprint_file
 from dasovbot.helpers import send_message_developer, now
-from dasovbot.models import VideoInfo, VideoOrigin, Intent, IntentMessage
-from dasovbot.persistence import remove
+from dasovbot.media_budget import estimate_media_bytes, get_media_budget
+from dasovbot.metrics import OPERATION_FAILURES, OPERATION_SECONDS, track
+from dasovbot.models import DownloadProgress, VideoInfo, VideoOrigin, Intent, IntentMessage
+from dasovbot.persistence import copy_file, gc_partial_downloads, link_file, remove
+from dasovbot.services.pipeline import (
+    STAGE_DELIVER, STAGE_DOWNLOAD, STAGE_POSTPROCESS, STAGE_RESOLVE, STAGE_UPLOAD,
+    Pipeline, PipelineJob, StageHandler, init_pipeline,
+)
+from dasovbot.upload_pool import get_upload_pool
 
 if TYPE_CHECKING:
     from dasovbot.state import BotState
@@ -30,16 +45,18 @@ def filter_intents(intents: dict) -> dict:
     return {query: intent for query, intent in intents.items() if not intent.ignored}
 
 
-async def append_intent(query: str, state: BotState, chat_ids=None, inline_message_id: str = '', message=None, source: str = None, title: str = None, upload_date: str = None):
+async def append_intent(query: str, state: BotState, chat_ids=None, inline_message_id: str = '', message=None, source: str = None, title: str = None, upload_date: str = None, speculative: bool = False):
     if chat_ids is None:
         chat_ids = []
     if message is None:
         message = {}
 
-    intent = state.intents.get(query)
+    intent = await state.load_intent(query)
     is_new = not intent
     if is_new:
-        intent = Intent()
+        intent = Intent(speculative=speculative, created=time.time())
+    elif intent.speculative and not speculative:
+        intent.speculative = False
 
     if source and intent.source is None:
         intent.source = source
@@ -55,7 +72,7 @@ async def append_intent(query: str, state: BotState, chat_ids=None, inline_messa
         intent.inline_message_ids.append(inline_message_id)
     if message:
         intent.messages.append(IntentMessage.from_dict(message))
-    if not intent.ignored:
+    if not intent.ignored and not speculative:
         intent.priority += len(chat_ids) or 2
 
     if is_new:
@@ -65,6 +82,102 @@ async def append_intent(query: str, state: BotState, chat_ids=None, inline_messa
     state.download_queue.put_nowait(query)
 
 
+def local_file_uri(config: Config, filepath: str) -> str | None:
+    if not config.local_mode or not filepath:
+        return None
+    media_folder = os.path.realpath(config.media_folder)
+    relative = os.path.relpath(os.path.realpath(filepath), media_folder)
+    if relative.startswith('..'):
+        return None
+    server_folder = config.local_media_folder or media_folder
+    return Path(server_folder, relative).as_uri()
+
+
+async def send_video_file(bot: Bot, state: BotState, filepath: str, **kwargs) -> Message:
+    pool = get_upload_pool()
+    with track('upload'):
+        if pool:
+            return await pool.upload(bot, partial(_send_video_file, state=state, filepath=filepath, **kwargs))
+        return await _send_video_file(bot, state.config.developer_chat_id, state, filepath, **kwargs)
+
+
+async def _send_video_file(bot: Bot, chat_id: str, state: BotState, filepath: str, **kwargs) -> Message:
+    config = state.config
+    if not config.local_mode:
+        return await bot.send_video(chat_id=chat_id, video=filepath, **kwargs)
+    uri = None if state.local_upload_unavailable else local_file_uri(config, filepath)
+    if uri:
+        try:
+            return await bot.send_video(chat_id=chat_id, video=uri, **kwargs)
+        except BadRequest as e:
+            logger.warning("send_video_file local upload failed, using multipart: %s %s", filepath, e)
+    with open(filepath, 'rb') as video:
+        message = await bot.send_video(chat_id=chat_id, video=video, **kwargs)
+    if uri:
+        logger.warning("send_video_file media folder is not shared with the api server, local uploads disabled")
+        state.local_upload_unavailable = True
+    return message
+
+
+_export_tasks: set[asyncio.Task] = set()
+
+
+def export_path(filepath: str) -> str:
+    return '/export/'.join(filepath.rsplit('/media/', 1))
+
+
+def export_key(query: str) -> str:
+    return f'export:{query}'
+
+
+async def copy_export(query: str, filepath: str, target: str):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, copy_file, filepath, target)
+        logger.info("export copied: %s %s", query, target)
+    except Exception:
+        logger.error("export copy error: %s", query, exc_info=True)
+    finally:
+        remove(filepath)
+        get_media_budget().release(export_key(query))
+
+
+def export_video(query: str, filepath: str) -> asyncio.Task | None:
+    target = export_path(filepath)
+    method = link_file(filepath, target)
+    if method:
+        remove(filepath)
+        logger.info("export %s: %s %s", method, query, target)
+        return None
+    # separate mounts (hardlinks need /media and /export on one mount): copy in the background so
+    # delivery to the waiting chats is not held up, keeping the job's reservation until the copy is done
+    get_media_budget().transfer(query, export_key(query))
+    task = asyncio.create_task(copy_export(query, filepath, target), name=f'export_{os.path.basename(filepath)}')
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+    return task
+
+
+async def store_video(query: str, info: VideoInfo, state: BotState, origin_info: VideoInfo = None):
+    url = extract_url(info)
+    intent = state.intents.get(query)
+    if intent and intent.source:
+        info.source = intent.source
+    info.processed_at = now()
+    info.url = None
+    info.filepath = None
+    info.filename = None
+    info.entries = None
+    if origin_info:
+        info.origin = VideoOrigin(
+            width=origin_info.width,
+            height=origin_info.height,
+            format=origin_info.format,
+        )
+    await state.set_video(query, info)
+    await state.set_video(url, info)
+
+
 async def post_process(query: str, info: VideoInfo, message: Message, state: BotState, store_info=True, origin_info: VideoInfo = None) -> str:
     file_id = message.video.file_id
     try:
@@ -74,23 +187,7 @@ async def post_process(query: str, info: VideoInfo, message: Message, state: Bot
     filepath = info.filepath
     info.file_id = file_id
     if store_info:
-        url = extract_url(info)
-        intent = state.intents.get(query)
-        if intent and intent.source:
-            info.source = intent.source
-        info.processed_at = now()
-        info.url = None
-        info.filepath = None
-        info.filename = None
-        info.entries = None
-        if origin_info:
-            info.origin = VideoOrigin(
-                width=origin_info.width,
-                height=origin_info.height,
-                format=origin_info.format,
-            )
-        await state.set_video(query, info)
-        await state.set_video(url, info)
+        await store_video(query, info, state, origin_info)
     if filepath:
         chat_ids = []
         intent = state.intents.get(query)
@@ -98,157 +195,333 @@ async def post_process(query: str, info: VideoInfo, message: Message, state: Bot
             chat_ids = intent.chat_ids or [m.chat for m in intent.messages]
         developer_id = state.config.developer_id
         if developer_id in chat_ids or str(message.chat_id) == developer_id:
-            try:
-                shutil.move(filepath, '/export/'.join(filepath.rsplit('/media/', 1)))
-            except Exception:
-                logger.error("move_file error: %s", query, exc_info=True)
-                remove(filepath)
+            export_video(query, filepath)
         else:
             remove(filepath)
     return file_id
 
 
+def next_intent(state: BotState, pipeline: Pipeline) -> str | None:
+    budget = get_media_budget()
+    for query in [query for query in budget.deferred if query not in state.intents]:
+        del budget.deferred[query]
+    candidates = {
+        query: intent for query, intent in filter_intents(state.intents).items()
+        if query not in pipeline
+    }
+    for query in sorted(candidates, key=lambda key: candidates[key].priority, reverse=True):
+        # deferred intents are resubmitted only once their estimate fits, not re-extracted to find out
+        if budget.retry(query):
+            return query
+    return None
+
+
 async def process_intents(bot: Bot, state: BotState):
-    while True:
-        await asyncio.sleep(10)
-        state.background_task_status['monitor_process_intents'] = now()
-        filtered_intents = filter_intents(state.intents)
-        if not filtered_intents:
-            await state.download_queue.get()
-        if not filtered_intents:
-            continue
-        max_priority = max(filtered_intents, key=lambda key: filtered_intents[key].priority)
-        await process_query(bot, max_priority, state)
+    pipeline = init_pipeline(
+        stage_handlers(bot, state), state.config,
+        on_error=partial(abort_job, state=state), on_done=partial(finish_job, state=state),
+    )
+    pipeline.start()
+    try:
+        while True:
+            await pipeline.acquire()
+            state.mark_task('monitor_process_intents')
+            query = next_intent(state, pipeline)
+            while not query:
+                await state.download_queue.get()
+                query = next_intent(state, pipeline)
+            pipeline.submit(query)
+    finally:
+        await pipeline.stop()
 
 
 async def monitor_process_intents(bot: Bot, state: BotState):
     from dasovbot.constants import INTERVAL_SEC
     from dasovbot.persistence import empty_media_folder_files
     while True:
+        gc_partial_downloads(state.config.media_folder, await state.download_paths())
         try:
             await process_intents(bot, state)
         except Exception as e:
             logger.error("process_intents crashed: %s, %s", type(e).__name__, str(e), exc_info=e)
             if state.config.empty_media_folder:
-                empty_media_folder_files(state.config.media_folder)
+                empty_media_folder_files(state.config.media_folder, keep=await state.download_paths())
         await asyncio.sleep(INTERVAL_SEC)
         await send_message_developer(bot, '[error_monitor_process_intents]', state.config.developer_id)
 
 
-async def process_query(bot: Bot, query: str, state: BotState) -> VideoInfo:
-    config = state.config
-    info = await extract_info(query, download=True, state=state)
+def stage_handlers(bot: Bot, state: BotState) -> dict[str, StageHandler]:
+    return {
+        STAGE_RESOLVE: partial(resolve_stage, bot, state=state),
+        STAGE_DOWNLOAD: partial(download_stage, bot, state=state),
+        STAGE_POSTPROCESS: partial(postprocess_stage, bot, state=state),
+        STAGE_UPLOAD: partial(upload_stage, bot, state=state),
+        STAGE_DELIVER: partial(deliver_stage, bot, state=state),
+    }
+
+
+async def abort_job(job: PipelineJob, state: BotState):
+    for part in job.parts:
+        remove(part)
+    if job.info and job.info.filepath:
+        remove(job.info.filepath)
+    await state.pop_intent(job.query)
+
+
+async def finish_job(job: PipelineJob, state: BotState):
+    get_media_budget().release(job.query)
+    # wake the dispatcher: a wake-up for this query may have been spent while it was in flight,
+    # and freed media space can make deferred intents eligible
+    state.download_queue.put_nowait(job.query)
+    if not job.outcome:
+        job.outcome = OUTCOME_DELIVERED if job.stage == STAGE_DELIVER else OUTCOME_DROPPED
+    # deferred intents stay queued, their trace is recorded once they finish
+    if job.outcome == OUTCOME_DEFERRED:
+        return
+    succeeded = job.outcome in (OUTCOME_DELIVERED, OUTCOME_CACHED, OUTCOME_DEDUPLICATED)
+    state.events.publish(EVENT_DONE if succeeded else EVENT_FAILED, {
+        'url': job.query,
+        'title': job.info.title if job.info else '',
+        'outcome': job.outcome,
+    })
+    if not state.config.trace_retention_days:
+        return
+    try:
+        await state.add_trace(job.to_trace(time.time()))
+    except Exception:
+        logger.error("finish_job trace error: %s", job.query, exc_info=True)
+
+
+async def resolve_stage(bot: Bot, job: PipelineJob, state: BotState) -> str | None:
+    query = job.query
+    intent = state.intents.get(query)
+    if intent:
+        job.source = intent.source
+        job.created = intent.created
+    info = await extract_info(query, download=False, state=state)
+    job.info = info
     if not info:
         logger.error("process_query error (no info): %s", query)
+        job.outcome = OUTCOME_NO_INFO
         if state.intents.get(query) and not state.intents[query].ignored:
             await state.pop_intent(query)
-        return info
-    caption = info.caption
-    file_id = info.file_id
-    logger.info("process_query info: %s file_id=%s filepath=%s", query, file_id, info.filepath)
-    if not file_id:
-        try:
-            video_path = info.filepath
-            if not video_path:
-                logger.error("process_query no video path: %s", query)
-                if 'youtube' in extract_url(info):
-                    await send_message_developer(bot, f'[error_no_video_path]\n{caption}', config.developer_id)
-                await state.pop_intent(query)
-                return info
-            video_path = await convert_to_mp4(video_path)
-            if video_path != info.filepath:
-                info.filepath = video_path
-                info.filename = os.path.splitext(info.filename)[0] + '.mp4' if info.filename else None
+        return None
+    logger.info("process_query info: %s file_id=%s", query, info.file_id)
+    if info.file_id:
+        job.file_id = info.file_id
+        job.outcome = OUTCOME_CACHED
+        return STAGE_DELIVER
+    if not get_media_budget().reserve(query, estimate_media_bytes(info.filesize_approx)):
+        job.outcome = OUTCOME_DEFERRED
+        return None
+    return STAGE_DOWNLOAD
+
+
+async def save_download_progress(query: str, progress: DownloadProgress, state: BotState):
+    intent = state.intents.get(query)
+    if intent:
+        intent.download = progress
+        await state.save_intent(query)
+
+
+# an interrupted attempt is retried only while it keeps making progress, so a dead link can't loop forever
+def download_advanced(intent: Intent | None, resume: DownloadProgress | None) -> bool:
+    if not intent or not intent.download:
+        return False
+    return intent.download.downloaded_bytes > (resume.downloaded_bytes if resume else 0)
+
+
+async def download_stage(bot: Bot, job: PipelineJob, state: BotState) -> str | None:
+    query = job.query
+    intent = state.intents.get(query)
+    resume = intent.download if intent else None
+    on_progress = partial(save_download_progress, query, state=state)
+    try:
+        job.info = await download_video(query, resume=resume, on_progress=on_progress) or job.info
+    except DOWNLOAD_INTERRUPTED:
+        if download_advanced(state.intents.get(query), resume):
+            # keep the intent and its .part; the dispatcher resubmits deferred intents and yt-dlp continues the file
+            logger.warning("process_query download interrupted, requeued: %s", query)
+            job.outcome = OUTCOME_DEFERRED
+            return None
+    info = job.info
+    logger.info("process_query downloaded: %s filepath=%s", query, info.filepath)
+    if not info.filepath:
+        logger.error("process_query no video path: %s", query)
+        job.outcome = OUTCOME_DOWNLOAD_FAILED
+        if 'youtube' in extract_url(info):
+            await send_message_developer(bot, f'[error_no_video_path]\n{info.caption}', state.config.developer_id)
+        await state.pop_intent(query)
+        gc_partial_downloads(state.config.media_folder, await state.download_paths())
+        return None
+    if await reuse_fingerprint_match(job, state):
+        return STAGE_DELIVER
+    return STAGE_POSTPROCESS
+
+
+async def reuse_fingerprint_match(job: PipelineJob, state: BotState) -> bool:
+    head_bytes = state.config.fingerprint_mb << 20
+    if not head_bytes:
+        return False
+    info = job.info
+    loop = asyncio.get_running_loop()
+    info.fingerprint = await loop.run_in_executor(
+        None, fingerprint_file, info.filepath, info.duration, info.width, info.height, head_bytes,
+    )
+    if not info.fingerprint:
+        return False
+    try:
+        size = os.path.getsize(info.filepath)
+    except OSError:
+        size = 0
+    match = state.fingerprint_index.lookup(info.fingerprint, size)
+    if not match:
+        return False
+    logger.info("process_query fingerprint hit: %s -> %s file_id=%s", job.query, match.webpage_url, match.file_id)
+    job.outcome = OUTCOME_DEDUPLICATED
+    job.size = size
+    remove(info.filepath)
+    info.file_id = match.file_id
+    info.parts = match.parts
+    await store_video(job.query, info, state)
+    job.file_id = match.file_id
+    return True
+
+
+async def postprocess_stage(bot: Bot, job: PipelineJob, state: BotState) -> str | None:
+    query = job.query
+    info = job.info
+    video_path = await convert_to_mp4(info.filepath, video_metadata(info), info.duration)
+    if video_path != info.filepath:
+        info.filepath = video_path
+        info.filename = os.path.splitext(info.filename)[0] + '.mp4' if info.filename else None
+    job.size = os.path.getsize(video_path)
+    if job.size > MAX_UPLOAD_SIZE:
+        logger.warning("process_query video too large: %s %d MB", query, job.size >> 20)
+        job.parts = await split_video(video_path, info.duration) if state.config.split_large_videos else []
+        if not job.parts:
+            job.outcome = OUTCOME_TOO_LARGE
+            await send_message_developer(bot, f'[error_large_video]\n{info.caption}', state.config.developer_id)
+            remove(video_path)
+            await state.pop_intent(query)
+            return None
+    return STAGE_UPLOAD
+
+
+async def upload_stage(bot: Bot, job: PipelineJob, state: BotState) -> str | None:
+    query = job.query
+    info = job.info
+    try:
+        if not job.parts:
             logger.info("process_query send_video strt: %s", query)
-            message = await bot.send_video(
-                chat_id=config.developer_chat_id,
-                caption=caption,
-                video=video_path,
+            job.messages.append(await send_video_file(
+                bot, state, info.filepath,
+                caption=info.caption,
                 duration=info.duration,
                 width=info.width,
                 height=info.height,
                 filename=info.filename,
                 disable_notification=True,
-            )
-            logger.info("process_query send_video fnsh: %s file_id=%s", query, message.video.file_id if message.video else None)
-        except Exception as e:
-            logger.error("process_query send_video error: %s %s: %s", query, type(e).__name__, e)
-            if isinstance(e, NetworkError) and video_path and os.path.getsize(video_path) >> 20 > 2000 and 'youtube' in extract_url(info):
-                await send_message_developer(bot, f'[error_large_video]\n{caption}', config.developer_id)
-                temp_ydl_opts = make_ydl_opts(config)
-                temp_ydl_opts['format'] = temp_ydl_opts['format'].replace('720', '360')
-                temp_ydl_opts['outtmpl'] = add_scaled_after_title(temp_ydl_opts['outtmpl'])
-                temp_video_path = None
-                temp_info = None
-                loop = asyncio.get_running_loop()
-                with yt_dlp.YoutubeDL(temp_ydl_opts) as temp_ydl:
-                    try:
-                        temp_info_raw = await loop.run_in_executor(
-                            None, partial(temp_ydl.extract_info, query, download=True)
-                        )
-                        temp_info = process_info(temp_info_raw)
-                        temp_video_path = temp_info.filepath
-                    except Exception:
-                        logger.error("fallback download error: %s", query, exc_info=True)
-                if not temp_info or not temp_video_path:
-                    remove(info.filepath)
-                    await state.pop_intent(query)
-                    return info
-                temp_video_path = await convert_to_mp4(temp_video_path)
-                if temp_video_path != temp_info.filepath:
-                    temp_info.filepath = temp_video_path
-                try:
-                    logger.info("process_query send_video rsrt: %s", query)
-                    message = await bot.send_video(
-                        chat_id=config.developer_chat_id,
-                        caption=caption,
-                        video=temp_video_path,
-                        duration=info.duration,
-                        width=temp_info.width or info.width,
-                        height=temp_info.height or info.height,
-                        filename=info.filename,
-                        disable_notification=True,
-                    )
-                    logger.info("process_query send_video fnsh: %s", query)
-                    await send_message_developer(bot, f'[error_fixed_large_video]\n{caption}', config.developer_id, notification=False)
-                    file_id = await post_process(query, info, message, state, origin_info=temp_info)
-                    await process_intent(bot, query, file_id, caption, state)
-                    return info
-                except Exception:
-                    logger.error("fallback send_video error: %s", query, exc_info=True)
-                finally:
-                    logger.info("process_query remove: %s", temp_video_path)
-                    if temp_video_path:
-                        remove(temp_video_path)
-            remove(info.filepath)
-            await state.pop_intent(query)
-            return info
-        file_id = await post_process(query, info, message, state)
-        logger.info("process_query post_process done: %s file_id=%s", query, file_id)
+            ))
+        for index, part in enumerate(job.parts, 1):
+            logger.info("process_query send_video strt: %s part %d/%d", query, index, len(job.parts))
+            job.messages.append(await send_video_file(
+                bot, state, part,
+                caption=f'{info.caption}\n[{index}/{len(job.parts)}]',
+                width=info.width,
+                height=info.height,
+                disable_notification=True,
+            ))
+        logger.info("process_query send_video fnsh: %s messages=%d", query, len(job.messages))
+    except Exception as e:
+        logger.error("process_query send_video error: %s %s: %s", query, type(e).__name__, e)
+        job.outcome = OUTCOME_UPLOAD_FAILED
+        remove(info.filepath)
+        await state.pop_intent(query)
+        return None
+    finally:
+        for part in job.parts:
+            remove(part)
+        job.parts = []
+    return STAGE_DELIVER
+
+
+async def deliver_stage(bot: Bot, job: PipelineJob, state: BotState) -> None:
+    query = job.query
+    info = job.info
+    if job.messages:
+        for message in job.messages[1:]:
+            try:
+                await message.delete()
+            except Exception:
+                pass
+        if len(job.messages) > 1:
+            info.parts = [message.video.file_id for message in job.messages]
+        job.file_id = await post_process(query, info, job.messages[0], state)
+        logger.info("process_query post_process done: %s file_id=%s", query, job.file_id)
+    started = time.time()
+    await process_intent(bot, query, job.file_id, info.caption, state, parts=info.parts)
+    job.spans['fanout'] = (started, time.time())
+    return None
+
+
+def part_media_groups(parts: list[str], caption: str) -> list[list[InputMediaVideo]]:
+    media = [InputMediaVideo(media=part, caption=caption if index == 0 else None) for index, part in enumerate(parts)]
+    size = MediaGroupLimit.MAX_MEDIA_LENGTH
+    return [media[i:i + size] for i in range(0, len(media), size)]
+
+
+def parts_token(parts: list[str]) -> str:
+    # start payloads are limited to 64 characters, too short for a file_id
+    return PARTS_START_PREFIX + hashlib.sha1(parts[0].encode()).hexdigest()[:16]
+
+
+def find_parts(state: BotState, token: str) -> VideoInfo | None:
+    return next((video for video in state.videos.values() if video.parts and parts_token(video.parts) == token), None)
+
 
-    await process_intent(bot, query, file_id, caption, state)
-    return info
+def inline_parts_caption(bot: Bot, caption: str | None, parts: list[str] | None) -> str | None:
+    # an inline message holds one video; the rest are sent by /start in the user's chat with the bot
+    if not parts or len(parts) < 2:
+        return caption
+    link = f'[1/{len(parts)}] all parts: https://t.me/{bot.username}?start={parts_token(parts)}'
+    return f'{caption}\n{link}' if caption else link
 
 
-async def process_intent(bot: Bot, query: str, video: str, caption: str, state: BotState) -> Intent | None:
+async def send_video_parts(bot: Bot, chat_id, video: str, caption: str | None, parts: list[str] | None = None):
+    for group in part_media_groups(parts or [video], caption):
+        if len(group) == 1:
+            await bot.send_video(chat_id=chat_id, video=group[0].media, caption=group[0].caption, disable_notification=True)
+        else:
+            await bot.send_media_group(chat_id=chat_id, media=group, disable_notification=True)
+
+
+async def process_intent(bot: Bot, query: str, video: str, caption: str, state: BotState, parts: list[str] | None = None) -> Intent | None:
     intent = await state.pop_intent(query)
     if not intent:
         logger.warning("process_intent no intent found: %s", query)
         return None
     logger.info("process_intent: %s chat_ids=%s inline=%d messages=%d", query, intent.chat_ids, len(intent.inline_message_ids), len(intent.messages))
-    for item in intent.chat_ids:
-        try:
-            await bot.send_video(chat_id=item, video=video, caption=caption, disable_notification=True)
-        except Exception:
-            logger.error("process_intent chat_ids error: %s - %s", query, item, exc_info=True)
-    for item in intent.inline_message_ids:
-        try:
-            await bot.edit_message_media(inline_message_id=item, media=InputMediaVideo(media=video, caption=caption))
-        except Exception:
-            logger.error("process_intent inline_message_ids error: %s - %s", query, item, exc_info=True)
-    for item in intent.messages:
-        try:
-            await bot.edit_message_media(chat_id=item.chat, message_id=item.message, media=InputMediaVideo(media=video, caption=caption))
-        except Exception:
-            logger.error("process_intent messages error: %s - %s", query, item, exc_info=True)
+    with OPERATION_SECONDS.time(operation='fanout'):
+        for item in intent.chat_ids:
+            try:
+                await send_video_parts(bot, item, video, caption, parts)
+            except Exception:
+                OPERATION_FAILURES.inc(operation='fanout')
+                logger.error("process_intent chat_ids error: %s - %s", query, item, exc_info=True)
+        inline_caption = inline_parts_caption(bot, caption, parts)
+        for item in intent.inline_message_ids:
+            try:
+                await bot.edit_message_media(inline_message_id=item, media=InputMediaVideo(media=video, caption=inline_caption))
+            except Exception:
+                OPERATION_FAILURES.inc(operation='fanout')
+                logger.error("process_intent inline_message_ids error: %s - %s", query, item, exc_info=True)
+        for item in intent.messages:
+            try:
+                await bot.edit_message_media(chat_id=item.chat, message_id=item.message, media=InputMediaVideo(media=video, caption=caption))
+                if parts and len(parts) > 1:
+                    await send_video_parts(bot, item.chat, parts[1], None, parts[1:])
+            except Exception:
+                OPERATION_FAILURES.inc(operation='fanout')
+                logger.error("process_intent messages error: %s - %s", query, item, exc_info=True)
     return intent
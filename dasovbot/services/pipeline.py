@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from dasovbot.config import Config
+from dasovbot.constants import OUTCOME_CANCELLED, OUTCOME_ERROR
+from dasovbot.metrics import STAGE_SECONDS
+from dasovbot.models import IntentTrace, VideoInfo
+
+logger = logging.getLogger(__name__)
+
+STAGE_RESOLVE = 'resolve'
+STAGE_DOWNLOAD = 'download'
+STAGE_POSTPROCESS = 'postprocess'
+STAGE_UPLOAD = 'upload'
+STAGE_DELIVER = 'deliver'
+STAGES = (STAGE_RESOLVE, STAGE_DOWNLOAD, STAGE_POSTPROCESS, STAGE_UPLOAD, STAGE_DELIVER)
+
+
+@dataclass
+class PipelineJob:
+    query: str
+    info: VideoInfo | None = None
+    file_id: str | None = None
+    parts: list[str] = field(default_factory=list)
+    messages: list = field(default_factory=list)
+    stage: str = STAGE_RESOLVE
+    started: float = field(default_factory=time.monotonic)
+    source: str | None = None
+    created: float | None = None
+    spans: dict[str, tuple[float, float]] = field(default_factory=dict)
+    outcome: str | None = None
+    size: int | None = None
+    cancelled: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            'query': self.query,
+            'title': self.info.title if self.info else None,
+            'stage': self.stage,
+            'elapsed': time.monotonic() - self.started,
+        }
+
+    def to_trace(self, finished: float) -> IntentTrace:
+        # spans are stored as offsets from intent creation, rounded to milliseconds
+        starts = [start for start, _ in self.spans.values()]
+        created = self.created or min(starts, default=finished)
+        return IntentTrace(
+            query=self.query,
+            created=created,
+            finished=finished,
+            outcome=self.outcome,
+            source=self.source,
+            size=self.size,
+            format=self.info.format if self.info else None,
+            spans={
+                stage: [round(start - created, 3), round(end - created, 3)]
+                for stage, (start, end) in self.spans.items()
+            },
+        )
+
+
+StageHandler = Callable[[PipelineJob], Awaitable[str | None]]
+
+
+async def run_stage(handler: StageHandler, job: PipelineJob, stage: str) -> str | None:
+    job.stage = stage
+    started = time.time()
+    try:
+        return await handler(job)
+    finally:
+        finished = time.time()
+        job.spans[stage] = (started, finished)
+        STAGE_SECONDS.observe(finished - started, stage=stage)
+
+
+async def run_stages(handlers: dict[str, StageHandler], job: PipelineJob):
+    stage = job.stage
+    while stage:
+        stage = await run_stage(handlers[stage], job, stage)
+
+
+def stage_concurrency(config: Config) -> dict[str, int]:
+    upload = config.upload_concurrency
+    if config.storage_chat_id:
+        # helper bots add their own upload slots, see upload_pool.py
+        upload += len(config.helper_bot_tokens) * config.helper_upload_concurrency
+    return {
+        STAGE_RESOLVE: 2,
+        # downloads share one YoutubeDL instance behind the downloader lock
+        STAGE_DOWNLOAD: 1,
+        STAGE_POSTPROCESS: config.transcode_concurrency,
+        STAGE_UPLOAD: upload,
+        STAGE_DELIVER: 2,
+    }
+
+
+class Pipeline:
+    def __init__(self, handlers: dict[str, StageHandler], concurrency: dict[str, int], queue_size: int = 2,
+                 on_error: Callable[[PipelineJob], Awaitable] | None = None,
+                 on_done: Callable[[PipelineJob], Awaitable] | None = None):
+        self.handlers = handlers
+        self.concurrency = {stage: max(1, concurrency.get(stage, 1)) for stage in STAGES}
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error
+        self.on_done = on_done
+        self.jobs: dict[str, PipelineJob] = {}
+        self.active = {stage: 0 for stage in STAGES}
+        self.completed = 0
+        self.dropped = 0
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._slots: asyncio.Semaphore | None = None
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+
+    def __contains__(self, query: str) -> bool:
+        return query in self.jobs
+
+    def start(self):
+        self._queues = {stage: asyncio.Queue(self.queue_size) for stage in STAGES}
+        self._slots = asyncio.Semaphore(self.queue_size)
+        for stage in STAGES:
+            for index in range(self.concurrency[stage]):
+                self._workers.append(asyncio.create_task(self._worker(stage), name=f'pipeline_{stage}_{index}'))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def acquire(self):
+        await self._slots.acquire()
+
+    def release(self):
+        self._slots.release()
+
+    # stops the stage the job is in, or the job at its next stage; it then leaves through on_error
+    def cancel(self, query: str) -> bool:
+        job = self.jobs.get(query)
+        if not job:
+            return False
+        job.cancelled = True
+        running = self._running.get(query)
+        if running:
+            running.cancel()
+        return True
+
+    def submit(self, query: str) -> PipelineJob:
+        job = PipelineJob(query=query)
+        self.jobs[query] = job
+        self._queues[STAGE_RESOLVE].put_nowait(job)
+        return job
+
+    async def _worker(self, stage: str):
+        queue = self._queues[stage]
+        handler = self.handlers[stage]
+        while True:
+            job = await queue.get()
+            if stage == STAGE_RESOLVE:
+                self.release()
+            self.active[stage] += 1
+            next_stage = None
+            try:
+                if job.cancelled:
+                    raise asyncio.CancelledError
+                running = self._running[job.query] = asyncio.create_task(run_stage(handler, job, stage))
+                next_stage = await running
+            except asyncio.CancelledError:
+                # the worker itself being stopped is not a job cancellation
+                if not job.cancelled or asyncio.current_task().cancelling():
+                    raise
+                logger.warning("pipeline %s cancelled: %s", stage, job.query)
+                job.outcome = OUTCOME_CANCELLED
+                await self._on_error(job)
+            except Exception as e:
+                logger.error("pipeline %s error: %s", stage, job.query, exc_info=e)
+                job.outcome = OUTCOME_ERROR
+                await self._on_error(job)
+            finally:
+                self._running.pop(job.query, None)
+                self.active[stage] -= 1
+                queue.task_done()
+            if next_stage:
+                await self._queues[next_stage].put(job)
+                continue
+            self.jobs.pop(job.query, None)
+            if stage == STAGE_DELIVER:
+                self.completed += 1
+            else:
+                self.dropped += 1
+            if self.on_done:
+                try:
+                    await self.on_done(job)
+                except Exception:
+                    logger.error("pipeline on_done failed: %s", job.query, exc_info=True)
+
+    async def _on_error(self, job: PipelineJob):
+        if self.on_error:
+            try:
+                await self.on_error(job)
+            except Exception:
+                logger.error("pipeline on_error failed: %s", job.query, exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            'queue_size': self.queue_size,
+            'stages': [
+                {
+                    'name': stage,
+                    'workers': self.concurrency[stage],
+                    'active': self.active[stage],
+                    'queued': self._queues[stage].qsize() if self._queues else 0,
+                }
+                for stage in STAGES
+            ],
+            'jobs': [job.to_dict() for job in self.jobs.values()],
+            'completed': self.completed,
+            'dropped': self.dropped,
+        }
+
+
+_pipeline: Pipeline | None = None
+
+
+def init_pipeline(handlers: dict[str, StageHandler], config: Config,
+                  on_error: Callable[[PipelineJob], Awaitable] | None = None,
+                  on_done: Callable[[PipelineJob], Awaitable] | None = None) -> Pipeline:
+    global _pipeline
+    _pipeline = Pipeline(
+        handlers, stage_concurrency(config), queue_size=config.pipeline_queue_size,
+        on_error=on_error, on_done=on_done,
+    )
+    return _pipeline
+
+
+def get_pipeline() -> Pipeline | None:
+    return _pipeline
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from dataclasses import dataclass, field
+from functools import partial
+
+from telegram import Bot
+from telegram.ext import Application
+
+from dasovbot.config import Config
+from dasovbot.events import EVENT_INTENT_REMOVED
+from dasovbot.helpers import send_message_developer
+from dasovbot.leases import LeaseStore
+from dasovbot.media_budget import get_media_budget
+from dasovbot.models import Intent
+from dasovbot.persistence import gc_partial_downloads
+from dasovbot.services.intent_processor import abort_job, finish_job, stage_handlers
+from dasovbot.services.pipeline import Pipeline, PipelineJob, init_pipeline
+from dasovbot.state import BotState
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL_SEC = 1
+CLAIM_INTERVAL_SEC = 2
+
+
+@dataclass
+class WorkerState(BotState):
+    # only leased intents live in `intents`, and their writes go through the lease store
+    leases: LeaseStore = None
+    # leases another worker took over or the front removed; their jobs are cancelled
+    lost: set[str] = field(default_factory=set)
+
+    @classmethod
+    async def create(cls, config: Config) -> 'WorkerState':
+        state = await super().create(config)
+        state.leases = LeaseStore(state.db, config.worker_id, config.lease_sec)
+        return state
+
+    async def save_intent(self, key: str):
+        intent = self.intents.get(key)
+        if intent:
+            await self.leases.save_progress(key, intent)
+            self.touch('intents')
+
+    async def pop_intent(self, key: str) -> Intent | None:
+        self.intents.pop(key, None)
+        if key in self.lost:
+            return None
+        intent = await self.leases.complete(key)
+        if intent:
+            self.touch('intents')
+            self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
+        else:
+            logger.warning("worker lease lost before completion: %s", key)
+        return intent
+
+    async def download_paths(self) -> list[str]:
+        # other workers share the media folder, so keep every partial download in the database
+        from dasovbot.database import load_intents
+        return [intent.download.path for intent in (await load_intents(self.db)).values() if intent.download]
+
+
+@dataclass
+class FrontState(BotState):
+    # workers complete intents and write their progress, so the front reads an intent
+    # fresh before adding a requester and writes back only its own fields
+    async def load_intent(self, key: str) -> Intent | None:
+        from dasovbot.database import load_intent
+        intent = await load_intent(self.db, key)
+        if intent:
+            self.intents[key] = intent
+        elif self.intents.pop(key, None):
+            self.touch('intents')
+            self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
+        return intent
+
+    async def save_intent(self, key: str):
+        from dasovbot.database import merge_intent_requesters
+        intent = self.intents.get(key)
+        if not intent:
+            return
+        if await merge_intent_requesters(self.db, key, intent):
+            self.touch('intents')
+            self.publish_intent(key)
+        else:
+            logger.warning("front intent completed by a worker before the update: %s", key)
+            self.intents.pop(key, None)
+            self.touch('intents')
+            self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
+
+    async def pop_intent(self, key: str) -> Intent | None:
+        from dasovbot.database import delete_unleased_intent
+        if not await delete_unleased_intent(self.db, key):
+            if await self.load_intent(key):
+                logger.info("front intent leased by a worker, kept: %s", key)
+            return None
+        intent = self.intents.pop(key, None)
+        self.touch('intents')
+        self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
+        return intent
+
+    async def retry_intent(self, key: str):
+        from dasovbot.database import clear_intent_ignored
+        intent = self.intents.get(key)
+        if intent:
+            intent.ignored = False
+            await clear_intent_ignored(self.db, key)
+            self.touch('intents')
+            self.publish_intent(key)
+
+
+async def sync_videos(state: BotState, rowid: int) -> int:
+    from dasovbot.database import load_videos_since
+    videos, rowid = await load_videos_since(state.db, rowid)
+    state.add_videos(videos)
+    return rowid
+
+
+async def sync_shared_state(state: BotState, intents: bool = True):
+    # new videos from other processes, and for the front process all intent changes
+    from dasovbot.database import data_version, max_video_rowid
+    rowid = await max_video_rowid(state.db)
+    version = await data_version(state.db)
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL_SEC)
+        if intents:
+            # intents are processed by workers; drop the local wake-ups nobody waits for
+            while not state.download_queue.empty():
+                state.download_queue.get_nowait()
+        current = await data_version(state.db)
+        if current == version:
+            continue
+        version = current
+        rowid = await sync_videos(state, rowid)
+        if intents:
+            await state.reload_intents()
+
+
+async def finish_leased_job(job: PipelineJob, state: WorkerState):
+    await finish_job(job, state)
+    if job.query in state.lost:
+        state.lost.discard(job.query)
+        state.intents.pop(job.query, None)
+        return
+    # deferred and ignored intents stay in the store for another attempt or the dashboard
+    if state.intents.pop(job.query, None) is not None:
+        await state.leases.release(job.query)
+
+
+async def renew_leases(state: WorkerState, pipeline: Pipeline):
+    while True:
+        await asyncio.sleep(state.leases.lease_sec / 3)
+        held = list(pipeline.jobs)
+        kept = await state.leases.renew(held)
+        for key in set(held) - kept:
+            # another worker may have claimed it already; stop before the video is sent twice
+            logger.warning("worker lease lost, cancelling: %s", key)
+            if pipeline.cancel(key):
+                state.lost.add(key)
+
+
+async def claim_next(state: WorkerState) -> str:
+    while True:
+        budget = get_media_budget()
+        waiting = sorted(key for key, size in budget.deferred.items() if not budget.fits(size))
+        claimed = await state.leases.claim(exclude=waiting)
+        if claimed:
+            key, intent = claimed
+            state.intents[key] = intent
+            state.lost.discard(key)
+            return key
+        try:
+            # finish_job wakes this up early, e.g. when freed media space lets deferred intents fit
+            await asyncio.wait_for(state.download_queue.get(), CLAIM_INTERVAL_SEC)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def process_leased_intents(bot: Bot, state: WorkerState):
+    pipeline = init_pipeline(
+        stage_handlers(bot, state), state.config,
+        on_error=partial(abort_job, state=state), on_done=partial(finish_leased_job, state=state),
+    )
+    pipeline.start()
+    heartbeat = asyncio.create_task(renew_leases(state, pipeline), name='renew_leases')
+    try:
+        while True:
+            await pipeline.acquire()
+            state.mark_task('monitor_process_intents')
+            pipeline.submit(await claim_next(state))
+    finally:
+        heartbeat.cancel()
+        await pipeline.stop()
+        state.intents.clear()
+        await state.leases.release_all()
+
+
+async def monitor_leased_intents(bot: Bot, state: WorkerState):
+    from dasovbot.constants import INTERVAL_SEC
+    while True:
+        gc_partial_downloads(state.config.media_folder, await state.download_paths())
+        try:
+            await process_leased_intents(bot, state)
+        except Exception as e:
+            logger.error("process_leased_intents crashed: %s, %s", type(e).__name__, str(e), exc_info=e)
+        await asyncio.sleep(INTERVAL_SEC)
+        await send_message_developer(bot, '[error_monitor_process_intents]', state.config.developer_id)
+
+
+async def run_worker(application: Application, state: WorkerState):
+    # Telegram updates are left to the front process
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # leases held under this id before a restart are stale
+    await state.leases.release_all()
+    state.intents.clear()
+    async with application:
+        tasks = [
+            asyncio.create_task(monitor_leased_intents(application.bot, state), name='monitor_leased_intents'),
+            asyncio.create_task(sync_shared_state(state, intents=False), name='sync_shared_state'),
+        ]
+        logger.info("Worker %s started", state.leases.owner)
+        await stop.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
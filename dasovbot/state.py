@@ -1,11 +1,16 @@
 import asyncio
 import logging
+from collections import Counter
 from dataclasses import dataclass, field
 
 import aiosqlite
 
 from dasovbot.config import Config
-from dasovbot.models import VideoInfo, Intent, Subscription, TemporaryInlineQuery
+from dasovbot.events import EVENT_COUNTS, EVENT_INTENT, EVENT_INTENT_REMOVED, EVENT_TASK, EventBus, intent_event
+from dasovbot.fingerprint import FingerprintIndex
+from dasovbot.helpers import now
+from dasovbot.models import VideoInfo, Intent, IntentTrace, Subscription, TemporaryInlineQuery
+from dasovbot.search import VideoIndex
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +22,16 @@ class BotState:
     subscriptions: dict[str, Subscription] = field(default_factory=dict)
     intents: dict[str, Intent] = field(default_factory=dict)
     temporary_inline_queries: dict[str, TemporaryInlineQuery] = field(default_factory=dict)
+    inline_results: dict[str, dict] = field(default_factory=dict)
+    video_index: VideoIndex = field(default_factory=VideoIndex)
+    fingerprint_index: FingerprintIndex = field(default_factory=FingerprintIndex)
+    events: EventBus = field(default_factory=EventBus)
+    versions: Counter = field(default_factory=Counter)
+    inline_extractions: dict[int, asyncio.Task] = field(default_factory=dict)
     download_queue: asyncio.Queue = field(default_factory=asyncio.Queue)
     config: Config = field(default=None)
     animation_file_id: str | None = None
+    local_upload_unavailable: bool = False
     background_task_status: dict[str, str] = field(default_factory=dict)
     migration_progress: dict = field(default_factory=dict)
     db: aiosqlite.Connection = field(default=None)
@@ -42,9 +54,13 @@ class BotState:
         await migrate_from_json(self.db, self.config, self.migration_progress)
 
         self.videos = await load_videos(self.db)
+        for key, video in self.videos.items():
+            self.video_index.add(video, key)
+            self.fingerprint_index.add(video)
         self.users = await load_users(self.db)
         self.subscriptions = await load_subscriptions(self.db)
         self.intents = await load_intents(self.db)
+        self.touch('videos', 'users', 'subscriptions', 'intents')
 
     @classmethod
     async def from_database(cls, config: Config) -> 'BotState':
@@ -52,42 +68,142 @@ class BotState:
         await state.migrate_and_load()
         return state
 
+    def touch(self, *collections: str):
+        # API ETags are derived from these counters
+        for collection in collections:
+            self.versions[collection] += 1
+
+    def publish_intent(self, key: str):
+        intent = self.intents.get(key)
+        if intent:
+            self.events.publish(EVENT_INTENT, intent_event(key, intent, self.videos.get(key)) if self.events.listening else None)
+
+    def publish_counts(self):
+        self.events.publish(EVENT_COUNTS, {
+            'video_count': len(self.videos),
+            'subscription_count': len(self.subscriptions),
+            'user_count': len(self.users),
+        })
+
+    def mark_task(self, name: str):
+        self.background_task_status[name] = now()
+        self.events.publish(EVENT_TASK, {'name': name, 'last_run': self.background_task_status[name]})
+
     async def set_video(self, key: str, video: VideoInfo):
         from dasovbot.database import upsert_video
+        is_new = key not in self.videos
         self.videos[key] = video
+        self.video_index.add(video, key)
+        self.fingerprint_index.add(video)
         await upsert_video(self.db, key, video)
+        self.touch('videos')
+        if is_new:
+            self.publish_counts()
 
     async def set_intent(self, key: str, intent: Intent):
         from dasovbot.database import upsert_intent
         self.intents[key] = intent
         await upsert_intent(self.db, key, intent)
+        self.touch('intents')
+        self.publish_intent(key)
+
+    async def load_intent(self, key: str) -> Intent | None:
+        return self.intents.get(key)
 
     async def save_intent(self, key: str):
         from dasovbot.database import upsert_intent
         intent = self.intents.get(key)
         if intent:
             await upsert_intent(self.db, key, intent)
+            self.touch('intents')
+            self.publish_intent(key)
+
+    async def retry_intent(self, key: str):
+        intent = self.intents.get(key)
+        if intent:
+            intent.ignored = False
+            await self.save_intent(key)
+
+    async def reload_intents(self):
+        # intent changes committed by worker processes
+        from dasovbot.database import load_intents
+        intents = await load_intents(self.db)
+        changed = [
+            key for key, intent in intents.items()
+            if key not in self.intents or self.intents[key].to_dict() != intent.to_dict()
+        ]
+        removed = [key for key in self.intents if key not in intents]
+        for key in changed:
+            self.intents[key] = intents[key]
+        for key in removed:
+            self.intents.pop(key, None)
+        if changed or removed:
+            self.touch('intents')
+        for key in changed:
+            self.publish_intent(key)
+        for key in removed:
+            self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
+
+    def add_videos(self, videos: dict[str, VideoInfo]):
+        # videos another process has already stored
+        for key, video in videos.items():
+            self.videos[key] = video
+            self.video_index.add(video, key)
+            self.fingerprint_index.add(video)
+        if videos:
+            self.touch('videos')
+            self.publish_counts()
 
     async def pop_intent(self, key: str) -> Intent | None:
         from dasovbot.database import delete_intent
         intent = self.intents.pop(key, None)
         await delete_intent(self.db, key)
+        if intent:
+            self.touch('intents')
+            self.events.publish(EVENT_INTENT_REMOVED, {'url': key})
         return intent
 
+    async def download_paths(self) -> list[str]:
+        return [intent.download.path for intent in self.intents.values() if intent.download]
+
+    def set_inline_results(self, query: str, inline_queries: dict):
+        tiq = self.temporary_inline_queries.get(query)
+        if tiq:
+            for result_id in tiq.inline_queries:
+                self.inline_results.pop(result_id, None)
+        for result_id, data in inline_queries.items():
+            self.inline_results[result_id] = {**data, 'query': query}
+
+    def pop_temporary_inline_query(self, query: str) -> TemporaryInlineQuery | None:
+        tiq = self.temporary_inline_queries.pop(query, None)
+        if tiq:
+            for result_id in tiq.inline_queries:
+                self.inline_results.pop(result_id, None)
+        return tiq
+
     async def set_user(self, chat_id: str, data: dict):
         from dasovbot.database import upsert_user
+        is_new = chat_id not in self.users
         self.users[chat_id] = data
         await upsert_user(self.db, chat_id, data)
+        self.touch('users')
+        if is_new:
+            self.publish_counts()
 
     async def set_subscription(self, key: str, sub: Subscription):
         from dasovbot.database import upsert_subscription
         self.subscriptions[key] = sub
         await upsert_subscription(self.db, key, sub)
+        self.touch('subscriptions')
+        self.publish_counts()
 
     async def pop_subscription(self, key: str) -> Subscription | None:
         from dasovbot.database import delete_subscription
         sub = self.subscriptions.pop(key, None)
         await delete_subscription(self.db, key)
+        if sub:
+            self.touch('subscriptions')
+            self.publish_counts()
         return sub
 
     async def add_subscriber(self, key: str, chat_id: str):
@@ -96,6 +212,7 @@ class BotState:
         if sub and chat_id not in sub.chat_ids:
             sub.chat_ids.append(chat_id)
             await upsert_subscription(self.db, key, sub)
+            self.touch('subscriptions')
 
     async def remove_subscriber(self, key: str, chat_id: str):
         from dasovbot.database import upsert_subscription, delete_subscription
@@ -103,12 +220,18 @@ class BotState:
         if not sub:
             return
         sub.chat_ids[:] = (item for item in sub.chat_ids if item != chat_id)
+        self.touch('subscriptions')
         if not sub.chat_ids:
             self.subscriptions.pop(key, None)
             await delete_subscription(self.db, key)
+            self.publish_counts()
         else:
             await upsert_subscription(self.db, key, sub)
 
+    async def add_trace(self, trace: IntentTrace):
+        from dasovbot.database import insert_trace
+        await insert_trace(self.db, trace, self.config.trace_retention_days * 86400)
+
     async def close(self):
         if self.db:
             await self.db.close()
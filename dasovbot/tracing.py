@@ -0,0 +1,56 @@
+import math
+
+from dasovbot.models import IntentTrace
+
+TRACE_QUEUED = 'queued'
+TRACE_TOTAL = 'total'
+PERCENTILES = (50, 95, 99)
+
+
+# nearest-rank percentile of already sorted values
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def trace_durations(trace: IntentTrace) -> dict[str, float]:
+    durations = {}
+    first_start = min((start for start, _ in trace.spans.values()), default=0.0)
+    if first_start > 0:
+        # time from append_intent until the scheduler picked the intent
+        durations[TRACE_QUEUED] = first_start
+    for stage, (start, end) in trace.spans.items():
+        durations[stage] = end - start
+    durations[TRACE_TOTAL] = trace.total
+    return durations
+
+
+def latency_breakdown(traces: list[IntentTrace], stages: tuple[str, ...]) -> list[dict]:
+    samples: dict[tuple[str, str], list[float]] = {}
+    for trace in traces:
+        source = trace.source or 'unknown'
+        for stage, duration in trace_durations(trace).items():
+            samples.setdefault((stage, 'all'), []).append(duration)
+            samples.setdefault((stage, source), []).append(duration)
+    known = (TRACE_QUEUED, *stages)
+    extra = sorted({stage for stage, _ in samples} - {*known, TRACE_TOTAL})
+    rows = []
+    for stage in (*known, *extra, TRACE_TOTAL):
+        sources = sorted(source for key, source in samples if key == stage and source != 'all')
+        for source in ('all', *sources):
+            values = sorted(samples.get((stage, source), ()))
+            if not values:
+                continue
+            rows.append({
+                'stage': stage,
+                'source': source,
+                'count': len(values),
+                **{f'p{q}': percentile(values, q) for q in PERCENTILES},
+            })
+    return rows
+
+
+def slowest_traces(traces: list[IntentTrace], limit: int = 20) -> list[IntentTrace]:
+    return sorted(traces, key=lambda trace: trace.total, reverse=True)[:limit]
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from dasovbot.config import Config
+from dasovbot.constants import TIMEOUT_SEC
+from dasovbot.metrics import OPERATION_FAILURES, OPERATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def transcode_preset(duration: int) -> str:
+    if duration <= 10 * 60:
+        return 'fast'
+    if duration <= 60 * 60:
+        return 'veryfast'
+    return 'ultrafast'
+
+
+def parse_progress_line(line: str) -> float | None:
+    key, _, value = line.strip().partition('=')
+    if key not in ('out_time_us', 'out_time_ms'):
+        return None
+    try:
+        # ffmpeg reports out_time_ms in microseconds as well
+        return int(value) / 1_000_000
+    except ValueError:
+        return None
+
+
+@dataclass
+class TranscodeJob:
+    id: int
+    input_path: str
+    kind: str
+    duration: int = 0
+    started: float = field(default_factory=time.monotonic)
+    position: float = 0.0
+
+    @property
+    def progress(self) -> float:
+        if not self.duration:
+            return 0.0
+        return min(1.0, self.position / self.duration)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'filename': os.path.basename(self.input_path),
+            'kind': self.kind,
+            'duration': self.duration,
+            'progress': self.progress,
+            'elapsed': time.monotonic() - self.started,
+        }
+
+
+class TranscodePool:
+    def __init__(self, concurrency: int = 1, nice: int = 10):
+        self.concurrency = max(1, concurrency)
+        self.nice = nice
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='transcode')
+        self._semaphore: asyncio.Semaphore | None = None
+        self._ids = itertools.count(1)
+        self._nice = shutil.which('nice')
+        self._ionice = shutil.which('ionice')
+        self.queued = 0
+        self.active: dict[int, TranscodeJob] = {}
+        self.completed = 0
+        self.failed = 0
+        self.media_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def _command(self, input_path: str, output_path: str, args: list[str], segmented: bool = False) -> list[str]:
+        # the segment muxer takes mp4 flags through -segment_format_options
+        movflags = ['-segment_format_options', 'movflags=+faststart'] if segmented else ['-movflags', '+faststart']
+        command = [
+            'ffmpeg', '-y', '-nostats', '-progress', 'pipe:1', '-i', input_path,
+            '-map', '0:v:0?', '-map', '0:a:0?', *args, *movflags, output_path,
+        ]
+        if self.nice and self._nice:
+            command = [self._nice, '-n', str(self.nice), *command]
+        if self._ionice:
+            command = [self._ionice, '-c', '2', '-n', '7', *command]
+        return command
+
+    def _run(self, job: TranscodeJob, input_path: str, output_path: str, args: list[str], segmented: bool = False) -> bool:
+        timeout = max(TIMEOUT_SEC, job.duration * 2)
+        try:
+            process = subprocess.Popen(
+                self._command(input_path, output_path, args, segmented),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+        except OSError:
+            return False
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                position = parse_progress_line(line)
+                if position is not None:
+                    job.position = position
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+        if segmented:
+            return returncode == 0
+        if returncode != 0:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return False
+        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+
+    async def run(self, input_path: str, output_path: str, args: list[str], duration: int = 0, kind: str = 'transcode', segmented: bool = False) -> bool:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        job = TranscodeJob(id=next(self._ids), input_path=input_path, kind=kind, duration=duration)
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        job.started = time.monotonic()
+        self.active[job.id] = job
+        try:
+            loop = asyncio.get_running_loop()
+            ok = await loop.run_in_executor(self._executor, self._run, job, input_path, output_path, args, segmented)
+        finally:
+            self.active.pop(job.id, None)
+            elapsed = time.monotonic() - job.started
+            self.busy_seconds += elapsed
+            OPERATION_SECONDS.observe(elapsed, operation=kind)
+            self._semaphore.release()
+        if ok:
+            self.completed += 1
+            self.media_seconds += duration
+        else:
+            self.failed += 1
+            OPERATION_FAILURES.inc(operation=kind)
+        return ok
+
+    def stats(self) -> dict:
+        return {
+            'concurrency': self.concurrency,
+            'nice': self.nice,
+            'queued': self.queued,
+            'active': [job.to_dict() for job in self.active.values()],
+            'completed': self.completed,
+            'failed': self.failed,
+            'media_seconds': self.media_seconds,
+            'busy_seconds': self.busy_seconds,
+            'speed': self.media_seconds / self.busy_seconds if self.busy_seconds else 0.0,
+        }
+
+
+_pool: TranscodePool | None = None
+
+
+def init_transcoder(config: Config):
+    global _pool
+    _pool = TranscodePool(concurrency=config.transcode_concurrency, nice=config.transcode_nice)
+
+
+def get_transcoder() -> TranscodePool:
+    global _pool
+    if _pool is None:
+        _pool = TranscodePool()
+    return _pool
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from telegram import Bot, Message
+from telegram.error import Forbidden, InvalidToken, RetryAfter
+from telegram.request import HTTPXRequest
+
+from dasovbot.config import Config
+from dasovbot.metrics import UPLOADS
+
+logger = logging.getLogger(__name__)
+
+MAIN = 'main'
+# cooldown after consecutive failures: 30 s, 60 s, 120 s ... capped at 30 minutes
+COOLDOWN_BASE_SEC = 30
+COOLDOWN_MAX_SEC = 30 * 60
+
+# sends a video with the given bot to the given chat
+Send = Callable[[Bot, str], Awaitable[Message]]
+
+
+@dataclass
+class Uploader:
+    name: str
+    bot: Bot | None
+    concurrency: int
+    active: int = 0
+    uploads: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    last_error: str = ''
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def succeeded(self):
+        self.uploads += 1
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def failed(self, error: Exception):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = f'{type(error).__name__}: {error}'
+        if isinstance(error, RetryAfter):
+            cooldown = error.retry_after.total_seconds() if hasattr(error.retry_after, 'total_seconds') else error.retry_after
+        elif isinstance(error, (Forbidden, InvalidToken)):
+            # the helper was removed from the storage chat or its token revoked
+            cooldown = COOLDOWN_MAX_SEC
+        else:
+            cooldown = min(COOLDOWN_BASE_SEC * 2 ** (self.consecutive_failures - 1), COOLDOWN_MAX_SEC)
+        self.cooldown_until = time.monotonic() + cooldown
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'uploads': self.uploads,
+            'failures': self.failures,
+            'healthy': self.healthy,
+            'cooldown': max(0.0, self.cooldown_until - time.monotonic()),
+            'last_error': self.last_error,
+        }
+
+
+# a helper uploads to the storage chat and the main bot forwards the message to the developer
+# chat for a file_id of its own; forwarding doesn't transfer the file again
+class UploadPool:
+    def __init__(self, helpers: list[Bot], storage_chat_id: str, target_chat_id: str,
+                 concurrency: int = 2, helper_concurrency: int = 1):
+        self.storage_chat_id = storage_chat_id
+        self.target_chat_id = target_chat_id
+        self.uploaders = [Uploader(MAIN, None, max(1, concurrency))] + [
+            Uploader(f'helper{index}', bot, max(1, helper_concurrency)) for index, bot in enumerate(helpers, 1)
+        ]
+        self._changed: asyncio.Condition | None = None
+
+    @property
+    def capacity(self) -> int:
+        return sum(uploader.concurrency for uploader in self.uploaders)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _pick(self, main_only: bool = False) -> Uploader | None:
+        uploaders = self.uploaders[:1] if main_only else self.uploaders
+        free = [u for u in uploaders if u.active < u.concurrency and u.healthy]
+        if not free:
+            return None
+        # least loaded first; the main bot wins ties because it needs no forward
+        return min(free, key=lambda u: u.active / u.concurrency)
+
+    async def acquire(self, main_only: bool = False) -> Uploader:
+        changed = self._condition()
+        async with changed:
+            uploader = self._pick(main_only)
+            while uploader is None:
+                try:
+                    # a helper coming out of its cooldown doesn't notify, so poll as well
+                    await asyncio.wait_for(changed.wait(), COOLDOWN_BASE_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                uploader = self._pick(main_only)
+            uploader.active += 1
+            return uploader
+
+    async def release(self, uploader: Uploader):
+        changed = self._condition()
+        async with changed:
+            uploader.active -= 1
+            changed.notify_all()
+
+    async def upload(self, bot: Bot, send: Send) -> Message:
+        uploader = await self.acquire()
+        try:
+            if uploader.bot is None:
+                return await self._upload(bot, send, uploader)
+            try:
+                return await self._upload_via_helper(bot, send, uploader)
+            except Exception as e:
+                logger.warning("upload_pool %s failed, uploading with the main bot: %s: %s", uploader.name, type(e).__name__, e)
+        finally:
+            await self.release(uploader)
+        # the retry waits for a main bot slot like any other main upload
+        main = await self.acquire(main_only=True)
+        try:
+            return await self._upload(bot, send, main)
+        finally:
+            await self.release(main)
+
+    async def _upload(self, bot: Bot, send: Send, uploader: Uploader) -> Message:
+        try:
+            message = await send(bot, self.target_chat_id)
+        except Exception:
+            UPLOADS.inc(uploader=uploader.name, result='failed')
+            uploader.failures += 1
+            raise
+        UPLOADS.inc(uploader=uploader.name, result='uploaded')
+        uploader.uploads += 1
+        return message
+
+    async def _upload_via_helper(self, bot: Bot, send: Send, uploader: Uploader) -> Message:
+        try:
+            await uploader.bot.initialize()
+            stored = await send(uploader.bot, self.storage_chat_id)
+            try:
+                message = await bot.forward_message(
+                    chat_id=self.target_chat_id,
+                    from_chat_id=stored.chat_id,
+                    message_id=stored.message_id,
+                    disable_notification=True,
+                )
+            finally:
+                try:
+                    await uploader.bot.delete_message(chat_id=stored.chat_id, message_id=stored.message_id)
+                except Exception:
+                    pass
+        except Exception as e:
+            UPLOADS.inc(uploader=uploader.name, result='failed')
+            uploader.failed(e)
+            raise
+        UPLOADS.inc(uploader=uploader.name, result='uploaded')
+        uploader.succeeded()
+        return message
+
+    def stats(self) -> dict:
+        return {
+            'capacity': self.capacity,
+            'active': sum(uploader.active for uploader in self.uploaders),
+            'uploaders': [uploader.to_dict() for uploader in self.uploaders],
+        }
+
+
+_pool: UploadPool | None = None
+
+
+def init_upload_pool(config: Config):
+    global _pool
+    if not config.helper_bot_tokens or not config.storage_chat_id:
+        _pool = None
+        return
+    helpers = [
+        Bot(token, base_url=config.base_url, local_mode=config.local_mode, request=HTTPXRequest(read_timeout=config.read_timeout))
+        for token in config.helper_bot_tokens
+    ]
+    _pool = UploadPool(
+        helpers, config.storage_chat_id, config.developer_chat_id,
+        concurrency=config.upload_concurrency, helper_concurrency=config.helper_upload_concurrency,
+    )
+
+
+def get_upload_pool() -> UploadPool | None:
+    return _pool
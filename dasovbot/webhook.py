@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from dasovbot.config import Config
+from dasovbot.constants import WEBHOOK_PATH
+from dasovbot.metrics import WEBHOOK_UPDATES
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# updates accepted but not yet picked up by a handler; past this Telegram is told to retry later
+MAX_PENDING_UPDATES = 256
+
+
+# updates POSTed by the Bot API server go to the application's update queue; when it is full
+# the delivery is refused with 503 and redelivered later instead of piling up in memory
+class WebhookReceiver:
+    def __init__(self, secret: str, max_pending: int = MAX_PENDING_UPDATES):
+        self.secret = secret
+        self.max_pending = max_pending
+        self.application: Application | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, '')
+        if not secrets.compare_digest(token.encode(), self.secret.encode()):
+            WEBHOOK_UPDATES.inc(result='forbidden')
+            logger.warning('Webhook request with a wrong secret token from %s', request.remote)
+            raise web.HTTPForbidden()
+        if self.application is None:
+            WEBHOOK_UPDATES.inc(result='busy')
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'})
+        queue = self.application.update_queue
+        if queue.qsize() >= self.max_pending:
+            WEBHOOK_UPDATES.inc(result='busy')
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'})
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            WEBHOOK_UPDATES.inc(result='invalid')
+            raise web.HTTPBadRequest()
+        queue.put_nowait(update)
+        WEBHOOK_UPDATES.inc(result='accepted')
+        return web.Response()
+
+
+async def serve_webhook(application: Application, config: Config, stop: asyncio.Event | None = None):
+    # the counterpart of run_polling; the route itself is served by the dashboard's aiohttp server
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+    receiver = get_webhook()
+    url = f'{config.webhook_url.rstrip("/")}{WEBHOOK_PATH}'
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        # kept on shutdown, so the Bot API server holds updates until the next start
+        await application.bot.set_webhook(
+            url,
+            secret_token=receiver.secret,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.webhook_concurrency,
+        )
+        receiver.application = application
+        logger.info('Receiving updates via webhook at %s', url)
+        await stop.wait()
+    finally:
+        receiver.application = None
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+
+
+_receiver: WebhookReceiver | None = None
+
+
+def init_webhook(config: Config):
+    global _receiver
+    # a generated secret is fine: set_webhook registers it again on every start
+    _receiver = WebhookReceiver(config.webhook_secret or secrets.token_urlsafe(32)) if config.webhook_url else None
+
+
+def get_webhook() -> WebhookReceiver | None:
+    return _receiver
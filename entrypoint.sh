@@ -3,4 +3,7 @@ if [ -n "$BACKUP_CRON" ]; then
   echo "$BACKUP_CRON /usr/local/bin/python /project/backup.py >> /proc/1/fd/1 2>&1" | crontab -
   cron
 fi
+if [ "$DASHBOARD_MODE" = "process" ] && [ "$ROLE" != "worker" ]; then
+  python -m dasovbot.dashboard &
+fi
 exec python main.py
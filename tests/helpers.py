@@ -24,9 +24,10 @@ def make_message(chat_id=123, text='', from_user=None):
     return message
 
 
-def make_inline_query(query='', from_user=None):
+def make_inline_query(query='', from_user=None, offset=''):
     iq = AsyncMock()
     iq.query = query
+    iq.offset = offset
     iq.from_user = from_user or make_user()
     return iq
 
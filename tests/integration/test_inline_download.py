@@ -17,8 +17,7 @@ from telegram import InlineQueryResultCachedVideo
 
 from dasovbot.downloader import extract_info, extract_url, process_info, get_ydl
 from dasovbot.handlers.inline import inline_video, inline_query_handler, chosen_query
-from dasovbot.helpers import now
-from dasovbot.models import VideoInfo, TemporaryInlineQuery
+from dasovbot.models import VideoInfo
 from tests.integration.base import IntegrationTestBase
 
 
@@ -251,13 +250,8 @@ class TestChosenQuery(IntegrationTestBase):
 
         result_id = str(uuid4())
 
-        # Populate temporary_inline_queries so title lookup works
-        tiq = TemporaryInlineQuery(timestamp=now())
-        mock_result = MagicMock()
-        mock_result.id = result_id
-        mock_result.title = info.title
-        tiq.results = [mock_result]
-        self.state.temporary_inline_queries[url] = tiq
+        # Populate inline_results so title lookup works
+        self.state.inline_results[result_id] = {'query': url, 'url': url, 'title': info.title, 'upload_date': info.upload_date}
 
         inline_result = MagicMock()
         inline_result.result_id = result_id
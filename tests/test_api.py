@@ -0,0 +1,129 @@
+import json
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from dasovbot.dashboard.api import (
+    api_intents, api_subscriptions, api_system, api_videos, decode_cursor, encode_cursor,
+)
+from dasovbot.dashboard.views import make_etag, not_modified
+from dasovbot.models import Intent, Subscription, VideoInfo
+from tests.helpers import make_state
+
+
+def make_request(state, path, headers=None):
+    return make_mocked_request('GET', path, headers=headers or {}, app={'state': state})
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+class TestCursor(unittest.TestCase):
+    def test_round_trip(self):
+        key = [3, 'https://example.com/?v=1']
+        self.assertEqual(decode_cursor(encode_cursor(key)), key)
+        self.assertNotIn('=', encode_cursor(key))
+
+    def test_empty(self):
+        self.assertIsNone(decode_cursor(''))
+
+    def test_invalid(self):
+        for cursor in ('!!!', 'bm90IGpzb24', 'eyJhIjoxfQ'):
+            with self.assertRaises(web.HTTPBadRequest):
+                decode_cursor(cursor)
+
+
+class TestEtag(unittest.TestCase):
+    def test_changes_with_version_and_query(self):
+        state = make_state()
+        first = make_etag(make_request(state, '/api/v1/videos'), state, 'videos')
+        self.assertEqual(first, make_etag(make_request(state, '/api/v1/videos'), state, 'videos'))
+        self.assertNotEqual(first, make_etag(make_request(state, '/api/v1/videos?limit=2'), state, 'videos'))
+        state.touch('videos')
+        self.assertNotEqual(first, make_etag(make_request(state, '/api/v1/videos'), state, 'videos'))
+
+    def test_not_modified(self):
+        state = make_state()
+        self.assertTrue(not_modified(make_request(state, '/', {'If-None-Match': 'W/"a", "b"'}), '"a"'))
+        self.assertTrue(not_modified(make_request(state, '/', {'If-None-Match': '*'}), '"a"'))
+        self.assertFalse(not_modified(make_request(state, '/', {'If-None-Match': '"b"'}), '"a"'))
+        self.assertFalse(not_modified(make_request(state, '/'), '"a"'))
+
+
+class TestApiIntents(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.state = make_state(intents={
+            'a': Intent(priority=1),
+            'b': Intent(priority=5),
+            'c': Intent(priority=3),
+            'd': Intent(priority=9, ignored=True),
+        })
+
+    async def test_cursor_pages(self):
+        first = body(await api_intents(make_request(self.state, '/api/v1/intents?limit=2')))
+        self.assertEqual([item['url'] for item in first['items']], ['b', 'c'])
+        self.assertEqual(first['total'], 3)
+        second = body(await api_intents(make_request(self.state, f'/api/v1/intents?limit=2&cursor={first["next_cursor"]}')))
+        self.assertEqual([item['url'] for item in second['items']], ['a'])
+        self.assertIsNone(second['next_cursor'])
+
+    async def test_cursor_survives_removal(self):
+        first = body(await api_intents(make_request(self.state, '/api/v1/intents?limit=1')))
+        del self.state.intents['b']
+        second = body(await api_intents(make_request(self.state, f'/api/v1/intents?limit=1&cursor={first["next_cursor"]}')))
+        self.assertEqual([item['url'] for item in second['items']], ['c'])
+
+    async def test_status_filter(self):
+        response = body(await api_intents(make_request(self.state, '/api/v1/intents?status=ignored')))
+        self.assertEqual([item['url'] for item in response['items']], ['d'])
+        with self.assertRaises(web.HTTPBadRequest):
+            await api_intents(make_request(self.state, '/api/v1/intents?status=nope'))
+
+    async def test_not_modified_until_state_changes(self):
+        response = await api_intents(make_request(self.state, '/api/v1/intents'))
+        etag = response.headers['ETag']
+        with self.assertRaises(web.HTTPNotModified) as ctx:
+            await api_intents(make_request(self.state, '/api/v1/intents', {'If-None-Match': etag}))
+        self.assertEqual(ctx.exception.headers['ETag'], etag)
+        self.state.touch('intents')
+        response = await api_intents(make_request(self.state, '/api/v1/intents', {'If-None-Match': etag}))
+        self.assertEqual(response.status, 200)
+
+
+class TestApiVideos(unittest.IsolatedAsyncioTestCase):
+    async def test_sorted_and_filtered(self):
+        state = make_state(videos={
+            'x': VideoInfo(title='Cat', file_id='f1', processed_at='20240102_000000', upload_date='20230101'),
+            'y': VideoInfo(title='Dog', file_id='f2', processed_at='20240101_000000', upload_date='20230202'),
+            'z': VideoInfo(title='Cat 2'),
+        })
+        response = body(await api_videos(make_request(state, '/api/v1/videos')))
+        self.assertEqual([item['url'] for item in response['items']], ['x', 'y'])
+        response = body(await api_videos(make_request(state, '/api/v1/videos?sort=upload_date&q=cat')))
+        self.assertEqual([item['url'] for item in response['items']], ['x'])
+        with self.assertRaises(web.HTTPBadRequest):
+            await api_videos(make_request(state, '/api/v1/videos?sort=title'))
+
+
+class TestApiSubscriptions(unittest.IsolatedAsyncioTestCase):
+    async def test_subscriber_labels(self):
+        state = make_state(
+            subscriptions={'s': Subscription(chat_ids=['1', '2'], title='Channel')},
+            users={'1': {'first_name': 'Ann', 'last_name': 'Lee'}},
+        )
+        [item] = body(await api_subscriptions(make_request(state, '/api/v1/subscriptions')))['items']
+        self.assertEqual(item['subscribers'], [{'id': '1', 'label': 'Ann Lee (1)'}, {'id': '2', 'label': '2'}])
+        self.assertNotIn('chat_ids', item)
+
+
+class TestApiSystem(unittest.IsolatedAsyncioTestCase):
+    async def test_no_etag(self):
+        response = await api_system(make_request(make_state(), '/api/v1/system'))
+        self.assertNotIn('ETag', response.headers)
+        self.assertIn('queue_size', body(response))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,7 @@ from unittest.mock import MagicMock
 
 from telegram.ext import ConversationHandler
 
-from tests.helpers import make_user, make_message, make_update, make_context
+from tests.helpers import make_user, make_message, make_update, make_context, make_state
 
 
 class TestStart(unittest.IsolatedAsyncioTestCase):
@@ -22,6 +22,22 @@ class TestStart(unittest.IsolatedAsyncioTestCase):
         self.assertIn('Welcome', text)
         self.assertIn('@testuser', text)
 
+    async def test_parts_payload_sends_all_parts(self):
+        from dasovbot.handlers.common import start
+        from dasovbot.models import VideoInfo
+        from dasovbot.services.intent_processor import parts_token
+
+        video = VideoInfo(title='T', file_id='p0', parts=['p0', 'p1'], caption='cap')
+        message = make_message(chat_id=123)
+        context = make_context(state=make_state(videos={'v': video}))
+        context.args = [parts_token(video.parts)]
+        await start(make_update(message=message), context)
+
+        message.reply_text.assert_not_called()
+        media = context.bot.send_media_group.call_args[1]['media']
+        self.assertEqual([m.media for m in media], ['p0', 'p1'])
+        self.assertEqual(context.bot.send_media_group.call_args[1]['chat_id'], 123)
+
 
 class TestHelpCommand(unittest.IsolatedAsyncioTestCase):
 
@@ -1,6 +1,8 @@
 import unittest
 from unittest.mock import patch
 
+import yt_dlp
+
 from dasovbot.config import load_config, match_filter, make_ydl_opts
 from tests.helpers import make_config
 
@@ -92,6 +94,56 @@ class TestLoadConfig(unittest.TestCase):
         config = load_config()
         self.assertEqual(config.cookies_file, '/path/cookies.txt')
 
+    @patch.dict('os.environ', {
+        'BOT_TOKEN': 'tok',
+        'BASE_URL': 'https://api.telegram.org',
+        'DEVELOPER_CHAT_ID': '123',
+    }, clear=True)
+    def test_prefetch_disabled_by_default(self, mock_dotenv):
+        config = load_config()
+        self.assertFalse(config.prefetch_inline)
+        self.assertEqual(config.prefetch_max_duration, 600)
+        self.assertEqual(config.prefetch_max_pending, 2)
+
+    @patch.dict('os.environ', {
+        'BOT_TOKEN': 'tok',
+        'BASE_URL': 'https://api.telegram.org',
+        'DEVELOPER_CHAT_ID': '123',
+        'PREFETCH_INLINE': 'true',
+        'PREFETCH_MAX_DURATION': '300',
+        'PREFETCH_MAX_PENDING': '4',
+    }, clear=True)
+    def test_prefetch_settings(self, mock_dotenv):
+        config = load_config()
+        self.assertTrue(config.prefetch_inline)
+        self.assertEqual(config.prefetch_max_duration, 300)
+        self.assertEqual(config.prefetch_max_pending, 4)
+
+    @patch.dict('os.environ', {
+        'BOT_TOKEN': 'tok',
+        'BASE_URL': 'https://api.telegram.org',
+        'DEVELOPER_CHAT_ID': '123',
+        'LOCAL_MODE': 'true',
+        'LOCAL_MEDIA_FOLDER': '/srv/media',
+    }, clear=True)
+    def test_local_mode(self, mock_dotenv):
+        config = load_config()
+        self.assertTrue(config.local_mode)
+        self.assertEqual(config.local_media_folder, '/srv/media')
+
+    @patch.dict('os.environ', {
+        'BOT_TOKEN': 'tok',
+        'BASE_URL': 'https://api.telegram.org',
+        'DEVELOPER_CHAT_ID': '123',
+        'HELPER_BOT_TOKENS': '1:a, 2:b,',
+        'STORAGE_CHAT_ID': '-100',
+    }, clear=True)
+    def test_helper_bots(self, mock_dotenv):
+        config = load_config()
+        self.assertEqual(config.helper_bot_tokens, ['1:a', '2:b'])
+        self.assertEqual(config.storage_chat_id, '-100')
+        self.assertEqual(config.helper_upload_concurrency, 1)
+
 
 class TestMatchFilter(unittest.TestCase):
     def test_normal_video(self):
@@ -126,6 +178,13 @@ class TestMakeYdlOpts(unittest.TestCase):
         self.assertIn('match_filter', opts)
         self.assertIn('merge_output_format', opts)
 
+    def test_playlist_items_cover_inline_pages(self):
+        from dasovbot.handlers.inline import INLINE_PAGE_SIZE
+        opts = make_ydl_opts(make_config())
+        self.assertEqual(opts['playlist_items'], '1-100')
+        self.assertGreater(int(opts['playlist_items'].split('-')[1]), INLINE_PAGE_SIZE)
+        self.assertEqual(make_ydl_opts(make_config(playlist_max_items=30))['playlist_items'], '1-30')
+
     def test_cookies_conditional(self):
         config = make_config(cookies_file='')
         opts = make_ydl_opts(config)
@@ -140,6 +199,12 @@ class TestMakeYdlOpts(unittest.TestCase):
         opts = make_ydl_opts(config)
         self.assertIn('/myconfig/media/', opts['outtmpl'])
 
+    def test_outtmpl_is_stable_without_dates(self):
+        opts = make_ydl_opts(make_config(config_folder='/myconfig'))
+        ydl = yt_dlp.YoutubeDL({'outtmpl': opts['outtmpl'], 'quiet': True})
+        info = {'id': 'abc', 'title': 'T', 'ext': 'mp4'}
+        self.assertEqual(ydl.prepare_filename(info), '/myconfig/media/undated - T [abc].mp4')
+
 
 if __name__ == '__main__':
     unittest.main()
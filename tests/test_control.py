@@ -0,0 +1,172 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from dasovbot.constants import WEBHOOK_PATH
+from dasovbot.dashboard.control import HANDLERS, LocalControl, RemoteControl
+from dasovbot.dashboard.replica import ReplicaState
+from dasovbot.dashboard.server import create_app, create_control_app
+from dasovbot.database import data_version, init_db, open_readonly, upsert_intent, upsert_video
+from dasovbot.models import Intent, TemporaryInlineQuery, VideoInfo
+from dasovbot.webhook import SECRET_HEADER, get_webhook, init_webhook
+from tests.helpers import make_config, make_state
+
+
+class TestLocalControl(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    async def test_retry_requeues_intent(self, mock_upsert):
+        state = make_state(intents={'a': Intent(ignored=True)})
+        await LocalControl(state).call('retry_ignored', url='a', type='intent')
+        self.assertFalse(state.intents['a'].ignored)
+        self.assertEqual(state.download_queue.get_nowait(), 'a')
+
+    async def test_ignored_inline(self):
+        state = make_state(temporary_inline_queries={'q': TemporaryInlineQuery(ignored=True), 'r': TemporaryInlineQuery()})
+        self.assertEqual(await LocalControl(state).call('ignored_inline'), [{'url': 'q', 'title': 'q', 'source': 'inline', 'type': 'inline'}])
+
+    async def test_status_has_runtime_counters(self):
+        status = await LocalControl(make_state()).call('status')
+        for key in ('queue_size', 'tasks', 'transcoder', 'media', 'loop'):
+            self.assertIn(key, status)
+
+    async def test_queue_size(self):
+        state = make_state()
+        state.download_queue.put_nowait('a')
+        self.assertEqual(await LocalControl(state).call('queue_size'), 1)
+
+    @patch('dasovbot.dashboard.control.run_populate_subscriptions', new_callable=AsyncMock)
+    async def test_populate(self, mock_populate):
+        await HANDLERS['populate'](make_state())
+        await asyncio.sleep(0)
+        mock_populate.assert_awaited_once()
+
+
+class TestRemoteControl(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, 'control.sock')
+        self.state = make_state(intents={'a': Intent()})
+        self.runner = web.AppRunner(create_control_app(self.state))
+        await self.runner.setup()
+        await web.UnixSite(self.runner, self.socket).start()
+        self.control = RemoteControl(self.socket)
+
+    async def asyncTearDown(self):
+        await self.control.close()
+        await self.runner.cleanup()
+        self.tmp.cleanup()
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_mutation_runs_in_bot(self, mock_delete):
+        await self.control.call('remove_intent', url='a')
+        self.assertNotIn('a', self.state.intents)
+
+    async def test_status_round_trip(self):
+        status = await self.control.call('status')
+        self.assertEqual(status['intent_count'], 1)
+
+    async def test_rejects_unknown_call_and_params(self):
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            await self.control.call('drop_tables')
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            await self.control.call('remove_intent', key='a')
+
+    async def test_unreachable_bot(self):
+        control = RemoteControl(os.path.join(self.tmp.name, 'missing.sock'))
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            await control.call('status')
+        await control.close()
+
+    async def test_proxies_process_pages(self):
+        app = create_app(make_state(), self.control, auth=False)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/metrics')
+            self.assertEqual(response.status, 200)
+            self.assertIn('dasovbot_', await response.text())
+            response = await client.post('/profile/cpu/stop', allow_redirects=False)
+            self.assertEqual(response.status, 302)
+            self.assertEqual(response.headers['Location'], '/profile')
+
+    async def test_proxies_webhook_with_secret(self):
+        init_webhook(make_config(webhook_url='https://bot.example.com', webhook_secret='s3cret'))
+        self.addCleanup(init_webhook, make_config())
+        get_webhook().application = application = AsyncMock(update_queue=asyncio.Queue(), bot=None)
+        app = create_app(make_state(), self.control)
+        async with TestClient(TestServer(app)) as client:
+            update = {'update_id': 7}
+            response = await client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: 'wrong'})
+            self.assertEqual(response.status, 403)
+            response = await client.post(WEBHOOK_PATH, json=update, headers={SECRET_HEADER: 's3cret'})
+            self.assertEqual(response.status, 200)
+        self.assertEqual(application.update_queue.get_nowait().update_id, 7)
+
+
+class TestReplicaState(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = make_config(config_folder=self.tmp.name)
+        self.writer = await init_db(self.config.db_file)
+        self.replica = await ReplicaState.open(self.config)
+
+    async def asyncTearDown(self):
+        await self.replica.db.close()
+        await self.writer.close()
+        self.tmp.cleanup()
+
+    async def test_sees_commits_from_bot(self):
+        await upsert_intent(self.writer, 'a', Intent(priority=1))
+        await self.replica.refresh()
+        self.assertIn('a', self.replica.intents)
+        version = self.replica.versions['intents']
+
+        await upsert_intent(self.writer, 'b', Intent(priority=2))
+        await self.replica.refresh()
+        self.assertNotIn('b', self.replica.intents)
+        self.replica.stale = True
+        await self.replica.refresh()
+        self.assertIn('b', self.replica.intents)
+        self.assertGreater(self.replica.versions['intents'], version)
+
+    async def test_skips_reload_without_commits(self):
+        await self.replica.refresh()
+        version = self.replica.versions['intents']
+        self.replica.stale = True
+        await self.replica.refresh()
+        self.assertEqual(self.replica.versions['intents'], version)
+
+    async def test_touches_only_changed_collections(self):
+        await upsert_video(self.writer, 'v1', VideoInfo(title='One', file_id='f1'))
+        await self.replica.refresh()
+        versions = {collection: self.replica.versions[collection] for collection in ('videos', 'intents', 'users', 'subscriptions')}
+
+        await upsert_video(self.writer, 'v2', VideoInfo(title='Two', file_id='f2'))
+        self.replica.stale = True
+        await self.replica.refresh()
+        self.assertEqual(set(self.replica.videos), {'v1', 'v2'})
+        self.assertEqual(self.replica.video_index.search('two')[0][0].file_id, 'f2')
+        self.assertGreater(self.replica.versions['videos'], versions['videos'])
+        for collection in ('intents', 'users', 'subscriptions'):
+            self.assertEqual(self.replica.versions[collection], versions[collection])
+
+    async def test_read_only(self):
+        cursor = await self.writer.execute("PRAGMA journal_mode")
+        self.assertEqual((await cursor.fetchone())[0], 'wal')
+        with self.assertRaises(sqlite3.OperationalError):
+            await self.replica.db.execute("DELETE FROM intents")
+
+    async def test_data_version(self):
+        db = await open_readonly(self.config.db_file)
+        before = await data_version(db)
+        await upsert_intent(self.writer, 'a', Intent())
+        self.assertNotEqual(await data_version(db), before)
+        await db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,93 +1,263 @@
+import json
+import os
+import tempfile
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
-from dasovbot.downloader import _run_ffmpeg, convert_to_mp4
+from dasovbot.downloader import (
+    convert_to_mp4, is_faststart, plan_postprocess, probe_streams, video_metadata,
+    split_part_paths, split_segment_time, split_video,
+)
+from dasovbot.models import VideoInfo
 
 
-class TestRunFfmpeg(unittest.TestCase):
+class TestVideoMetadata(unittest.TestCase):
+
+    def test_collects_non_empty_fields(self):
+        info = VideoInfo(title='T', upload_date='20240101', webpage_url='https://example.com/v')
+        self.assertEqual(video_metadata(info), {
+            'title': 'T',
+            'date': '20240101',
+            'comment': 'https://example.com/v',
+            'purl': 'https://example.com/v',
+        })
+
+
+class TestProbeStreams(unittest.TestCase):
 
-    @patch('dasovbot.downloader.os.path.getsize', return_value=1024)
-    @patch('dasovbot.downloader.os.path.exists', return_value=True)
-    @patch('dasovbot.downloader.subprocess.run')
-    def test_success(self, mock_run, mock_exists, mock_size):
-        mock_run.return_value = MagicMock(returncode=0)
-        result = _run_ffmpeg('/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy'])
-        self.assertTrue(result)
-        mock_run.assert_called_once()
-        args = mock_run.call_args[0][0]
-        self.assertEqual(args[0], 'ffmpeg')
-        self.assertIn('-c', args)
-        self.assertIn('copy', args)
-
-    @patch('dasovbot.downloader.os.path.getsize', return_value=1024)
-    @patch('dasovbot.downloader.os.path.exists', return_value=True)
     @patch('dasovbot.downloader.subprocess.run')
-    def test_failure_nonzero_return(self, mock_run, mock_exists, mock_size):
-        mock_run.return_value = MagicMock(returncode=1)
-        result = _run_ffmpeg('/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy'])
-        self.assertFalse(result)
+    def test_first_stream_per_type(self, mock_run):
+        streams = [
+            {'codec_type': 'video', 'codec_name': 'vp9'},
+            {'codec_type': 'audio', 'codec_name': 'opus'},
+            {'codec_type': 'audio', 'codec_name': 'aac'},
+        ]
+        mock_run.return_value = MagicMock(returncode=0, stdout=json.dumps({'streams': streams}).encode())
+        self.assertEqual(probe_streams('/tmp/in.webm'), {'video': 'vp9', 'audio': 'opus'})
+        self.assertEqual(mock_run.call_args[0][0][0], 'ffprobe')
 
-    @patch('dasovbot.downloader.os.path.exists', return_value=False)
     @patch('dasovbot.downloader.subprocess.run')
-    def test_failure_no_output_file(self, mock_run, mock_exists):
-        mock_run.return_value = MagicMock(returncode=0)
-        result = _run_ffmpeg('/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy'])
-        self.assertFalse(result)
+    def test_failure(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=1, stdout=b'')
+        self.assertIsNone(probe_streams('/tmp/in.webm'))
 
-    @patch('dasovbot.downloader.os.path.exists', return_value=False)
-    @patch('dasovbot.downloader.subprocess.run', side_effect=__import__('subprocess').TimeoutExpired('ffmpeg', 600))
-    def test_timeout(self, mock_run, mock_exists):
-        result = _run_ffmpeg('/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy'])
-        self.assertFalse(result)
+    @patch('dasovbot.downloader.subprocess.run', side_effect=OSError)
+    def test_missing_ffprobe(self, mock_run):
+        self.assertIsNone(probe_streams('/tmp/in.webm'))
 
-    @patch('dasovbot.downloader.os.path.getsize', return_value=0)
-    @patch('dasovbot.downloader.os.path.exists', return_value=True)
-    @patch('dasovbot.downloader.subprocess.run')
-    def test_failure_empty_output(self, mock_run, mock_exists, mock_size):
-        mock_run.return_value = MagicMock(returncode=0)
-        result = _run_ffmpeg('/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy'])
-        self.assertFalse(result)
 
+def _box(box_type: bytes, payload: bytes = b'') -> bytes:
+    return (8 + len(payload)).to_bytes(4, 'big') + box_type + payload
 
-class TestConvertToMp4(unittest.IsolatedAsyncioTestCase):
 
-    async def test_already_mp4(self):
-        result = await convert_to_mp4('/tmp/video.mp4')
-        self.assertEqual(result, '/tmp/video.mp4')
+class TestIsFaststart(unittest.TestCase):
+
+    def _write(self, data: bytes) -> str:
+        file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+        file.write(data)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_moov_before_mdat(self):
+        path = self._write(_box(b'ftyp', b'isom') + _box(b'moov', b'x' * 16) + _box(b'mdat', b'y' * 32))
+        self.assertTrue(is_faststart(path))
+
+    def test_mdat_before_moov(self):
+        path = self._write(_box(b'ftyp', b'isom') + _box(b'mdat', b'y' * 32) + _box(b'moov', b'x' * 16))
+        self.assertFalse(is_faststart(path))
+
+    def test_truncated(self):
+        path = self._write(b'abc')
+        self.assertFalse(is_faststart(path))
+
+    def test_missing_file(self):
+        self.assertFalse(is_faststart('/nonexistent/video.mp4'))
+
+
+class TestPlanPostprocess(unittest.TestCase):
+
+    @patch('dasovbot.downloader.is_faststart', return_value=True)
+    def test_faststart_mp4_is_noop(self, mock_faststart):
+        self.assertEqual(plan_postprocess('/tmp/v.mp4', {'video': 'h264', 'audio': 'aac'}), ('noop', []))
+
+    @patch('dasovbot.downloader.is_faststart', return_value=True)
+    def test_faststart_mp4_with_metadata_remuxes(self, mock_faststart):
+        plan = plan_postprocess('/tmp/v.mp4', {'video': 'h264', 'audio': 'aac'}, metadata={'title': 'T'})
+        self.assertEqual(plan, ('remux', ['-c', 'copy']))
+
+    @patch('dasovbot.downloader.is_faststart', return_value=False)
+    def test_mp4_without_faststart_remuxes(self, mock_faststart):
+        self.assertEqual(plan_postprocess('/tmp/v.mp4', {'video': 'h264', 'audio': 'aac'}), ('remux', ['-c', 'copy']))
+
+    def test_webm_with_mp4_codecs_remuxes(self):
+        self.assertEqual(plan_postprocess('/tmp/v.webm', {'video': 'vp9', 'audio': 'opus'}), ('remux', ['-c', 'copy']))
+
+    def test_incompatible_audio_transcodes_audio_only(self):
+        plan, args = plan_postprocess('/tmp/v.webm', {'video': 'vp9', 'audio': 'vorbis'})
+        self.assertEqual(plan, 'transcode')
+        self.assertEqual(args, ['-c:v', 'copy', '-c:a', 'aac'])
+
+    def test_incompatible_video_transcodes_video_only(self):
+        plan, args = plan_postprocess('/tmp/v.mkv', {'video': 'vp8', 'audio': 'aac'})
+        self.assertEqual(plan, 'transcode')
+        self.assertEqual(args, ['-c:v', 'libx264', '-preset', 'fast', '-c:a', 'copy'])
+
+    def test_probe_failure_remuxes(self):
+        self.assertEqual(plan_postprocess('/tmp/v.mkv', None), ('remux', ['-c', 'copy']))
+
+
+class TestConvertToMp4(unittest.IsolatedAsyncioTestCase):
 
-    async def test_already_mp4_uppercase(self):
-        result = await convert_to_mp4('/tmp/video.MP4')
-        self.assertEqual(result, '/tmp/video.MP4')
+    def _transcoder(self, **kwargs):
+        transcoder = MagicMock()
+        transcoder.run = AsyncMock(**kwargs)
+        patcher = patch('dasovbot.downloader.get_transcoder', return_value=transcoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return transcoder.run
 
     async def test_none_path(self):
         result = await convert_to_mp4(None)
         self.assertIsNone(result)
 
+    @patch('dasovbot.downloader.plan_postprocess', return_value=('noop', []))
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'h264', 'audio': 'aac'})
+    async def test_noop(self, mock_probe, mock_plan):
+        run = self._transcoder()
+        result = await convert_to_mp4('/tmp/video.mp4')
+        self.assertEqual(result, '/tmp/video.mp4')
+        run.assert_not_called()
+
     @patch('dasovbot.downloader._cleanup_original')
-    @patch('dasovbot.downloader._run_ffmpeg', return_value=True)
-    async def test_remux_success(self, mock_ffmpeg, mock_cleanup):
-        result = await convert_to_mp4('/tmp/video.mkv')
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'h264', 'audio': 'aac'})
+    async def test_remux_writes_metadata_in_one_pass(self, mock_probe, mock_cleanup):
+        run = self._transcoder(return_value=True)
+        result = await convert_to_mp4('/tmp/video.mkv', {'title': 'T'}, 90)
         self.assertEqual(result, '/tmp/video.mp4')
-        mock_ffmpeg.assert_called_once_with('/tmp/video.mkv', '/tmp/video.mp4', ['-c', 'copy'])
+        run.assert_awaited_once_with(
+            '/tmp/video.mkv', '/tmp/video.mp4', ['-c', 'copy', '-metadata', 'title=T'], duration=90, kind='remux',
+        )
         mock_cleanup.assert_called_once()
 
+    @patch('dasovbot.downloader.os.replace')
+    @patch('dasovbot.downloader.is_faststart', return_value=True)
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'h264', 'audio': 'aac'})
+    async def test_faststart_mp4_gets_metadata(self, mock_probe, mock_faststart, mock_replace):
+        run = self._transcoder(return_value=True)
+        result = await convert_to_mp4('/tmp/video.mp4', {'title': 'T', 'purl': 'https://example.com/v'}, 90)
+        self.assertEqual(result, '/tmp/video.mp4')
+        run.assert_awaited_once_with(
+            '/tmp/video.mp4', '/tmp/video.pp.mp4',
+            ['-c', 'copy', '-metadata', 'title=T', '-metadata', 'purl=https://example.com/v'], duration=90, kind='remux',
+        )
+        mock_replace.assert_called_once_with('/tmp/video.pp.mp4', '/tmp/video.mp4')
+
+    @patch('dasovbot.downloader.os.replace')
+    @patch('dasovbot.downloader.is_faststart', return_value=False)
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'h264', 'audio': 'aac'})
+    async def test_mp4_rewritten_in_place(self, mock_probe, mock_faststart, mock_replace):
+        run = self._transcoder(return_value=True)
+        result = await convert_to_mp4('/tmp/video.mp4')
+        self.assertEqual(result, '/tmp/video.mp4')
+        self.assertEqual(run.call_args[0][:3], ('/tmp/video.mp4', '/tmp/video.pp.mp4', ['-c', 'copy']))
+        mock_replace.assert_called_once_with('/tmp/video.pp.mp4', '/tmp/video.mp4')
+
     @patch('dasovbot.downloader._cleanup_original')
     @patch('dasovbot.downloader.os.path.exists', return_value=False)
-    @patch('dasovbot.downloader._run_ffmpeg', side_effect=[False, True])
-    async def test_remux_fail_transcode_success(self, mock_ffmpeg, mock_exists, mock_cleanup):
+    @patch('dasovbot.downloader.probe_streams', return_value=None)
+    async def test_remux_fail_transcode_success(self, mock_probe, mock_exists, mock_cleanup):
+        run = self._transcoder(side_effect=[False, True])
         result = await convert_to_mp4('/tmp/video.webm')
         self.assertEqual(result, '/tmp/video.mp4')
-        self.assertEqual(mock_ffmpeg.call_count, 2)
-        second_call_args = mock_ffmpeg.call_args_list[1]
-        self.assertEqual(second_call_args[0][2], ['-c:v', 'libx264', '-preset', 'fast', '-c:a', 'aac'])
+        self.assertEqual(run.await_count, 2)
+        second_call = run.call_args_list[1]
+        self.assertEqual(second_call[0][2], ['-c:v', 'libx264', '-preset', 'fast', '-c:a', 'aac'])
+        self.assertEqual(second_call[1]['kind'], 'transcode')
         mock_cleanup.assert_called_once()
 
+    @patch('dasovbot.downloader._cleanup_original')
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'vp9', 'audio': 'vorbis'})
+    async def test_planned_transcode_runs_once(self, mock_probe, mock_cleanup):
+        run = self._transcoder(return_value=True)
+        result = await convert_to_mp4('/tmp/video.webm')
+        self.assertEqual(result, '/tmp/video.mp4')
+        run.assert_awaited_once_with(
+            '/tmp/video.webm', '/tmp/video.mp4', ['-c:v', 'copy', '-c:a', 'aac'], duration=0, kind='transcode',
+        )
+
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'vp8', 'audio': 'aac'})
+    async def test_transcode_preset_follows_duration(self, mock_probe):
+        run = self._transcoder(return_value=True)
+        with patch('dasovbot.downloader._cleanup_original'):
+            await convert_to_mp4('/tmp/video.webm', duration=2 * 60 * 60)
+        self.assertIn('ultrafast', run.call_args[0][2])
+
     @patch('dasovbot.downloader.os.path.exists', return_value=False)
-    @patch('dasovbot.downloader._run_ffmpeg', return_value=False)
-    async def test_both_fail_returns_original(self, mock_ffmpeg, mock_exists):
+    @patch('dasovbot.downloader.probe_streams', return_value=None)
+    async def test_both_fail_returns_original(self, mock_probe, mock_exists):
+        run = self._transcoder(return_value=False)
         result = await convert_to_mp4('/tmp/video.webm')
         self.assertEqual(result, '/tmp/video.webm')
-        self.assertEqual(mock_ffmpeg.call_count, 2)
+        self.assertEqual(run.await_count, 2)
+
+    @patch('dasovbot.downloader.os.path.exists', return_value=False)
+    @patch('dasovbot.downloader.probe_streams', return_value={'video': 'vp8', 'audio': 'vorbis'})
+    async def test_planned_transcode_fail_not_retried(self, mock_probe, mock_exists):
+        run = self._transcoder(return_value=False)
+        result = await convert_to_mp4('/tmp/video.webm')
+        self.assertEqual(result, '/tmp/video.webm')
+        run.assert_awaited_once()
+
+
+class TestSplitVideo(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'video.mp4')
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 100)
+
+    def _transcoder(self, part_sizes, ok=True):
+        async def run(input_path, pattern, args, **kwargs):
+            for index, size in enumerate(part_sizes):
+                with open(pattern % index, 'wb') as f:
+                    f.write(b'x' * size)
+            return ok
+        transcoder = MagicMock()
+        transcoder.run = AsyncMock(side_effect=run)
+        patcher = patch('dasovbot.downloader.get_transcoder', return_value=transcoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return transcoder.run
+
+    def test_segment_time(self):
+        self.assertEqual(split_segment_time(size=5000, duration=1000, limit=2000), 334)
+        self.assertEqual(split_segment_time(size=100, duration=1000, limit=2000), 1000)
+
+    async def test_splits_into_parts(self):
+        run = self._transcoder([40, 40, 20])
+        parts = await split_video(self.path, 300, limit=50)
+        self.assertEqual([os.path.basename(p) for p in parts], ['video.part000.mp4', 'video.part001.mp4', 'video.part002.mp4'])
+        args = run.call_args[0][2]
+        self.assertEqual(args[:2], ['-c', 'copy'])
+        self.assertIn('segment', args)
+        self.assertTrue(run.call_args[1]['segmented'])
+
+    async def test_oversized_part_fails(self):
+        self._transcoder([60, 40])
+        self.assertEqual(await split_video(self.path, 300, limit=50), [])
+        self.assertEqual(split_part_paths(self.path), [])
+
+    async def test_ffmpeg_failure(self):
+        self._transcoder([40], ok=False)
+        self.assertEqual(await split_video(self.path, 300, limit=50), [])
+        self.assertEqual(split_part_paths(self.path), [])
+
+    async def test_unknown_duration(self):
+        run = self._transcoder([])
+        self.assertEqual(await split_video(self.path, 0, limit=50), [])
+        run.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -106,5 +106,54 @@ class TestLogout(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(ctx.exception.location, '/login')
 
 
+class TestMetricsToken(unittest.IsolatedAsyncioTestCase):
+    def _request(self, authorization):
+        request = MagicMock()
+        request.path = '/metrics'
+        request.cookies = {}
+        request.headers = {'Authorization': authorization}
+        return request
+
+    @patch.dict('os.environ', {'METRICS_TOKEN': 'scrape'})
+    async def test_bearer_token_passes(self):
+        handler = AsyncMock(return_value=web.Response(text='ok'))
+        await auth_middleware(self._request('Bearer scrape'), handler)
+        handler.assert_awaited_once()
+
+    @patch('dasovbot.dashboard.auth.get_password', return_value='testpass')
+    @patch.dict('os.environ', {'METRICS_TOKEN': 'scrape'})
+    async def test_wrong_token_redirects(self, mock_pwd):
+        with self.assertRaises(web.HTTPFound):
+            await auth_middleware(self._request('Bearer wrong'), AsyncMock())
+
+    @patch('dasovbot.dashboard.auth.get_password', return_value='testpass')
+    @patch.dict('os.environ', {}, clear=True)
+    async def test_token_unset_requires_session(self, mock_pwd):
+        with self.assertRaises(web.HTTPFound):
+            await auth_middleware(self._request('Bearer '), AsyncMock())
+
+
+
+class TestApiToken(unittest.IsolatedAsyncioTestCase):
+    def _request(self, authorization=''):
+        request = MagicMock()
+        request.path = '/api/v1/intents'
+        request.cookies = {}
+        request.headers = {'Authorization': authorization}
+        return request
+
+    @patch.dict('os.environ', {'API_TOKEN': 'tool'})
+    async def test_bearer_token_passes(self):
+        handler = AsyncMock(return_value=web.Response(text='ok'))
+        await auth_middleware(self._request('Bearer tool'), handler)
+        handler.assert_awaited_once()
+
+    @patch('dasovbot.dashboard.auth.get_password', return_value='testpass')
+    @patch.dict('os.environ', {'API_TOKEN': 'tool', 'METRICS_TOKEN': 'scrape'})
+    async def test_unauthorized_instead_of_redirect(self, mock_pwd):
+        with self.assertRaises(web.HTTPUnauthorized):
+            await auth_middleware(self._request('Bearer scrape'), AsyncMock())
+
+
 if __name__ == '__main__':
     unittest.main()
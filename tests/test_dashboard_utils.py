@@ -6,8 +6,10 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from aiohttp import web
 
 from dasovbot.constants import DATETIME_FORMAT
-from dasovbot.dashboard.server import format_duration
-from dasovbot.dashboard.views import parse_timestamp, relative_time, retry_ignored, remove_ignored
+from dasovbot.dashboard.server import format_duration, format_megabytes
+from dasovbot.dashboard.views import parse_timestamp, relative_time, retry_ignored, remove_ignored, metrics
+from dasovbot.dashboard.views import profile_cpu_download, profile_memory_download, system_snapshot
+from dasovbot.profiling import ProfileResult
 from dasovbot.models import Intent, TemporaryInlineQuery
 from tests.helpers import make_state, make_config
 
@@ -35,6 +37,18 @@ class TestFormatDuration(unittest.TestCase):
         self.assertEqual(format_duration(3600), '1:00:00')
 
 
+class TestFormatMegabytes(unittest.TestCase):
+    def test_none(self):
+        self.assertEqual(format_megabytes(None), '')
+
+    def test_megabytes(self):
+        self.assertEqual(format_megabytes(1536 << 10), '1 MB')
+
+    def test_gigabytes(self):
+        self.assertEqual(format_megabytes(3 << 29), '1.5 GB')
+        self.assertEqual(format_megabytes(25 << 30), '25 GB')
+
+
 class TestParseTimestamp(unittest.TestCase):
     def test_valid(self):
         ts = '20240101_120000'
@@ -142,5 +156,64 @@ class TestRemoveIgnored(unittest.IsolatedAsyncioTestCase):
             await remove_ignored(request)
 
 
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_renders_queue_depth_per_source(self):
+        state = make_state(intents={
+            'a': Intent(source='inline'),
+            'b': Intent(source='inline'),
+            'c': Intent(source='subscription'),
+            'd': Intent(source='inline', ignored=True),
+        })
+        request = MagicMock()
+        request.app = {'state': state}
+        response = await metrics(request)
+        self.assertEqual(response.content_type, 'text/plain')
+        self.assertIn('dasovbot_intent_queue_depth{source="inline"} 2', response.text)
+        self.assertIn('dasovbot_intent_queue_depth{source="subscription"} 1', response.text)
+        self.assertIn('# TYPE dasovbot_operation_seconds histogram', response.text)
+
+
+
+class TestProfileDownloads(unittest.IsolatedAsyncioTestCase):
+    def _request(self, ext):
+        request = MagicMock()
+        request.match_info = {'ext': ext}
+        return request
+
+    async def test_cpu_profile_missing(self):
+        with patch('dasovbot.dashboard.views.get_profiler') as get_profiler:
+            get_profiler.return_value.result = None
+            with self.assertRaises(web.HTTPNotFound):
+                await profile_cpu_download(self._request('prof'))
+
+    async def test_cpu_profile_attachments(self):
+        result = ProfileResult(at='20240101_000000', duration=1.0, stats=b'\x00', text='stats', preview='stats')
+        with patch('dasovbot.dashboard.views.get_profiler') as get_profiler:
+            get_profiler.return_value.result = result
+            binary = await profile_cpu_download(self._request('prof'))
+            text = await profile_cpu_download(self._request('txt'))
+        self.assertEqual(binary.body, b'\x00')
+        self.assertEqual(binary.content_type, 'application/octet-stream')
+        self.assertRegex(binary.headers['Content-Disposition'], r'^attachment; filename="dasovbot-cpu-.*\.prof"$')
+        self.assertEqual(text.text, 'stats')
+
+    async def test_memory_snapshot_requires_tracing(self):
+        with patch('dasovbot.dashboard.views.get_profiler') as get_profiler:
+            get_profiler.return_value.snapshot_memory.return_value = None
+            with self.assertRaises(web.HTTPConflict):
+                await profile_memory_download(MagicMock())
+
+
+
+class TestSystemSnapshot(unittest.TestCase):
+    def test_counts(self):
+        state = make_state(intents={'a': Intent(), 'b': Intent(ignored=True)})
+        state.download_queue.put_nowait('a')
+        snapshot = system_snapshot(state)
+        self.assertEqual(snapshot['intent_count'], 2)
+        self.assertEqual(snapshot['queue_size'], 1)
+        self.assertIn('loop_lag', snapshot)
+
+
 if __name__ == '__main__':
     unittest.main()
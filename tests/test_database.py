@@ -10,9 +10,10 @@ from dasovbot.database import (
     upsert_intent, delete_intent, load_intents,
     upsert_user, load_users,
     upsert_subscription, delete_subscription, load_subscriptions,
+    insert_trace, load_traces,
     SCHEMA,
 )
-from dasovbot.models import VideoInfo, Intent, IntentMessage, Subscription
+from dasovbot.models import VideoInfo, Intent, IntentMessage, IntentTrace, Subscription
 
 
 class TestInitDb(unittest.IsolatedAsyncioTestCase):
@@ -173,6 +174,36 @@ class TestSubscriptionsCrud(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, {})
 
 
+class TestTraces(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = await make_memory_db()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    def _trace(self, query, finished):
+        return IntentTrace(query=query, created=finished - 10, finished=finished, outcome='delivered', spans={'download': [1.0, 5.0]})
+
+    async def test_insert_and_load_newest_first(self):
+        await insert_trace(self.db, self._trace('a', 1000.0), 3600)
+        await insert_trace(self.db, self._trace('b', 1100.0), 3600)
+        result = await load_traces(self.db, since=0)
+        self.assertEqual([trace.query for trace in result], ['b', 'a'])
+        self.assertEqual(result[0].spans, {'download': [1.0, 5.0]})
+
+    async def test_since_and_limit(self):
+        for index in range(5):
+            await insert_trace(self.db, self._trace(str(index), 1000.0 + index), 3600)
+        self.assertEqual(len(await load_traces(self.db, since=1003.0)), 2)
+        self.assertEqual(len(await load_traces(self.db, since=0, limit=3)), 3)
+
+    async def test_retention_prunes_old_rows(self):
+        await insert_trace(self.db, self._trace('old', 1000.0), 3600)
+        await insert_trace(self.db, self._trace('new', 1000.0 + 7200), 3600)
+        result = await load_traces(self.db, since=0)
+        self.assertEqual([trace.query for trace in result], ['new'])
+
+
 class TestMigrateFromJson(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.db = await make_memory_db()
@@ -1,11 +1,17 @@
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+import yt_dlp
 
 from dasovbot.downloader import (
     extract_url, process_info, contains_text,
     filter_entries, process_entries,
+    estimate_filesize, estimate_download_size, select_format_height,
+    progress_hook, _download, download_video, is_network_error, DownloadWatch,
 )
-from dasovbot.models import VideoInfo
+from dasovbot.models import DownloadProgress, VideoInfo
 
 
 class TestExtractUrl(unittest.TestCase):
@@ -187,5 +193,201 @@ class TestProcessEntries(unittest.TestCase):
         self.assertEqual(result[0]['title'], 'A')
 
 
+def _fmt(format_id, ext, height=None, vcodec='avc1', acodec='none', **kwargs):
+    return {'format_id': format_id, 'ext': ext, 'height': height, 'vcodec': vcodec, 'acodec': acodec, **kwargs}
+
+
+MB = 1 << 20
+
+
+class TestEstimateFilesize(unittest.TestCase):
+    def test_filesize(self):
+        self.assertEqual(estimate_filesize({'filesize': 100, 'filesize_approx': 200}, 10), 100)
+
+    def test_filesize_approx(self):
+        self.assertEqual(estimate_filesize({'filesize_approx': 200}, 10), 200)
+
+    def test_bitrate_times_duration(self):
+        self.assertEqual(estimate_filesize({'tbr': 8}, 10), 10_000)
+
+    def test_unknown(self):
+        self.assertIsNone(estimate_filesize({'tbr': 8}, 0))
+        self.assertIsNone(estimate_filesize({}, 10))
+
+
+class TestSelectFormatHeight(unittest.TestCase):
+    def setUp(self):
+        self.formats = [
+            _fmt('v720', 'mp4', 720, filesize=2500 * MB),
+            _fmt('v480', 'mp4', 480, filesize=1500 * MB),
+            _fmt('v360', 'mp4', 360, filesize=800 * MB),
+            _fmt('a', 'm4a', vcodec='none', acodec='mp4a', filesize=100 * MB),
+            _fmt('webm', 'webm', 1080, filesize=10 * MB),
+        ]
+
+    def test_estimate_pairs_video_and_audio(self):
+        self.assertEqual(estimate_download_size(self.formats, 480, 0), 1600 * MB)
+
+    def test_estimate_combined_format(self):
+        formats = [_fmt('b', 'mp4', 360, acodec='mp4a', tbr=1000)]
+        self.assertEqual(estimate_download_size(formats, 720, 60), 7_500_000)
+
+    def test_steps_down_until_it_fits(self):
+        self.assertEqual(select_format_height({'formats': self.formats}), 480)
+
+    def test_keeps_best_height_when_it_fits(self):
+        self.assertEqual(select_format_height({'formats': self.formats}, limit=3000 * MB), 720)
+
+    def test_uses_bitrate_and_duration(self):
+        formats = [
+            _fmt('v720', 'mp4', 720, tbr=3000),
+            _fmt('v480', 'mp4', 480, tbr=1500),
+            _fmt('v360', 'mp4', 360, tbr=500),
+            _fmt('a', 'm4a', vcodec='none', acodec='mp4a', tbr=128),
+        ]
+        raw_info = {'formats': formats, 'duration': 4 * 3600}
+        self.assertEqual(select_format_height(raw_info), 360)
+
+    def test_unknown_size_keeps_best_height(self):
+        raw_info = {'formats': [_fmt('v720', 'mp4', 720), _fmt('a', 'm4a', vcodec='none', acodec='mp4a')]}
+        self.assertEqual(select_format_height(raw_info), 720)
+
+    def test_nothing_fits_uses_lowest(self):
+        self.assertEqual(select_format_height({'formats': self.formats}, limit=1), 240)
+
+
+class TestProgressHook(unittest.TestCase):
+    def test_aggregates_streams_and_throttles(self):
+        progress = DownloadProgress(path='/media/v.mp4', height=720)
+        reports = []
+        hook = progress_hook(progress, reports.append)
+        with patch('dasovbot.downloader.time.monotonic', return_value=100.0):
+            hook({'status': 'downloading', 'filename': 'v.f137.mp4', 'downloaded_bytes': 10, 'total_bytes': 100,
+                  'info_dict': {'format_id': '137'}})
+            hook({'status': 'downloading', 'filename': 'v.f137.mp4', 'downloaded_bytes': 50, 'total_bytes': 100,
+                  'info_dict': {'format_id': '137'}})
+            hook({'status': 'finished', 'filename': 'v.f137.mp4', 'total_bytes': 100,
+                  'info_dict': {'format_id': '137'}})
+            hook({'status': 'downloading', 'filename': 'v.f140.m4a', 'downloaded_bytes': 5, 'total_bytes_estimate': 20,
+                  'info_dict': {'format_id': '140'}})
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(reports[1].downloaded_bytes, 100)
+        self.assertEqual(progress.downloaded_bytes, 105)
+        self.assertEqual(progress.total_bytes, 120)
+        self.assertEqual(progress.format, '137+140')
+        self.assertIsNot(reports[0], progress)
+
+    def test_unknown_total(self):
+        progress = DownloadProgress(path='/media/v.mp4')
+        hook = progress_hook(progress, lambda p: None)
+        hook({'status': 'downloading', 'filename': 'v.mp4', 'downloaded_bytes': 10})
+        self.assertIsNone(progress.total_bytes)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.ydl = MagicMock()
+        self.ydl.extract_info.return_value = {'formats': [], 'duration': 10}
+        patchers = [
+            patch('dasovbot.downloader._ydl', self.ydl),
+            patch('dasovbot.downloader._ydl_opts', {'format': 'best', 'outtmpl': '/media/%(title)s.%(ext)s'}),
+            patch('dasovbot.downloader.yt_dlp.YoutubeDL'),
+        ]
+        self.mock_ydl_class = patchers[-1].start()
+        for patcher in patchers[:-1]:
+            patcher.start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.download_ydl = self.mock_ydl_class.return_value
+        self.download_ydl.prepare_filename.return_value = '/media/v.mp4'
+
+    def test_without_progress_uses_shared_instance(self):
+        _download('q')
+        self.ydl.process_ie_result.assert_called_once()
+        self.mock_ydl_class.assert_not_called()
+
+    def test_reports_target_path(self):
+        reports = []
+        _download('q', report=reports.append)
+        self.assertEqual(reports[0].path, '/media/v.mp4')
+        self.assertEqual(reports[0].height, 720)
+        opts = self.mock_ydl_class.call_args[0][0]
+        self.assertEqual(len(opts['progress_hooks']), 1)
+        self.download_ydl.process_ie_result.assert_called_once()
+
+    @patch('dasovbot.downloader.select_format_height', return_value=720)
+    def test_resume_keeps_ladder_height(self, mock_select):
+        reports = []
+        resume = DownloadProgress(path='/media/v.scaled.mp4', height=360, downloaded_bytes=1000)
+        _download('q', resume=resume, report=reports.append)
+        mock_select.assert_not_called()
+        self.assertEqual(reports[0].height, 360)
+        opts = self.mock_ydl_class.call_args[0][0]
+        self.assertIn('height<=?360', opts['format'])
+        self.assertIn('.scaled', opts['outtmpl'])
+
+    def test_watch_hook_comes_first(self):
+        watch = DownloadWatch()
+        _download('q', report=[].append, watch=watch)
+        opts = self.mock_ydl_class.call_args[0][0]
+        self.assertEqual(len(opts['progress_hooks']), 2)
+        self.assertEqual(opts['progress_hooks'][0], watch.hook)
+
+
+class TestDownloadWatch(unittest.TestCase):
+    def test_stop_cancels_at_next_hook(self):
+        watch = DownloadWatch()
+        watch.hook({})
+        watch.stop.set()
+        with self.assertRaises(yt_dlp.utils.DownloadCancelled):
+            watch.hook({})
+
+    def test_stalled(self):
+        watch = DownloadWatch()
+        self.assertFalse(watch.stalled(60))
+        watch.active -= 61
+        self.assertTrue(watch.stalled(60))
+
+    def test_network_errors(self):
+        reset = ConnectionResetError()
+        self.assertTrue(is_network_error(yt_dlp.DownloadError('reset', exc_info=(type(reset), reset, None))))
+        self.assertTrue(is_network_error(TimeoutError()))
+        self.assertFalse(is_network_error(yt_dlp.DownloadError('unavailable')))
+        self.assertFalse(is_network_error(OSError(28, 'No space left on device')))
+
+
+class TestDownloadVideo(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.downloader.STALL_CHECK_SEC', 0.01)
+    @patch('dasovbot.downloader.TIMEOUT_SEC', 0.05)
+    async def test_stall_stops_download(self):
+        stopped = threading.Event()
+
+        def fake_download(query, resume, report, watch):
+            while True:
+                time.sleep(0.01)
+                try:
+                    watch.hook({})
+                except yt_dlp.utils.DownloadCancelled:
+                    stopped.set()
+                    raise
+                watch.active -= 1
+
+        with patch('dasovbot.downloader._download', fake_download):
+            with self.assertRaises(TimeoutError):
+                await download_video('q')
+        self.assertTrue(stopped.is_set())
+
+    async def test_network_error_is_interruption(self):
+        reset = ConnectionResetError()
+        error = yt_dlp.DownloadError('reset', exc_info=(type(reset), reset, None))
+        with patch('dasovbot.downloader._download', side_effect=error):
+            with self.assertRaises(ConnectionError):
+                await download_video('q')
+
+    async def test_other_error_returns_none(self):
+        with patch('dasovbot.downloader._download', side_effect=yt_dlp.DownloadError('unavailable')):
+            self.assertIsNone(await download_video('q'))
+
+
 if __name__ == '__main__':
     unittest.main()
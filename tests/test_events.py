@@ -0,0 +1,95 @@
+import unittest
+
+from dasovbot.events import EVENT_RELOAD, Event, EventBus, intent_event
+from dasovbot.models import DownloadProgress, Intent, VideoInfo
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+class TestEvent(unittest.TestCase):
+    def test_encode(self):
+        event = Event(type='intent', data={'url': 'a', 'title': 'Кот'}, id=7)
+        self.assertEqual(event.encode().decode(), 'id: 7\nevent: intent\ndata: {"url":"a","title":"Кот"}\n\n')
+
+    def test_encode_without_id(self):
+        self.assertEqual(Event(type='system', data={}).encode(), b'event: system\ndata: {}\n\n')
+
+
+class TestIntentEvent(unittest.TestCase):
+    def test_falls_back_to_video(self):
+        intent = Intent(chat_ids=['1', '2'], priority=3, download=DownloadProgress(path='p', downloaded_bytes=5 << 20, total_bytes=10 << 20))
+        data = intent_event('q', intent, VideoInfo(title='Video', upload_date='20240101'))
+        self.assertEqual(data['title'], 'Video')
+        self.assertEqual(data['upload_date'], '20240101')
+        self.assertEqual(data['chat_ids_count'], 2)
+        self.assertEqual(data['download'], {'downloaded_mb': 5, 'total_mb': 10})
+        self.assertFalse(data['ignored'])
+
+
+class TestEventBus(unittest.TestCase):
+    def test_publish_to_subscribers(self):
+        bus = EventBus()
+        first, second = bus.subscribe(), bus.subscribe()
+        bus.publish('task', {'name': 'a'})
+        for queue in (first, second):
+            [event] = drain(queue)
+            self.assertEqual((event.id, event.type, event.data), (1, 'task', {'name': 'a'}))
+
+    def test_ids_advance_without_listeners(self):
+        bus = EventBus()
+        bus.publish('task', {'name': 'a'})
+        self.assertEqual(bus.last_id, 1)
+        self.assertFalse(bus.listening)
+
+    def test_unsubscribe(self):
+        bus = EventBus()
+        queue = bus.subscribe()
+        bus.unsubscribe(queue)
+        bus.publish('task')
+        self.assertTrue(queue.empty())
+
+    def test_replays_missed_events(self):
+        bus = EventBus()
+        bus.unsubscribe(bus.subscribe())
+        listener = bus.subscribe()
+        for name in ('a', 'b', 'c'):
+            bus.publish('task', {'name': name})
+        bus.unsubscribe(listener)
+        replay = drain(bus.subscribe(last_id=1))
+        self.assertEqual([event.data['name'] for event in replay], ['b', 'c'])
+
+    def test_up_to_date_client_gets_nothing(self):
+        bus = EventBus()
+        bus.publish('task')
+        self.assertTrue(bus.subscribe(last_id=1).empty())
+
+    def test_reload_when_backlog_has_gap(self):
+        bus = EventBus()
+        bus.publish('task')
+        listener = bus.subscribe()
+        bus.publish('task')
+        bus.unsubscribe(listener)
+        [event] = drain(bus.subscribe(last_id=0))
+        self.assertEqual(event.type, EVENT_RELOAD)
+
+    def test_reload_after_restart(self):
+        [event] = drain(EventBus().subscribe(last_id=42))
+        self.assertEqual(event.type, EVENT_RELOAD)
+
+    def test_overflow_replaced_with_reload(self):
+        bus = EventBus(queue_size=2)
+        queue = bus.subscribe()
+        for _ in range(3):
+            bus.publish('task')
+        [event] = drain(queue)
+        self.assertEqual(event.type, EVENT_RELOAD)
+        self.assertEqual(event.id, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
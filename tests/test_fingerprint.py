@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from dasovbot.fingerprint import FingerprintIndex, fingerprint_file
+from dasovbot.models import VideoInfo
+
+
+class TestFingerprintFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def test_same_head_same_fingerprint(self):
+        a = self._write('a.mp4', b'head' + b'a' * 10)
+        b = self._write('b.mp4', b'head' + b'b' * 10)
+        self.assertEqual(fingerprint_file(a, 60, 1280, 720, 4), fingerprint_file(b, 60, 1280, 720, 4))
+
+    def test_includes_duration_and_dimensions(self):
+        path = self._write('a.mp4', b'data')
+        fingerprint = fingerprint_file(path, 60, 1280, 720, 1024)
+        self.assertTrue(fingerprint.endswith(':60:1280x720'))
+        self.assertNotEqual(fingerprint, fingerprint_file(path, 61, 1280, 720, 1024))
+        self.assertNotEqual(fingerprint, fingerprint_file(path, 60, 640, 360, 1024))
+
+    def test_different_content(self):
+        a = self._write('a.mp4', b'aaaa')
+        b = self._write('b.mp4', b'bbbb')
+        self.assertNotEqual(fingerprint_file(a, 60, None, None, 4), fingerprint_file(b, 60, None, None, 4))
+
+    def test_missing_file(self):
+        self.assertIsNone(fingerprint_file(os.path.join(self.tmp.name, 'missing.mp4'), 60, 1280, 720, 4))
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    def test_lookup_counts_hits_and_misses(self):
+        index = FingerprintIndex()
+        video = VideoInfo(title='T', file_id='fid', fingerprint='fp')
+        index.add(video)
+        self.assertIs(index.lookup('fp', size=100), video)
+        self.assertIsNone(index.lookup('other', size=100))
+        self.assertEqual(index.stats(), {'indexed': 1, 'hits': 1, 'misses': 1, 'bytes_saved': 100})
+
+    def test_skips_videos_without_fingerprint_or_file_id(self):
+        index = FingerprintIndex()
+        index.add(VideoInfo(title='T', file_id='fid'))
+        index.add(VideoInfo(title='T', fingerprint='fp'))
+        self.assertEqual(len(index), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
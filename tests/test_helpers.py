@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import AsyncMock, patch, MagicMock
 
 from dasovbot.helpers import (
-    remove_command_prefix, user_subscriptions,
+    looks_like_url, remove_command_prefix, user_subscriptions,
     send_message_developer, append_playlist,
 )
 from dasovbot.models import Subscription
@@ -25,6 +25,26 @@ class TestRemoveCommandPrefix(unittest.TestCase):
         self.assertEqual(remove_command_prefix(''), '')
 
 
+class TestLooksLikeUrl(unittest.TestCase):
+    def test_full_url(self):
+        self.assertTrue(looks_like_url('https://www.youtube.com/watch?v=abc'))
+
+    def test_schemeless_url(self):
+        self.assertTrue(looks_like_url('youtu.be/abc'))
+
+    def test_free_text(self):
+        self.assertFalse(looks_like_url('funny cats'))
+
+    def test_single_word(self):
+        self.assertFalse(looks_like_url('cats'))
+
+    def test_incomplete_domain(self):
+        self.assertFalse(looks_like_url('https://www.youtube.c'))
+
+    def test_incomplete_scheme(self):
+        self.assertFalse(looks_like_url('https://'))
+
+
 class TestUserSubscriptions(unittest.TestCase):
     def test_filters_by_chat_id(self):
         subs = {
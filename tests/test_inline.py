@@ -1,17 +1,23 @@
+import asyncio
 import unittest
 from unittest.mock import AsyncMock, patch, MagicMock
 
 from telegram.error import BadRequest
 
-from dasovbot.models import VideoInfo, TemporaryInlineQuery
+from dasovbot.models import VideoInfo, TemporaryInlineQuery, Intent
 from tests.helpers import (
     make_user, make_inline_query, make_chosen_inline_result,
-    make_update, make_context, make_state,
+    make_update, make_context, make_state, make_config,
 )
 
 
 class TestInlineQueryHandler(unittest.IsolatedAsyncioTestCase):
 
+    def setUp(self):
+        patcher = patch('dasovbot.handlers.inline.INLINE_DEBOUNCE_SEC', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def _make_info(self, **kwargs):
         defaults = dict(title='Test Video', webpage_url='https://example.com/v1', caption='cap')
         defaults.update(kwargs)
@@ -48,6 +54,8 @@ class TestInlineQueryHandler(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(len(results), 1)
         self.assertIn('https://example.com/v1', state.temporary_inline_queries)
         self.assertIn('inline_queries', context.user_data)
+        self.assertEqual(state.inline_results[results[0].id]['title'], 'Test Video')
+        self.assertEqual(state.inline_results[results[0].id]['query'], 'https://example.com/v1')
 
     @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
     async def test_cached_results_skips_extract(self, mock_extract):
@@ -122,6 +130,163 @@ class TestInlineQueryHandler(unittest.IsolatedAsyncioTestCase):
         results = query_obj.answer.call_args[1].get('results') or query_obj.answer.call_args[0][0]
         self.assertEqual(len(results), 2)
 
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_free_text_searches_library(self, mock_extract):
+        state = make_state()
+        state.video_index.add(VideoInfo(title='Funny cats', file_id='fid1', caption='cap'))
+        state.video_index.add(VideoInfo(title='Dogs', file_id='fid2'))
+
+        query_obj = make_inline_query(query='fun cat')
+        update = make_update(inline_query=query_obj)
+        context = make_context(state=state)
+
+        from dasovbot.handlers.inline import inline_query_handler
+        await inline_query_handler(update, context)
+
+        mock_extract.assert_not_called()
+        self.assertEqual(state.temporary_inline_queries, {})
+        call_kwargs = query_obj.answer.call_args[1]
+        self.assertEqual([r.video_file_id for r in call_kwargs['results']], ['fid1'])
+        self.assertEqual(call_kwargs['next_offset'], '')
+
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_free_text_search_paginates(self, mock_extract):
+        state = make_state()
+        for i in range(60):
+            state.video_index.add(VideoInfo(title=f'Clip {i}', file_id=f'fid{i}', processed_at=f'{i:03d}'))
+
+        query_obj = make_inline_query(query='clip', offset='50')
+        update = make_update(inline_query=query_obj)
+        context = make_context(state=state)
+
+        from dasovbot.handlers.inline import inline_query_handler
+        await inline_query_handler(update, context)
+
+        call_kwargs = query_obj.answer.call_args[1]
+        self.assertEqual(len(call_kwargs['results']), 10)
+        self.assertEqual(call_kwargs['next_offset'], '')
+        self.assertEqual(len({r.id for r in call_kwargs['results']}), 10)
+
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_incomplete_url_does_not_extract(self, mock_extract):
+        query_obj = make_inline_query(query='https://www.youtube.c')
+        update = make_update(inline_query=query_obj)
+        context = make_context()
+
+        from dasovbot.handlers.inline import inline_query_handler
+        await inline_query_handler(update, context)
+
+        mock_extract.assert_not_called()
+
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_newer_query_supersedes_pending_extraction(self, mock_extract):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_extract(query, download, state):
+            if query.endswith('v1'):
+                started.set()
+                await release.wait()
+            return self._make_info(webpage_url=query)
+
+        mock_extract.side_effect = slow_extract
+        state = make_state(animation_file_id='anim123')
+        user = make_user(id=7)
+        old_query = make_inline_query(query='https://example.com/v1', from_user=user)
+        new_query = make_inline_query(query='https://example.com/v12', from_user=user)
+
+        from dasovbot.handlers.inline import inline_query_handler
+        old = asyncio.create_task(inline_query_handler(make_update(inline_query=old_query), make_context(state=state)))
+        await started.wait()
+        await inline_query_handler(make_update(inline_query=new_query), make_context(state=state))
+        await old
+
+        old_query.answer.assert_not_called()
+        new_query.answer.assert_awaited_once()
+        self.assertEqual(state.inline_extractions, {})
+
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_superseded_during_debounce_skips_extraction(self, mock_extract):
+        mock_extract.return_value = self._make_info()
+        state = make_state(animation_file_id='anim123')
+        user = make_user(id=7)
+        old_query = make_inline_query(query='https://example.com/v1', from_user=user)
+        new_query = make_inline_query(query='https://example.com/v12', from_user=user)
+
+        from dasovbot.handlers.inline import inline_query_handler
+        with patch('dasovbot.handlers.inline.INLINE_DEBOUNCE_SEC', 0.05):
+            old = asyncio.create_task(inline_query_handler(make_update(inline_query=old_query), make_context(state=state)))
+            await asyncio.sleep(0)
+            await inline_query_handler(make_update(inline_query=new_query), make_context(state=state))
+            await old
+
+        mock_extract.assert_awaited_once()
+        self.assertEqual(mock_extract.call_args[0][0], 'https://example.com/v12')
+        old_query.answer.assert_not_called()
+
+    async def _answer_single(self, mock_extract, mock_append, config, info=None, **state_overrides):
+        mock_extract.return_value = info or self._make_info(duration=120)
+        query_obj = make_inline_query(query='https://example.com/v1')
+        state = make_state(animation_file_id='anim123', config=config, **state_overrides)
+
+        from dasovbot.handlers.inline import inline_query_handler
+        await inline_query_handler(make_update(inline_query=query_obj), make_context(state=state))
+
+    @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_prefetch_single_video(self, mock_extract, mock_append):
+        await self._answer_single(mock_extract, mock_append, make_config(prefetch_inline=True))
+
+        mock_append.assert_awaited_once()
+        self.assertEqual(mock_append.call_args[0][0], 'https://example.com/v1')
+        self.assertTrue(mock_append.call_args[1]['speculative'])
+
+    @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_prefetch_disabled(self, mock_extract, mock_append):
+        await self._answer_single(mock_extract, mock_append, make_config())
+        mock_append.assert_not_called()
+
+    @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_prefetch_skips_long_video(self, mock_extract, mock_append):
+        config = make_config(prefetch_inline=True, prefetch_max_duration=60)
+        await self._answer_single(mock_extract, mock_append, config)
+        mock_append.assert_not_called()
+
+    @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_prefetch_respects_pending_budget(self, mock_extract, mock_append):
+        config = make_config(prefetch_inline=True, prefetch_max_pending=1)
+        intents = {'https://example.com/other': Intent(speculative=True)}
+        await self._answer_single(mock_extract, mock_append, config, intents=intents)
+        mock_append.assert_not_called()
+
+    @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
+    async def test_playlist_pages_served_from_cache(self, mock_extract):
+        entries = [
+            {'title': f'E{i}', 'webpage_url': f'https://example.com/e{i}', 'url': f'https://example.com/e{i}', 'duration': 10}
+            for i in range(60)
+        ]
+        mock_extract.return_value = self._make_info(entries=entries)
+        state = make_state(animation_file_id='anim123')
+
+        from dasovbot.handlers.inline import inline_query_handler
+        first = make_inline_query(query='https://example.com/playlist')
+        await inline_query_handler(make_update(inline_query=first), make_context(state=state))
+        second = make_inline_query(query='https://example.com/playlist', offset='50')
+        await inline_query_handler(make_update(inline_query=second), make_context(state=state))
+
+        mock_extract.assert_awaited_once()
+        first_kwargs = first.answer.call_args[1]
+        second_kwargs = second.answer.call_args[1]
+        self.assertEqual(len(first_kwargs['results']), 50)
+        self.assertEqual(first_kwargs['next_offset'], '50')
+        self.assertEqual(len(second_kwargs['results']), 10)
+        self.assertEqual(second_kwargs['next_offset'], '')
+        self.assertEqual(second_kwargs['results'][0].title, 'E50')
+        self.assertEqual(len(state.inline_results), 60)
+
     @patch('dasovbot.handlers.inline.extract_info', new_callable=AsyncMock)
     async def test_bad_request_doesnt_crash(self, mock_extract):
         info = self._make_info()
@@ -198,6 +363,23 @@ class TestChosenQuery(unittest.IsolatedAsyncioTestCase):
         call_kwargs = context.bot.edit_message_media.call_args[1]
         self.assertEqual(call_kwargs['inline_message_id'], 'imid1')
 
+    async def test_cached_split_video_links_remaining_parts(self):
+        info = VideoInfo(title='Test', file_id='p0', parts=['p0', 'p1', 'p2'], caption='cap', webpage_url='https://example.com/v1')
+        state = make_state(videos={'https://example.com/v1': info})
+        result = make_chosen_inline_result(result_id='rid1', inline_message_id='imid1')
+        update = make_update(chosen_inline_result=result)
+        context = make_context(
+            state=state,
+            user_data={'inline_queries': {'rid1': 'https://example.com/v1'}},
+        )
+        context.bot.username = 'dasovbot'
+
+        from dasovbot.handlers.inline import chosen_query
+        await chosen_query(update, context)
+
+        caption = context.bot.edit_message_media.call_args[1]['media'].caption
+        self.assertTrue(caption.startswith('cap\n[1/3] all parts: https://t.me/dasovbot?start=parts_'))
+
     @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
     async def test_no_file_id_appends_intent(self, mock_append):
         state = make_state(videos={})
@@ -270,18 +452,10 @@ class TestChosenQuery(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(call_kwargs['source'], 'inline')
 
     @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
-    async def test_title_lookup_from_temporary_inline_queries(self, mock_append):
-        cached_result = MagicMock()
-        cached_result.id = 'rid1'
-        cached_result.title = 'Found Title'
-        tiq = TemporaryInlineQuery(
-            timestamp='20240101_120000',
-            results=[cached_result],
-            inline_queries={'rid1': {'url': 'https://example.com/v1', 'upload_date': '20240101'}},
-        )
+    async def test_title_lookup_from_inline_results(self, mock_append):
         state = make_state(
             videos={},
-            temporary_inline_queries={'https://example.com/v1': tiq},
+            inline_results={'rid1': {'query': 'https://example.com/v1', 'url': 'https://example.com/v1', 'title': 'Found Title', 'upload_date': '20240101'}},
         )
 
         result = make_chosen_inline_result(result_id='rid1', inline_message_id='imid1')
@@ -298,6 +472,23 @@ class TestChosenQuery(unittest.IsolatedAsyncioTestCase):
         call_kwargs = mock_append.call_args[1]
         self.assertEqual(call_kwargs['title'], 'Found Title')
 
+    @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
+    async def test_inline_results_index_without_user_data(self, mock_append):
+        state = make_state(
+            videos={},
+            inline_results={'rid1': {'query': 'q', 'url': 'https://example.com/v1', 'title': 'T', 'upload_date': None}},
+        )
+
+        result = make_chosen_inline_result(result_id='rid1', inline_message_id='imid1')
+        update = make_update(chosen_inline_result=result)
+        context = make_context(state=state, user_data={})
+
+        from dasovbot.handlers.inline import chosen_query
+        await chosen_query(update, context)
+
+        mock_append.assert_awaited_once()
+        self.assertEqual(mock_append.call_args[0][0], 'https://example.com/v1')
+
     @patch('dasovbot.handlers.inline.append_intent', new_callable=AsyncMock)
     async def test_title_none_when_not_in_cache(self, mock_append):
         state = make_state(videos={}, temporary_inline_queries={})
@@ -336,5 +527,31 @@ class TestChosenQuery(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(call_kwargs['upload_date'])
 
 
+class TestClearTemporaryInlineQueries(unittest.IsolatedAsyncioTestCase):
+    def _state(self):
+        tiq = TemporaryInlineQuery(marked=True, inline_queries={
+            'r1': {'url': 'https://example.com/queued'},
+            'r2': {'url': 'https://example.com/running'},
+        })
+        intents = {
+            'https://example.com/queued': Intent(speculative=True),
+            'https://example.com/running': Intent(speculative=True),
+        }
+        return make_state(temporary_inline_queries={'q': tiq}, intents=intents)
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_drops_queued_prefetch_only(self, mock_delete):
+        from dasovbot.services.background import run_clear_temporary_inline_queries
+        from dasovbot.services.pipeline import Pipeline
+        pipeline = Pipeline({}, {})
+        pipeline.jobs['https://example.com/running'] = MagicMock()
+        state = self._state()
+        with patch('dasovbot.services.pipeline.get_pipeline', return_value=pipeline):
+            await run_clear_temporary_inline_queries(state)
+        self.assertEqual(state.temporary_inline_queries, {})
+        self.assertNotIn('https://example.com/queued', state.intents)
+        self.assertIn('https://example.com/running', state.intents)
+
+
 if __name__ == '__main__':
     unittest.main()
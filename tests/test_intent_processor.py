@@ -1,11 +1,29 @@
+import asyncio
+import hashlib
+import os
+import tempfile
 import unittest
+from functools import partial
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from tests.helpers import make_state, make_config
-from dasovbot.models import VideoInfo, Intent, IntentMessage
+from dasovbot.models import DownloadProgress, VideoInfo, Intent, IntentMessage
+from telegram.error import BadRequest
+
 from dasovbot.services.intent_processor import (
     filter_intents, append_intent, post_process, process_intent,
+    local_file_uri, send_video_file, send_video_parts, next_intent, stage_handlers,
+    upload_stage, deliver_stage, download_stage, resolve_stage, finish_job, abort_job, export_video,
+    find_parts, parts_token,
 )
+from dasovbot.constants import OUTCOME_DEFERRED, OUTCOME_DOWNLOAD_FAILED
+from dasovbot.media_budget import MediaBudget
+from dasovbot.services.pipeline import Pipeline, PipelineJob, STAGE_DELIVER, STAGE_POSTPROCESS
+from dasovbot.upload_pool import UploadPool
+
+
+def fingerprint_file_bytes(data: bytes, duration: int, width: int, height: int) -> str:
+    return f'{hashlib.sha256(data).hexdigest()[:32]}:{duration}:{width}x{height}'
 
 
 class TestFilterIntents(unittest.TestCase):
@@ -42,6 +60,7 @@ class TestAppendIntent(unittest.IsolatedAsyncioTestCase):
         await append_intent('url1', state, chat_ids=['100'])
         self.assertIn('url1', state.intents)
         self.assertEqual(state.intents['url1'].chat_ids, ['100'])
+        self.assertIsNotNone(state.intents['url1'].created)
 
     @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
     async def test_appends_to_existing(self, mock_upsert):
@@ -112,6 +131,92 @@ class TestAppendIntent(unittest.IsolatedAsyncioTestCase):
         await append_intent('url1', state)
         self.assertEqual(state.intents['url1'].priority, 2)
 
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    async def test_speculative_intent_has_no_priority(self, mock_upsert):
+        state = self._make_state()
+        await append_intent('url1', state, speculative=True)
+        self.assertTrue(state.intents['url1'].speculative)
+        self.assertEqual(state.intents['url1'].priority, 0)
+
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    async def test_real_request_promotes_speculative_intent(self, mock_upsert):
+        intent = Intent(speculative=True)
+        state = self._make_state(intents={'url1': intent})
+        await append_intent('url1', state, inline_message_id='imid1')
+        self.assertFalse(intent.speculative)
+        self.assertEqual(intent.priority, 2)
+
+
+class TestLocalFileUri(unittest.TestCase):
+    def test_disabled(self):
+        config = make_config(config_folder='/cfg')
+        self.assertIsNone(local_file_uri(config, '/cfg/media/v.mp4'))
+
+    def test_same_path_on_server(self):
+        config = make_config(config_folder='/cfg', local_mode=True)
+        self.assertEqual(local_file_uri(config, '/cfg/media/a b.mp4'), 'file:///cfg/media/a%20b.mp4')
+
+    def test_mapped_server_folder(self):
+        config = make_config(config_folder='/cfg', local_mode=True, local_media_folder='/srv/media')
+        self.assertEqual(local_file_uri(config, '/cfg/media/v.mp4'), 'file:///srv/media/v.mp4')
+
+    def test_outside_media_folder(self):
+        config = make_config(config_folder='/cfg', local_mode=True)
+        self.assertIsNone(local_file_uri(config, '/elsewhere/v.mp4'))
+
+
+class TestSendVideoFile(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'media', 'v.mp4')
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'data')
+
+    async def test_multipart_path_when_not_local(self):
+        bot = AsyncMock()
+        state = make_state(config=make_config(config_folder=self.tmp.name))
+        await send_video_file(bot, state, self.path, caption='c')
+        bot.send_video.assert_awaited_once_with(chat_id='123', video=self.path, caption='c')
+
+    async def test_local_mode_sends_file_uri(self):
+        bot = AsyncMock()
+        state = make_state(config=make_config(config_folder=self.tmp.name, local_mode=True))
+        await send_video_file(bot, state, self.path)
+        self.assertTrue(bot.send_video.call_args[1]['video'].startswith('file://'))
+        self.assertFalse(state.local_upload_unavailable)
+
+    async def test_local_mode_falls_back_to_multipart(self):
+        bot = AsyncMock()
+        bot.send_video.side_effect = [BadRequest('file not found'), MagicMock()]
+        state = make_state(config=make_config(config_folder=self.tmp.name, local_mode=True))
+        await send_video_file(bot, state, self.path)
+        self.assertEqual(bot.send_video.await_count, 2)
+        self.assertFalse(isinstance(bot.send_video.call_args[1]['video'], str))
+        self.assertTrue(state.local_upload_unavailable)
+
+    async def test_local_uploads_skipped_once_unavailable(self):
+        bot = AsyncMock()
+        state = make_state(config=make_config(config_folder=self.tmp.name, local_mode=True), local_upload_unavailable=True)
+        await send_video_file(bot, state, self.path)
+        bot.send_video.assert_awaited_once()
+        self.assertFalse(isinstance(bot.send_video.call_args[1]['video'], str))
+
+    async def test_routes_through_upload_pool(self):
+        helper = AsyncMock()
+        helper.send_video.return_value = MagicMock(chat_id=-100, message_id=5)
+        bot = AsyncMock()
+        pool = UploadPool([helper], '-100', '123', concurrency=1, helper_concurrency=1)
+        pool.uploaders[0].active = 1
+        state = make_state(config=make_config(config_folder=self.tmp.name))
+        with patch('dasovbot.services.intent_processor.get_upload_pool', return_value=pool):
+            message = await send_video_file(bot, state, self.path, caption='c')
+        helper.send_video.assert_awaited_once_with(chat_id='-100', video=self.path, caption='c')
+        bot.forward_message.assert_awaited_once_with(chat_id='123', from_chat_id=-100, message_id=5, disable_notification=True)
+        self.assertIs(message, bot.forward_message.return_value)
+
 
 class TestProcessIntent(unittest.IsolatedAsyncioTestCase):
     @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
@@ -241,5 +346,446 @@ class TestPostProcess(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(info.source, 'subscription')
 
 
+class TestUploadAndDeliverParts(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.parts = []
+        for index in range(3):
+            path = os.path.join(self.tmp.name, f'v.part{index:03d}.mp4')
+            with open(path, 'wb') as f:
+                f.write(b'data')
+            self.parts.append(path)
+
+    def _bot(self):
+        bot = AsyncMock()
+        messages = []
+        for index in range(3):
+            message = AsyncMock()
+            message.video = MagicMock()
+            message.video.file_id = f'part{index}'
+            message.chat_id = '999'
+            messages.append(message)
+        bot.send_video.side_effect = messages + [MagicMock()] * 5
+        return bot, messages
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_uploads_parts_and_delivers_group(self, mock_upsert, mock_delete):
+        bot, messages = self._bot()
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        info = VideoInfo(title='T', caption='cap', webpage_url='https://example.com/v')
+        job = PipelineJob(query='q', info=info, parts=list(self.parts))
+        self.assertEqual(await upload_stage(bot, job, state), STAGE_DELIVER)
+        self.assertFalse(any(os.path.exists(p) for p in self.parts))
+        self.assertIsNone(await deliver_stage(bot, job, state))
+        self.assertEqual(info.parts, ['part0', 'part1', 'part2'])
+        self.assertEqual(info.file_id, 'part0')
+        self.assertIs(state.videos['q'], info)
+        for message in messages:
+            message.delete.assert_awaited_once()
+        media = bot.send_media_group.call_args[1]['media']
+        self.assertEqual([m.media for m in media], ['part0', 'part1', 'part2'])
+        self.assertNotIn('q', state.intents)
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_upload_error_drops_intent(self, mock_delete):
+        bot = AsyncMock()
+        bot.send_video.side_effect = Exception('fail')
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        info = VideoInfo(title='T', caption='cap')
+        job = PipelineJob(query='q', info=info, parts=list(self.parts))
+        self.assertIsNone(await upload_stage(bot, job, state))
+        self.assertIsNone(info.parts)
+        self.assertNotIn('q', state.intents)
+        self.assertFalse(any(os.path.exists(p) for p in self.parts))
+
+
+async def run_job(bot, query, state) -> PipelineJob:
+    done = asyncio.Event()
+
+    async def on_done(job):
+        await finish_job(job, state)
+        done.set()
+
+    pipeline = Pipeline(stage_handlers(bot, state), {}, on_error=partial(abort_job, state=state), on_done=on_done)
+    pipeline.start()
+    job = pipeline.submit(query)
+    try:
+        await asyncio.wait_for(done.wait(), 5)
+    finally:
+        await pipeline.stop()
+    return job
+
+
+class TestStageHandlers(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.extract_info', new_callable=AsyncMock)
+    async def test_cached_video_skips_to_delivery(self, mock_extract, mock_delete):
+        mock_extract.return_value = VideoInfo(title='T', caption='cap', file_id='fid')
+        bot = AsyncMock()
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        with patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock) as mock_download:
+            job = await run_job(bot, 'q', state)
+        mock_download.assert_not_called()
+        self.assertEqual(job.info.file_id, 'fid')
+        bot.send_video.assert_awaited_once_with(chat_id='10', video='fid', caption='cap', disable_notification=True)
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock, return_value=None)
+    @patch('dasovbot.services.intent_processor.extract_info', new_callable=AsyncMock)
+    async def test_missing_download_drops_intent(self, mock_extract, mock_download, mock_delete):
+        mock_extract.return_value = VideoInfo(title='T', webpage_url='https://example.com/v')
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        await run_job(AsyncMock(), 'q', state)
+        self.assertNotIn('q', state.intents)
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.convert_to_mp4', new_callable=AsyncMock, side_effect=OSError('boom'))
+    @patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.extract_info', new_callable=AsyncMock)
+    async def test_stage_exception_aborts_job(self, mock_extract, mock_download, mock_convert, mock_delete):
+        mock_extract.return_value = VideoInfo(title='T')
+        mock_download.return_value = VideoInfo(title='T', filepath='/tmp/missing.mp4')
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        with patch('dasovbot.services.intent_processor.remove') as mock_remove:
+            await run_job(AsyncMock(), 'q', state)
+        mock_remove.assert_called_once_with('/tmp/missing.mp4')
+        self.assertNotIn('q', state.intents)
+
+
+class TestMediaAdmission(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.budget = MediaBudget('/media')
+        patcher = patch('dasovbot.services.intent_processor.get_media_budget', return_value=self.budget)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('dasovbot.services.intent_processor.extract_info', new_callable=AsyncMock)
+    async def test_resolve_reserves_estimate(self, mock_extract):
+        mock_extract.return_value = VideoInfo(title='T', filesize_approx=100)
+        state = make_state(intents={'q': Intent()})
+        with patch.object(self.budget, 'available', return_value=10 ** 9):
+            self.assertEqual(await resolve_stage(AsyncMock(), PipelineJob(query='q'), state), 'download')
+        self.assertEqual(self.budget.reservations, {'q': 200})
+
+    @patch('dasovbot.services.intent_processor.extract_info', new_callable=AsyncMock)
+    async def test_resolve_defers_when_full(self, mock_extract):
+        mock_extract.return_value = VideoInfo(title='T', filesize_approx=100)
+        self.budget.reservations['other'] = 1
+        state = make_state(intents={'q': Intent()})
+        with patch.object(self.budget, 'available', return_value=0):
+            self.assertIsNone(await resolve_stage(AsyncMock(), PipelineJob(query='q'), state))
+            self.assertIn('q', state.intents)
+            self.assertEqual(self.budget.deferred, {'q': 200})
+            self.assertIsNone(next_intent(state, set()))
+
+    async def test_deferred_intent_resubmitted_once_it_fits(self):
+        state = make_state(config=make_config(), intents={'q': Intent(), 'big': Intent(priority=5)})
+        self.budget.reservations['q'] = 1
+        self.budget.deferred['big'] = 300
+        with patch.object(self.budget, 'available', return_value=100):
+            self.assertEqual(next_intent(state, {'q'}), None)
+            await finish_job(PipelineJob(query='q'), state)
+        self.assertEqual(self.budget.reservations, {})
+        self.assertEqual(state.download_queue.get_nowait(), 'q')
+        with patch.object(self.budget, 'available', return_value=500):
+            self.assertEqual(next_intent(state, set()), 'big')
+        self.assertEqual(self.budget.reservations, {'big': 300})
+        self.assertEqual(self.budget.deferred, {})
+
+    def test_forgets_deferred_intents_that_are_gone(self):
+        self.budget.deferred['gone'] = 300
+        self.assertIsNone(next_intent(make_state(), set()))
+        self.assertEqual(self.budget.deferred, {})
+
+    async def test_finish_job_always_wakes_dispatcher(self):
+        # an append_intent for a query still in flight spends its wake-up while the job runs
+        state = make_state(config=make_config())
+        await finish_job(PipelineJob(query='q'), state)
+        self.assertEqual(state.download_queue.get_nowait(), 'q')
+
+
+class TestFinishJobTrace(unittest.IsolatedAsyncioTestCase):
+    def _job(self, **kwargs):
+        job = PipelineJob(query='q', info=VideoInfo(title='T', format='18'), source='inline', created=100.0, **kwargs)
+        job.spans = {'resolve': (101.0, 102.5), 'deliver': (110.0, 112.0)}
+        return job
+
+    async def test_records_delivered_trace(self):
+        state = make_state(config=make_config())
+        job = self._job(stage=STAGE_DELIVER, size=1024)
+        with patch.object(state, 'add_trace', new_callable=AsyncMock) as mock_add:
+            await finish_job(job, state)
+        trace = mock_add.await_args.args[0]
+        self.assertEqual(trace.outcome, 'delivered')
+        self.assertEqual(trace.source, 'inline')
+        self.assertEqual(trace.format, '18')
+        self.assertEqual(trace.size, 1024)
+        self.assertEqual(trace.created, 100.0)
+        self.assertEqual(trace.spans, {'resolve': [1.0, 2.5], 'deliver': [10.0, 12.0]})
+
+    async def test_dropped_outcome(self):
+        state = make_state(config=make_config())
+        with patch.object(state, 'add_trace', new_callable=AsyncMock) as mock_add:
+            await finish_job(self._job(stage=STAGE_POSTPROCESS), state)
+        self.assertEqual(mock_add.await_args.args[0].outcome, 'dropped')
+
+    async def test_deferred_not_recorded(self):
+        state = make_state(config=make_config())
+        with patch.object(state, 'add_trace', new_callable=AsyncMock) as mock_add:
+            await finish_job(self._job(outcome='deferred'), state)
+        mock_add.assert_not_awaited()
+
+    async def test_disabled_by_retention(self):
+        state = make_state(config=make_config(trace_retention_days=0))
+        with patch.object(state, 'add_trace', new_callable=AsyncMock) as mock_add:
+            await finish_job(self._job(stage=STAGE_DELIVER), state)
+        mock_add.assert_not_awaited()
+
+
+class TestNextIntent(unittest.TestCase):
+    def test_skips_ignored_and_in_flight(self):
+        state = make_state(intents={
+            'a': Intent(priority=5),
+            'b': Intent(priority=9, ignored=True),
+            'c': Intent(priority=3),
+        })
+        self.assertEqual(next_intent(state, set()), 'a')
+        self.assertEqual(next_intent(state, {'a'}), 'c')
+        self.assertIsNone(next_intent(state, {'a', 'c'}))
+
+
+class TestSendVideoParts(unittest.IsolatedAsyncioTestCase):
+    async def test_single_video(self):
+        bot = AsyncMock()
+        await send_video_parts(bot, '10', 'fid', 'cap')
+        bot.send_video.assert_awaited_once_with(chat_id='10', video='fid', caption='cap', disable_notification=True)
+
+    async def test_groups_of_ten(self):
+        bot = AsyncMock()
+        parts = [f'p{i}' for i in range(12)]
+        await send_video_parts(bot, '10', 'p0', 'cap', parts)
+        self.assertEqual(bot.send_media_group.await_count, 2)
+        first = bot.send_media_group.await_args_list[0][1]['media']
+        self.assertEqual(len(first), 10)
+        self.assertEqual(first[0].caption, 'cap')
+        self.assertIsNone(first[1].caption)
+
+    async def test_trailing_single_part_sent_as_video(self):
+        bot = AsyncMock()
+        parts = [f'p{i}' for i in range(11)]
+        await send_video_parts(bot, '10', 'p0', 'cap', parts)
+        bot.send_media_group.assert_awaited_once()
+        bot.send_video.assert_awaited_once_with(chat_id='10', video='p10', caption=None, disable_notification=True)
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_message_placeholder_gets_first_part(self, mock_delete):
+        bot = AsyncMock()
+        intent = Intent(messages=[IntentMessage(chat='c1', message='m1')])
+        state = make_state(intents={'q': intent})
+        await process_intent(bot, 'q', 'p0', 'cap', state, parts=['p0', 'p1', 'p2'])
+        self.assertEqual(bot.edit_message_media.call_args[1]['media'].media, 'p0')
+        media = bot.send_media_group.call_args[1]['media']
+        self.assertEqual([m.media for m in media], ['p1', 'p2'])
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_inline_message_links_remaining_parts(self, mock_delete):
+        bot = AsyncMock()
+        bot.username = 'dasovbot'
+        intent = Intent(inline_message_ids=['im1'])
+        state = make_state(intents={'q': intent}, videos={'q': VideoInfo(title='t', file_id='p0', parts=['p0', 'p1'])})
+        await process_intent(bot, 'q', 'p0', 'cap', state, parts=['p0', 'p1'])
+        caption = bot.edit_message_media.call_args[1]['media'].caption
+        token = parts_token(['p0', 'p1'])
+        self.assertEqual(caption, f'cap\n[1/2] all parts: https://t.me/dasovbot?start={token}')
+        self.assertIs(find_parts(state, token), state.videos['q'])
+
+
+class TestDownloadStage(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    async def test_resumes_and_saves_progress(self, mock_upsert):
+        resume = DownloadProgress(path='/media/v.mp4', height=480, downloaded_bytes=10)
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'], download=resume)})
+        progress = DownloadProgress(path='/media/v.mp4', height=480, downloaded_bytes=500)
+
+        async def fake_download(query, resume=None, on_progress=None):
+            self.assertIs(resume, state.intents['q'].download)
+            await on_progress(progress)
+            return VideoInfo(title='T', filepath='/media/v.mp4')
+
+        job = PipelineJob(query='q', info=VideoInfo(title='T'))
+        with patch('dasovbot.services.intent_processor.download_video', side_effect=fake_download):
+            self.assertEqual(await download_stage(AsyncMock(), job, state), STAGE_POSTPROCESS)
+        self.assertIs(state.intents['q'].download, progress)
+        mock_upsert.assert_awaited()
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.gc_partial_downloads')
+    @patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock, return_value=None)
+    async def test_failed_download_collects_partials(self, mock_download, mock_gc, mock_delete):
+        state = make_state(config=make_config(), intents={
+            'q': Intent(download=DownloadProgress(path='/media/q.mp4')),
+            'other': Intent(download=DownloadProgress(path='/media/other.mp4')),
+        })
+        job = PipelineJob(query='q', info=VideoInfo(title='T', webpage_url='https://example.com/v'))
+        self.assertIsNone(await download_stage(AsyncMock(), job, state))
+        mock_gc.assert_called_once_with(state.config.media_folder, ['/media/other.mp4'])
+
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.gc_partial_downloads')
+    async def test_interrupted_download_is_requeued(self, mock_gc, mock_upsert):
+        resume = DownloadProgress(path='/media/v.mp4', downloaded_bytes=10)
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'], download=resume)})
+
+        async def fake_download(query, resume=None, on_progress=None):
+            await on_progress(DownloadProgress(path='/media/v.mp4', downloaded_bytes=500))
+            raise TimeoutError('stalled')
+
+        job = PipelineJob(query='q', info=VideoInfo(title='T'))
+        with patch('dasovbot.services.intent_processor.download_video', side_effect=fake_download):
+            self.assertIsNone(await download_stage(AsyncMock(), job, state))
+        self.assertEqual(job.outcome, OUTCOME_DEFERRED)
+        self.assertEqual(state.intents['q'].download.downloaded_bytes, 500)
+        mock_gc.assert_not_called()
+
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.services.intent_processor.gc_partial_downloads')
+    @patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock, side_effect=ConnectionError('reset'))
+    async def test_interrupted_without_progress_fails(self, mock_download, mock_gc, mock_delete):
+        resume = DownloadProgress(path='/media/v.mp4', downloaded_bytes=10)
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'], download=resume)})
+        job = PipelineJob(query='q', info=VideoInfo(title='T', webpage_url='https://example.com/v'))
+        self.assertIsNone(await download_stage(AsyncMock(), job, state))
+        self.assertEqual(job.outcome, OUTCOME_DOWNLOAD_FAILED)
+        self.assertNotIn('q', state.intents)
+
+
+    async def _download_file(self, state):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        filepath = os.path.join(tmp.name, 'v.mp4')
+        with open(filepath, 'wb') as file:
+            file.write(b'video bytes')
+        downloaded = VideoInfo(title='T', webpage_url='https://mirror.example.com/v', filepath=filepath, duration=60, width=1280, height=720)
+        job = PipelineJob(query='q', info=VideoInfo(title='T'))
+        with patch('dasovbot.services.intent_processor.download_video', new_callable=AsyncMock, return_value=downloaded):
+            stage = await download_stage(AsyncMock(), job, state)
+        return stage, job, filepath
+
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_fingerprint_hit_skips_upload(self, mock_upsert):
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        original = VideoInfo(
+            title='T', file_id='fid', parts=['p1', 'p2'],
+            fingerprint=fingerprint_file_bytes(b'video bytes', 60, 1280, 720),
+        )
+        state.fingerprint_index.add(original)
+        stage, job, filepath = await self._download_file(state)
+        self.assertEqual(stage, STAGE_DELIVER)
+        self.assertEqual(job.file_id, 'fid')
+        self.assertEqual(job.info.parts, ['p1', 'p2'])
+        self.assertFalse(os.path.exists(filepath))
+        self.assertEqual(state.videos['q'].file_id, 'fid')
+        self.assertIn('https://mirror.example.com/v', state.videos)
+        self.assertEqual(state.fingerprint_index.hits, 1)
+        self.assertEqual(state.fingerprint_index.bytes_saved, len(b'video bytes'))
+
+    async def test_fingerprint_miss_continues(self):
+        state = make_state(config=make_config(), intents={'q': Intent(chat_ids=['10'])})
+        stage, job, filepath = await self._download_file(state)
+        self.assertEqual(stage, STAGE_POSTPROCESS)
+        self.assertEqual(job.info.fingerprint, fingerprint_file_bytes(b'video bytes', 60, 1280, 720))
+        self.assertTrue(os.path.exists(filepath))
+        self.assertEqual(state.fingerprint_index.misses, 1)
+
+    async def test_fingerprint_disabled(self):
+        state = make_state(config=make_config(fingerprint_mb=0), intents={'q': Intent(chat_ids=['10'])})
+        stage, job, filepath = await self._download_file(state)
+        self.assertEqual(stage, STAGE_POSTPROCESS)
+        self.assertIsNone(job.info.fingerprint)
+
+
+class TestExportVideo(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.services.intent_processor.remove')
+    @patch('dasovbot.services.intent_processor.link_file', return_value='hardlink')
+    async def test_link_removes_source(self, mock_link, mock_remove):
+        self.assertIsNone(export_video('q', '/data/media/video.mp4'))
+        mock_link.assert_called_once_with('/data/media/video.mp4', '/data/export/video.mp4')
+        mock_remove.assert_called_once_with('/data/media/video.mp4')
+
+    @patch('dasovbot.services.intent_processor.remove')
+    @patch('dasovbot.services.intent_processor.copy_file')
+    @patch('dasovbot.services.intent_processor.link_file', return_value=None)
+    async def test_copies_in_background(self, mock_link, mock_copy, mock_remove):
+        task = export_video('q', '/data/media/video.mp4')
+        self.assertIsNotNone(task)
+        mock_remove.assert_not_called()
+        await task
+        mock_copy.assert_called_once_with('/data/media/video.mp4', '/data/export/video.mp4')
+        mock_remove.assert_called_once_with('/data/media/video.mp4')
+
+    @patch('dasovbot.services.intent_processor.remove')
+    @patch('dasovbot.services.intent_processor.link_file', return_value=None)
+    async def test_copy_keeps_reservation_until_done(self, mock_link, mock_remove):
+        budget = MediaBudget('/')
+        budget.reserve('q', 100)
+        copied = asyncio.Event()
+
+        def slow_copy(src, dst):
+            asyncio.run_coroutine_threadsafe(copied.wait(), loop).result()
+
+        loop = asyncio.get_running_loop()
+        with patch('dasovbot.services.intent_processor.get_media_budget', return_value=budget), \
+                patch('dasovbot.services.intent_processor.copy_file', side_effect=slow_copy):
+            task = export_video('q', '/data/media/video.mp4')
+            await finish_job(PipelineJob(query='q'), make_state(config=make_config(trace_retention_days=0)))
+            self.assertEqual(budget.reservations, {'export:q': 100})
+            copied.set()
+            await task
+        self.assertEqual(budget.reservations, {})
+
+    @patch('dasovbot.services.intent_processor.remove')
+    @patch('dasovbot.services.intent_processor.copy_file', side_effect=OSError('disk full'))
+    @patch('dasovbot.services.intent_processor.link_file', return_value=None)
+    async def test_copy_error_removes_source(self, mock_link, mock_copy, mock_remove):
+        await export_video('q', '/data/media/video.mp4')
+        mock_remove.assert_called_once_with('/data/media/video.mp4')
+
+    @patch('dasovbot.services.intent_processor.export_video')
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_post_process_exports_for_developer(self, mock_upsert, mock_export):
+        state = make_state(config=make_config(developer_id='42'))
+        info = VideoInfo(title='T', webpage_url='https://example.com', filepath='/data/media/video.mp4')
+        msg = MagicMock()
+        msg.video.file_id = 'fid'
+        msg.chat_id = 42
+        msg.delete = AsyncMock()
+        await post_process('q', info, msg, state)
+        mock_export.assert_called_once_with('q', '/data/media/video.mp4')
+
+
+
+class TestFinishJobEvents(unittest.IsolatedAsyncioTestCase):
+    async def _finish(self, **kwargs):
+        state = make_state(config=make_config(trace_retention_days=0))
+        queue = state.events.subscribe()
+        await finish_job(PipelineJob(query='q', info=VideoInfo(title='T'), **kwargs), state)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    async def test_done(self):
+        [event] = await self._finish(stage=STAGE_DELIVER)
+        self.assertEqual(event.type, 'done')
+        self.assertEqual(event.data, {'url': 'q', 'title': 'T', 'outcome': 'delivered'})
+
+    async def test_failed(self):
+        [event] = await self._finish(outcome='upload_failed')
+        self.assertEqual(event.type, 'failed')
+
+    async def test_deferred_is_silent(self):
+        self.assertEqual(await self._finish(outcome='deferred'), [])
+
+
 if __name__ == '__main__':
     unittest.main()
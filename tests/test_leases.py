@@ -0,0 +1,259 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiosqlite
+
+from dasovbot.database import load_intents, load_videos_since, max_video_rowid, migrate_schema, upsert_intent, upsert_video
+from dasovbot.leases import LeaseStore
+from dasovbot.models import DownloadProgress, Intent, VideoInfo
+from dasovbot.services.pipeline import PipelineJob
+from dasovbot.services.intent_processor import abort_job, append_intent
+from dasovbot.services.worker import FrontState, WorkerState, claim_next, finish_leased_job, renew_leases
+from dasovbot.state import BotState
+from tests.helpers import make_memory_db
+
+
+class TestLeaseStore(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = await make_memory_db()
+        self.a = LeaseStore(self.db, 'worker-a')
+        self.b = LeaseStore(self.db, 'worker-b')
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    async def test_claims_by_priority_once(self):
+        await upsert_intent(self.db, 'low', Intent(priority=1))
+        await upsert_intent(self.db, 'high', Intent(priority=5))
+        self.assertEqual((await self.a.claim())[0], 'high')
+        self.assertEqual((await self.b.claim())[0], 'low')
+        self.assertIsNone(await self.a.claim())
+
+    async def test_skips_ignored_and_excluded(self):
+        await upsert_intent(self.db, 'ignored', Intent(priority=9, ignored=True))
+        await upsert_intent(self.db, 'deferred', Intent(priority=5))
+        await upsert_intent(self.db, 'ok', Intent(priority=1))
+        self.assertEqual((await self.a.claim(exclude=['deferred']))[0], 'ok')
+        self.assertIsNone(await self.a.claim(exclude=['deferred']))
+
+    async def test_expired_lease_is_claimable(self):
+        await upsert_intent(self.db, 'a', Intent())
+        await LeaseStore(self.db, 'worker-a', lease_sec=-1).claim()
+        key, _ = await self.b.claim()
+        self.assertEqual(key, 'a')
+        self.assertEqual(await self.a.renew(['a']), set())
+        self.assertEqual(await self.b.renew(['a']), {'a'})
+
+    async def test_release(self):
+        await upsert_intent(self.db, 'a', Intent())
+        await upsert_intent(self.db, 'b', Intent())
+        await self.a.claim()
+        await self.a.claim()
+        await self.b.release('a')
+        self.assertIsNone(await self.b.claim())
+        await self.a.release_all()
+        self.assertIsNotNone(await self.b.claim())
+
+    async def test_complete_returns_stored_requesters(self):
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1']))
+        await self.a.claim()
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1', '2']))
+        self.assertIsNone(await self.b.complete('a'))
+        intent = await self.a.complete('a')
+        self.assertEqual(intent.chat_ids, ['1', '2'])
+        self.assertEqual(await load_intents(self.db), {})
+
+    async def test_save_progress_keeps_requesters_and_lease(self):
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1']))
+        _, intent = await self.a.claim()
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1', '2']))
+        intent.download = DownloadProgress(path='/media/a.part', downloaded_bytes=10)
+        intent.ignored = True
+        await self.a.save_progress('a', intent)
+        stored = (await load_intents(self.db))['a']
+        self.assertEqual(stored.chat_ids, ['1', '2'])
+        self.assertEqual(stored.download.downloaded_bytes, 10)
+        self.assertTrue(stored.ignored)
+        self.assertEqual(await self.a.renew(['a']), {'a'})
+
+
+class TestMigrateSchema(unittest.IsolatedAsyncioTestCase):
+    async def test_adds_lease_columns(self):
+        db = await aiosqlite.connect(':memory:')
+        await db.execute("CREATE TABLE intents (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        await db.execute("INSERT INTO intents VALUES ('a', '{}')")
+        await migrate_schema(db)
+        await migrate_schema(db)
+        self.assertEqual((await LeaseStore(db, 'w').claim())[0], 'a')
+        await db.close()
+
+
+class TestVideosSince(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_new_and_rewritten_rows(self):
+        db = await make_memory_db()
+        await upsert_video(db, 'a', VideoInfo(title='t', file_id='1'))
+        rowid = await max_video_rowid(db)
+        await upsert_video(db, 'b', VideoInfo(title='t', file_id='2'))
+        await upsert_video(db, 'a', VideoInfo(title='t', file_id='3'))
+        videos, rowid = await load_videos_since(db, rowid)
+        self.assertEqual({key: video.file_id for key, video in videos.items()}, {'a': '3', 'b': '2'})
+        self.assertEqual(await load_videos_since(db, rowid), ({}, rowid))
+        await db.close()
+
+
+class TestWorkerState(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = await make_memory_db()
+        self.state = WorkerState(db=self.db, leases=LeaseStore(self.db, 'w'))
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1']))
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    async def test_claim_next_loads_intent(self):
+        self.assertEqual(await claim_next(self.state), 'a')
+        self.assertEqual(self.state.intents['a'].chat_ids, ['1'])
+
+    @patch('dasovbot.services.worker.CLAIM_INTERVAL_SEC', 0.01)
+    async def test_claim_next_waits_for_work(self):
+        await self.state.leases.claim()
+        task = asyncio.create_task(claim_next(self.state))
+        await asyncio.sleep(0.03)
+        self.assertFalse(task.done())
+        await upsert_intent(self.db, 'b', Intent())
+        self.assertEqual(await asyncio.wait_for(task, 1), 'b')
+
+    async def test_pop_intent_completes_lease(self):
+        await claim_next(self.state)
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1', '2']))
+        intent = await self.state.pop_intent('a')
+        self.assertEqual(intent.chat_ids, ['1', '2'])
+        self.assertNotIn('a', self.state.intents)
+
+    async def test_deferred_job_is_released(self):
+        await claim_next(self.state)
+        job = PipelineJob(query='a', outcome='deferred')
+        with patch('dasovbot.services.worker.finish_job', new_callable=AsyncMock):
+            await finish_leased_job(job, self.state)
+        self.assertNotIn('a', self.state.intents)
+        self.assertIsNotNone(await LeaseStore(self.db, 'other').claim())
+
+    async def test_download_paths_include_other_workers(self):
+        await claim_next(self.state)
+        await upsert_intent(self.db, 'b', Intent(download=DownloadProgress(path='/media/b.part')))
+        self.state.intents['a'].download = DownloadProgress(path='/media/a.part')
+        await self.state.save_intent('a')
+        self.assertEqual(sorted(await self.state.download_paths()), ['/media/a.part', '/media/b.part'])
+
+
+class TestLostLease(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = await make_memory_db()
+        self.state = WorkerState(db=self.db, leases=LeaseStore(self.db, 'w', lease_sec=-1))
+        await upsert_intent(self.db, 'a', Intent(chat_ids=['1']))
+        await claim_next(self.state)
+        self.other = LeaseStore(self.db, 'other')
+        await self.other.claim()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    async def test_renewal_failure_cancels_job(self):
+        self.state.leases.lease_sec = 0.03
+        pipeline = MagicMock(jobs={'a': PipelineJob(query='a')})
+        task = asyncio.create_task(renew_leases(self.state, pipeline))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        pipeline.cancel.assert_called_with('a')
+        self.assertIn('a', self.state.lost)
+
+    async def test_aborted_job_leaves_new_owner_alone(self):
+        self.state.lost.add('a')
+        job = PipelineJob(query='a', outcome='cancelled')
+        await abort_job(job, self.state)
+        with patch('dasovbot.services.worker.finish_job', new_callable=AsyncMock):
+            await finish_leased_job(job, self.state)
+        self.assertIn('a', await load_intents(self.db))
+        self.assertEqual(await self.other.renew(['a']), {'a'})
+        self.assertEqual(self.state.lost, set())
+
+
+class TestFrontState(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = await make_memory_db()
+        self.leases = LeaseStore(self.db, 'w')
+        self.state = FrontState(db=self.db)
+        await append_intent('a', self.state, chat_ids=['1'])
+
+    async def asyncTearDown(self):
+        await self.db.close()
+
+    async def test_append_keeps_worker_fields(self):
+        _, intent = await self.leases.claim()
+        intent.download = DownloadProgress(path='/media/a.part', downloaded_bytes=10)
+        await self.leases.save_progress('a', intent)
+        await append_intent('a', self.state, chat_ids=['2'])
+        stored = (await load_intents(self.db))['a']
+        self.assertEqual(stored.chat_ids, ['1', '2'])
+        self.assertEqual(stored.priority, 2)
+        self.assertEqual(stored.download.downloaded_bytes, 10)
+        self.assertEqual(await self.leases.renew(['a']), {'a'})
+
+    async def test_append_after_completion_starts_clean(self):
+        await self.leases.claim()
+        await self.leases.complete('a')
+        await append_intent('a', self.state, chat_ids=['2'])
+        stored = (await load_intents(self.db))['a']
+        self.assertEqual(stored.chat_ids, ['2'])
+        self.assertEqual(stored.priority, 1)
+
+    async def test_save_skips_completed_intent(self):
+        await self.leases.claim()
+        await self.leases.complete('a')
+        await self.state.save_intent('a')
+        self.assertEqual(await load_intents(self.db), {})
+        self.assertNotIn('a', self.state.intents)
+
+    async def test_pop_keeps_leased_intent(self):
+        await self.leases.claim()
+        self.assertIsNone(await self.state.pop_intent('a'))
+        self.assertIn('a', await load_intents(self.db))
+        self.assertIn('a', self.state.intents)
+        await self.leases.release('a')
+        self.assertIsNotNone(await self.state.pop_intent('a'))
+        self.assertEqual(await load_intents(self.db), {})
+        self.assertNotIn('a', self.state.intents)
+
+    async def test_pop_deletes_expired_lease(self):
+        await LeaseStore(self.db, 'dead', lease_sec=-1).claim()
+        self.assertIsNotNone(await self.state.pop_intent('a'))
+        self.assertEqual(await load_intents(self.db), {})
+
+    async def test_ignored_is_left_to_worker_and_retry(self):
+        _, intent = await self.leases.claim()
+        intent.ignored = True
+        await self.leases.save_progress('a', intent)
+        await self.state.save_intent('a')
+        self.assertTrue((await load_intents(self.db))['a'].ignored)
+        await self.state.retry_intent('a')
+        self.assertFalse((await load_intents(self.db))['a'].ignored)
+
+
+class TestReloadIntents(unittest.IsolatedAsyncioTestCase):
+    async def test_publishes_worker_changes(self):
+        db = await make_memory_db()
+        state = BotState(db=db, intents={'done': Intent(), 'kept': Intent()})
+        await upsert_intent(db, 'kept', Intent())
+        await upsert_intent(db, 'new', Intent(created=time.time()))
+        queue = state.events.subscribe()
+        await state.reload_intents()
+        self.assertEqual(set(state.intents), {'kept', 'new'})
+        events = [event for event in (queue.get_nowait() for _ in range(queue.qsize())) if event.type.startswith('intent')]
+        self.assertEqual([(event.type, event.data['url']) for event in events], [('intent', 'new'), ('intent_removed', 'done')])
+        await db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
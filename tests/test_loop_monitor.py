@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from tests.helpers import make_config
+from dasovbot.loop_monitor import LoopMonitor, capture_stack, get_loop_monitor, init_loop_monitor
+
+
+def block_the_loop(seconds):
+    time.sleep(seconds)
+
+
+class TestCaptureStack(unittest.TestCase):
+    def test_captures_other_thread(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def waiter():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        started.wait()
+        try:
+            stall = capture_stack(thread.ident)
+        finally:
+            release.set()
+            thread.join()
+        self.assertIn('waiter', stall.stack)
+        self.assertTrue(stall.where)
+
+    def test_unknown_thread(self):
+        stall = capture_stack(-1)
+        self.assertEqual(stall.stack, '')
+
+
+class TestLoopMonitor(unittest.IsolatedAsyncioTestCase):
+    async def _start(self, **kwargs):
+        monitor = LoopMonitor(**kwargs)
+        monitor.start(asyncio.get_running_loop())
+        self.addAsyncCleanup(monitor.stop)
+        return monitor
+
+    async def test_captures_blocking_call(self):
+        monitor = await self._start(threshold=0.1, interval=0.02)
+        await asyncio.sleep(0.05)
+        with self.assertLogs('dasovbot.loop_monitor', level='WARNING') as logs:
+            block_the_loop(0.3)
+            await asyncio.sleep(0.05)
+        self.assertEqual(monitor.stalls, 1)
+        self.assertGreaterEqual(monitor.max_lag, 0.2)
+        stall = monitor.stats()['recent'][0]
+        self.assertIn('block_the_loop', stall['stack'])
+        self.assertIn('block_the_loop', stall['where'])
+        self.assertGreaterEqual(stall['duration'], 0.2)
+        self.assertTrue(any('loop thread stack' in line for line in logs.output))
+
+    async def test_no_stall_while_idle(self):
+        monitor = await self._start(threshold=0.2, interval=0.01)
+        await asyncio.sleep(0.1)
+        stats = monitor.stats()
+        self.assertTrue(stats['enabled'])
+        self.assertEqual(stats['stalls'], 0)
+        self.assertIsNone(stats['blocked_for'])
+
+    async def test_stop(self):
+        monitor = LoopMonitor(interval=0.01)
+        monitor.start(asyncio.get_running_loop())
+        await monitor.stop()
+        self.assertFalse(monitor.stats()['enabled'])
+        monitor._watchdog.join(1)
+        self.assertFalse(monitor._watchdog.is_alive())
+
+
+class TestInitLoopMonitor(unittest.TestCase):
+    def test_threshold_from_config(self):
+        init_loop_monitor(make_config(loop_lag_threshold_ms=250))
+        self.assertEqual(get_loop_monitor().threshold, 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+
+from tests.helpers import make_config
+from dasovbot.media_budget import (
+    TRANSCODE_SIZE_FACTOR, UNKNOWN_SIZE_ESTIMATE, MediaBudget,
+    estimate_media_bytes, folder_size, init_media_budget, get_media_budget,
+)
+
+Usage = namedtuple('Usage', 'total used free')
+MB = 1 << 20
+
+
+class TestEstimateMediaBytes(unittest.TestCase):
+    def test_known_size(self):
+        self.assertEqual(estimate_media_bytes(100 * MB), int(100 * MB * TRANSCODE_SIZE_FACTOR))
+
+    def test_unknown_size(self):
+        self.assertEqual(estimate_media_bytes(None), int(UNKNOWN_SIZE_ESTIMATE * TRANSCODE_SIZE_FACTOR))
+
+
+class TestFolderSize(unittest.TestCase):
+    def test_sums_files(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name, size in (('a.mp4', 10), ('b.part', 5)):
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(b'x' * size)
+            os.mkdir(os.path.join(folder, 'sub'))
+            self.assertEqual(folder_size(folder), 15)
+
+    def test_missing_folder(self):
+        self.assertEqual(folder_size('/nonexistent/media'), 0)
+
+
+@patch('dasovbot.media_budget.shutil.disk_usage', return_value=Usage(1000 * MB, 0, 1000 * MB))
+class TestMediaBudget(unittest.TestCase):
+    def test_reserves_within_free_space(self, mock_usage):
+        budget = MediaBudget('/media', min_free=100 * MB)
+        self.assertTrue(budget.reserve('a', 500 * MB))
+        self.assertTrue(budget.reserve('b', 400 * MB))
+        self.assertEqual(budget.reserved, 900 * MB)
+
+    def test_defers_when_it_does_not_fit(self, mock_usage):
+        budget = MediaBudget('/media', min_free=100 * MB)
+        budget.reserve('a', 500 * MB)
+        self.assertFalse(budget.reserve('b', 500 * MB))
+        self.assertIn('b', budget.deferred)
+        self.assertNotIn('b', budget.reservations)
+
+    def test_retry_uses_stored_estimate(self, mock_usage):
+        budget = MediaBudget('/media', min_free=100 * MB)
+        budget.reserve('a', 500 * MB)
+        budget.reserve('c', 400 * MB)
+        budget.reserve('b', 600 * MB)
+        self.assertEqual(budget.deferred, {'b': 600 * MB})
+        self.assertFalse(budget.retry('b'))
+        self.assertTrue(budget.release('a'))
+        self.assertFalse(budget.fits(600 * MB))
+        self.assertFalse(budget.retry('b'))
+        self.assertTrue(budget.release('c'))
+        self.assertTrue(budget.fits(600 * MB))
+        self.assertTrue(budget.retry('b'))
+        self.assertEqual(budget.deferred, {})
+        self.assertEqual(budget.reservations, {'b': 600 * MB})
+
+    def test_retry_passes_keys_never_deferred(self, mock_usage):
+        budget = MediaBudget('/media')
+        self.assertTrue(budget.retry('x'))
+        self.assertEqual(budget.reservations, {})
+
+    def test_release_unknown_key(self, mock_usage):
+        budget = MediaBudget('/media')
+        budget.deferred['b'] = MB
+        self.assertFalse(budget.release('missing'))
+        self.assertEqual(budget.deferred, {'b': MB})
+
+    def test_transfer(self, mock_usage):
+        budget = MediaBudget('/media')
+        budget.reserve('a', 600 * MB)
+        self.assertTrue(budget.transfer('a', 'export:a'))
+        self.assertFalse(budget.release('a'))
+        self.assertEqual(budget.reservations, {'export:a': 600 * MB})
+        self.assertFalse(budget.transfer('missing', 'export:missing'))
+
+    def test_lone_oversized_download_is_admitted(self, mock_usage):
+        budget = MediaBudget('/media')
+        self.assertTrue(budget.reserve('a', 5000 * MB))
+
+    def test_reserve_is_idempotent(self, mock_usage):
+        budget = MediaBudget('/media')
+        budget.reserve('a', 600 * MB)
+        self.assertTrue(budget.reserve('a', 600 * MB))
+        self.assertEqual(budget.reserved, 600 * MB)
+
+    @patch('dasovbot.media_budget.folder_size', return_value=700 * MB)
+    def test_limit_counts_used_space(self, mock_size, mock_usage):
+        budget = MediaBudget('/media', limit=1000 * MB)
+        budget.reserve('a', 100 * MB)
+        self.assertFalse(budget.reserve('b', 250 * MB))
+        self.assertTrue(budget.reserve('c', 200 * MB))
+
+    @patch('dasovbot.media_budget.folder_size', return_value=42)
+    def test_stats(self, mock_size, mock_usage):
+        budget = MediaBudget('/media', limit=2000 * MB, min_free=10 * MB)
+        budget.reserve('a', 5 * MB)
+        stats = budget.stats()
+        self.assertEqual(stats['used'], 42)
+        self.assertEqual(stats['reserved'], 5 * MB)
+        self.assertEqual(stats['free'], 1000 * MB)
+        self.assertEqual(stats['reservations'], [{'key': 'a', 'size': 5 * MB}])
+
+    def test_unknown_free_space(self, mock_usage):
+        mock_usage.side_effect = OSError
+        budget = MediaBudget('/media')
+        budget.reserve('a', 1)
+        self.assertTrue(budget.reserve('b', 10 ** 15))
+        self.assertIsNone(budget.stats()['free'])
+
+
+class TestInitMediaBudget(unittest.TestCase):
+    @patch('dasovbot.media_budget._budget', None)
+    def test_from_config(self):
+        init_media_budget(make_config(config_folder='/cfg', media_budget_mb=10, media_min_free_mb=2))
+        budget = get_media_budget()
+        self.assertEqual(budget.folder, '/cfg/media')
+        self.assertEqual(budget.limit, 10 * MB)
+        self.assertEqual(budget.min_free, 2 * MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from dasovbot.metrics import Counter, Gauge, Histogram, Registry, format_value, track, OPERATION_FAILURES, OPERATION_SECONDS
+
+
+class TestFormatValue(unittest.TestCase):
+    def test_integers_and_floats(self):
+        self.assertEqual(format_value(3.0), '3')
+        self.assertEqual(format_value(0.25), '0.25')
+        self.assertEqual(format_value(float('inf')), '+Inf')
+
+
+class TestCounter(unittest.TestCase):
+    def test_inc_and_render(self):
+        counter = Counter('requests_total', 'Requests', ('result',))
+        counter.inc(result='hit')
+        counter.inc(2, result='hit')
+        counter.inc(result='miss')
+        self.assertEqual(counter.value(result='hit'), 3)
+        self.assertEqual(counter.render(), [
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{result="hit"} 3',
+            'requests_total{result="miss"} 1',
+        ])
+
+    def test_rejects_unknown_labels(self):
+        counter = Counter('requests_total', 'Requests', ('result',))
+        with self.assertRaises(ValueError):
+            counter.inc(status='hit')
+
+    def test_escapes_label_values(self):
+        counter = Counter('requests_total', 'Requests', ('source',))
+        counter.inc(source='a"b\\c')
+        self.assertIn('requests_total{source="a\\"b\\\\c"} 1', counter.render())
+
+
+class TestGauge(unittest.TestCase):
+    def test_set_and_clear(self):
+        gauge = Gauge('depth', 'Depth')
+        gauge.set(4)
+        self.assertEqual(gauge.render()[-1], 'depth 4')
+        gauge.clear()
+        self.assertEqual(len(gauge.render()), 2)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        histogram = Histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, stage='a')
+        histogram.observe(0.5, stage='a')
+        histogram.observe(5, stage='a')
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{stage="a",le="0.1"} 1',
+            'latency_seconds_bucket{stage="a",le="1"} 2',
+            'latency_seconds_bucket{stage="a",le="+Inf"} 3',
+            'latency_seconds_sum{stage="a"} 5.55',
+            'latency_seconds_count{stage="a"} 3',
+        ])
+
+    def test_boundary_goes_into_bucket(self):
+        histogram = Histogram('latency_seconds', 'Latency', buckets=(1,))
+        histogram.observe(1)
+        self.assertIn('latency_seconds_bucket{le="1"} 1', histogram.render())
+
+    def test_time(self):
+        histogram = Histogram('latency_seconds', 'Latency')
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.count(), 1)
+
+
+class TestRegistry(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        registry.register(Counter('a_total', 'A')).inc()
+        registry.register(Gauge('b', 'B')).set(2)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP a_total A', '# TYPE a_total counter', 'a_total 1',
+            '# HELP b B', '# TYPE b gauge', 'b 2',
+        ])
+
+
+class TestTrack(unittest.TestCase):
+    def test_counts_failures(self):
+        count = OPERATION_SECONDS.count(operation='test_track')
+        failures = OPERATION_FAILURES.value(operation='test_track')
+        with self.assertRaises(OSError):
+            with track('test_track'):
+                raise OSError('boom')
+        with track('test_track'):
+            pass
+        self.assertEqual(OPERATION_SECONDS.count(operation='test_track'), count + 2)
+        self.assertEqual(OPERATION_FAILURES.value(operation='test_track'), failures + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
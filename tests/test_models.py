@@ -1,5 +1,5 @@
 import unittest
-from dasovbot.models import VideoInfo, VideoOrigin, Intent, IntentMessage, Subscription, TemporaryInlineQuery
+from dasovbot.models import VideoInfo, VideoOrigin, Intent, IntentMessage, Subscription, TemporaryInlineQuery, DownloadProgress, IntentTrace
 
 
 class TestVideoOrigin(unittest.TestCase):
@@ -72,6 +72,15 @@ class TestVideoInfo(unittest.TestCase):
         d = info.to_dict()
         self.assertNotIn('origin', d)
 
+    def test_parts_round_trip(self):
+        info = VideoInfo(title='Test', file_id='p1', parts=['p1', 'p2'])
+        d = info.to_dict()
+        self.assertEqual(d['parts'], ['p1', 'p2'])
+        self.assertEqual(VideoInfo.from_dict(d), info)
+
+    def test_parts_excluded_when_none(self):
+        self.assertNotIn('parts', VideoInfo(title='Test').to_dict())
+
 
 class TestIntentMessage(unittest.TestCase):
     def test_round_trip(self):
@@ -89,6 +98,7 @@ class TestIntent(unittest.TestCase):
             messages=[IntentMessage(chat='123', message='789')],
             priority=5,
             ignored=False,
+            speculative=True,
         )
         d = intent.to_dict()
         restored = Intent.from_dict(d)
@@ -106,6 +116,15 @@ class TestIntent(unittest.TestCase):
         self.assertEqual(intent.chat_ids, [])
         self.assertEqual(intent.priority, 0)
         self.assertFalse(intent.ignored)
+        self.assertFalse(intent.speculative)
+        self.assertIsNone(intent.download)
+
+    def test_round_trip_download_progress(self):
+        intent = Intent(chat_ids=['1'], download=DownloadProgress(
+            path='/media/v.mp4', height=480, format='137+140', downloaded_bytes=1024, total_bytes=4096,
+        ))
+        restored = Intent.from_dict(intent.to_dict())
+        self.assertEqual(intent, restored)
 
 
 class TestSubscription(unittest.TestCase):
@@ -137,5 +156,15 @@ class TestTemporaryInlineQuery(unittest.TestCase):
         self.assertFalse(tiq.ignored)
 
 
+class TestIntentTrace(unittest.TestCase):
+    def test_round_trip(self):
+        trace = IntentTrace(
+            query='q', created=100.0, finished=160.5, outcome='delivered', source='inline',
+            size=1024, format='18', spans={'resolve': [1.0, 2.0]},
+        )
+        self.assertEqual(IntentTrace.from_dict(trace.to_dict()), trace)
+        self.assertEqual(trace.total, 60.5)
+
+
 if __name__ == '__main__':
     unittest.main()
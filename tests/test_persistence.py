@@ -1,8 +1,12 @@
 import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
 
-from dasovbot.persistence import remove, write_file, read_file, empty_media_folder_files
+from dasovbot.persistence import (
+    remove, write_file, read_file, empty_media_folder_files, gc_partial_downloads, link_file, copy_file,
+)
 
 
 class TestRemove(unittest.TestCase):
@@ -62,6 +66,79 @@ class TestEmptyMediaFolderFiles(unittest.TestCase):
         empty_media_folder_files('/tmp/media')
         mock_remove.assert_not_called()
 
+    @patch('dasovbot.persistence.remove')
+    @patch('dasovbot.persistence.os.listdir', return_value=['a.mp4', 'b.f137.mp4.part', 'b.ytdl'])
+    def test_keeps_referenced_downloads(self, mock_listdir, mock_remove):
+        empty_media_folder_files('/tmp/media', keep=['/tmp/media/b.mp4'])
+        mock_remove.assert_called_once_with('/tmp/media/a.mp4')
+
+
+class TestGcPartialDownloads(unittest.TestCase):
+    @patch('dasovbot.persistence.remove')
+    @patch('dasovbot.persistence.os.listdir', return_value=[
+        'kept.f137.mp4.part', 'kept.mp4.ytdl', 'done.mp4',
+        'stale.mp4.part', 'stale.mp4.part-Frag12', 'stale.f140.m4a.ytdl', 'kept2.mp4.part',
+    ])
+    def test_removes_unreferenced_partials(self, mock_listdir, mock_remove):
+        removed = gc_partial_downloads('/tmp/media', keep=['/tmp/media/kept.mp4', None])
+        self.assertEqual(removed, ['stale.mp4.part', 'stale.mp4.part-Frag12', 'stale.f140.m4a.ytdl', 'kept2.mp4.part'])
+        mock_remove.assert_any_call('/tmp/media/stale.mp4.part')
+
+    @patch('dasovbot.persistence.os.listdir', side_effect=FileNotFoundError)
+    def test_missing_folder(self, mock_listdir):
+        self.assertEqual(gc_partial_downloads('/tmp/missing'), [])
+
+
+class TestLinkFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.src = os.path.join(self.tmp.name, 'video.mp4')
+        self.dst = os.path.join(self.tmp.name, 'export.mp4')
+        with open(self.src, 'wb') as file:
+            file.write(b'data')
+
+    def test_hardlink(self):
+        self.assertEqual(link_file(self.src, self.dst), 'hardlink')
+        self.assertTrue(os.path.samefile(self.src, self.dst))
+
+    def test_replaces_existing_target(self):
+        with open(self.dst, 'wb') as file:
+            file.write(b'old')
+        self.assertEqual(link_file(self.src, self.dst), 'hardlink')
+        with open(self.dst, 'rb') as file:
+            self.assertEqual(file.read(), b'data')
+
+    @patch('dasovbot.persistence.reflink', return_value=True)
+    @patch('dasovbot.persistence.os.link', side_effect=OSError(18, 'Invalid cross-device link'))
+    def test_falls_back_to_reflink(self, mock_link, mock_reflink):
+        self.assertEqual(link_file(self.src, self.dst), 'reflink')
+        mock_reflink.assert_called_once_with(self.src, self.dst)
+
+    @patch('dasovbot.persistence.reflink', return_value=False)
+    @patch('dasovbot.persistence.os.link', side_effect=OSError(18, 'Invalid cross-device link'))
+    def test_no_link_available(self, mock_link, mock_reflink):
+        self.assertIsNone(link_file(self.src, self.dst))
+
+
+class TestCopyFile(unittest.TestCase):
+    def test_copies_through_temp_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'video.mp4')
+            dst = os.path.join(tmp, 'export.mp4')
+            with open(src, 'wb') as file:
+                file.write(b'data')
+            copy_file(src, dst)
+            with open(dst, 'rb') as file:
+                self.assertEqual(file.read(), b'data')
+            self.assertEqual(sorted(os.listdir(tmp)), ['export.mp4', 'video.mp4'])
+
+    def test_failure_leaves_no_temp_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(OSError):
+                copy_file(os.path.join(tmp, 'missing.mp4'), os.path.join(tmp, 'export.mp4'))
+            self.assertEqual(os.listdir(tmp), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,228 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from tests.helpers import make_config
+from dasovbot.services.pipeline import (
+    STAGE_DELIVER, STAGE_DOWNLOAD, STAGE_POSTPROCESS, STAGE_RESOLVE, STAGE_UPLOAD, STAGES,
+    Pipeline, PipelineJob, run_stages, stage_concurrency,
+)
+
+NEXT_STAGE = {
+    STAGE_RESOLVE: STAGE_DOWNLOAD,
+    STAGE_DOWNLOAD: STAGE_POSTPROCESS,
+    STAGE_POSTPROCESS: STAGE_UPLOAD,
+    STAGE_UPLOAD: STAGE_DELIVER,
+    STAGE_DELIVER: None,
+}
+
+
+def passthrough_handlers(log=None, overrides=None):
+    def make(stage):
+        async def handler(job):
+            if log is not None:
+                log.append((stage, job.query))
+            return NEXT_STAGE[stage]
+        return handler
+    handlers = {stage: make(stage) for stage in STAGES}
+    handlers.update(overrides or {})
+    return handlers
+
+
+async def wait_idle(pipeline, timeout=1.0):
+    async def idle():
+        while pipeline.jobs:
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(idle(), timeout)
+
+
+class TestRunStages(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_in_order(self):
+        log = []
+        await run_stages(passthrough_handlers(log), PipelineJob(query='q'))
+        self.assertEqual([stage for stage, _ in log], list(STAGES))
+
+    async def test_handler_can_skip_stages(self):
+        log = []
+        handlers = passthrough_handlers(log)
+        handlers[STAGE_RESOLVE] = AsyncMock(return_value=STAGE_DELIVER)
+        job = PipelineJob(query='q')
+        await run_stages(handlers, job)
+        self.assertEqual(log, [(STAGE_DELIVER, 'q')])
+        self.assertEqual(job.stage, STAGE_DELIVER)
+
+    async def test_records_stage_spans(self):
+        job = PipelineJob(query='q')
+        await run_stages(passthrough_handlers(), job)
+        self.assertEqual(list(job.spans), list(STAGES))
+        for start, end in job.spans.values():
+            self.assertLessEqual(start, end)
+
+
+class TestStageConcurrency(unittest.TestCase):
+    def test_from_config(self):
+        concurrency = stage_concurrency(make_config(transcode_concurrency=3, upload_concurrency=4))
+        self.assertEqual(concurrency[STAGE_DOWNLOAD], 1)
+        self.assertEqual(concurrency[STAGE_POSTPROCESS], 3)
+        self.assertEqual(concurrency[STAGE_UPLOAD], 4)
+
+    def test_helper_bots_add_upload_slots(self):
+        config = make_config(upload_concurrency=2, helper_bot_tokens=['a', 'b'], helper_upload_concurrency=3)
+        self.assertEqual(stage_concurrency(config)[STAGE_UPLOAD], 2)
+        config.storage_chat_id = '-100'
+        self.assertEqual(stage_concurrency(config)[STAGE_UPLOAD], 8)
+
+
+class TestPipeline(unittest.IsolatedAsyncioTestCase):
+    async def _start(self, handlers, concurrency=None, **kwargs):
+        pipeline = Pipeline(handlers, concurrency or {}, **kwargs)
+        pipeline.start()
+        self.addAsyncCleanup(pipeline.stop)
+        return pipeline
+
+    async def _submit(self, pipeline, query):
+        await pipeline.acquire()
+        return pipeline.submit(query)
+
+    async def test_download_overlaps_upload(self):
+        upload_started = asyncio.Event()
+        release_upload = asyncio.Event()
+        downloads = []
+
+        async def download(job):
+            downloads.append(job.query)
+            return STAGE_POSTPROCESS
+
+        async def upload(job):
+            upload_started.set()
+            await release_upload.wait()
+            return STAGE_DELIVER
+
+        pipeline = await self._start(passthrough_handlers(overrides={STAGE_DOWNLOAD: download, STAGE_UPLOAD: upload}))
+        await self._submit(pipeline, 'a')
+        await asyncio.wait_for(upload_started.wait(), 1)
+        await self._submit(pipeline, 'b')
+        for _ in range(20):
+            await asyncio.sleep(0)
+        self.assertEqual(downloads, ['a', 'b'])
+        self.assertEqual(pipeline.active[STAGE_UPLOAD], 1)
+        self.assertIn('a', pipeline)
+        release_upload.set()
+        await wait_idle(pipeline)
+        self.assertEqual(pipeline.completed, 2)
+
+    async def test_stage_concurrency(self):
+        running = []
+        peak = []
+        gate = asyncio.Event()
+
+        async def upload(job):
+            running.append(job.query)
+            peak.append(len(running))
+            await gate.wait()
+            running.remove(job.query)
+            return STAGE_DELIVER
+
+        pipeline = await self._start(passthrough_handlers(overrides={STAGE_UPLOAD: upload}), {STAGE_UPLOAD: 2}, queue_size=4)
+        for query in ('a', 'b', 'c'):
+            await self._submit(pipeline, query)
+        for _ in range(20):
+            await asyncio.sleep(0)
+        self.assertEqual(max(peak), 2)
+        gate.set()
+        await wait_idle(pipeline)
+        self.assertEqual(pipeline.completed, 3)
+
+    async def test_dropped_job(self):
+        pipeline = await self._start(passthrough_handlers(overrides={STAGE_DOWNLOAD: AsyncMock(return_value=None)}))
+        await self._submit(pipeline, 'a')
+        await wait_idle(pipeline)
+        self.assertEqual(pipeline.dropped, 1)
+        self.assertEqual(pipeline.completed, 0)
+
+    async def test_on_done_for_finished_and_dropped_jobs(self):
+        done = []
+        handlers = passthrough_handlers(overrides={STAGE_DOWNLOAD: AsyncMock(side_effect=lambda job: None if job.query == 'b' else STAGE_POSTPROCESS)})
+
+        async def on_done(job):
+            done.append(job.query)
+
+        pipeline = await self._start(handlers, on_done=on_done)
+        await self._submit(pipeline, 'a')
+        await self._submit(pipeline, 'b')
+        await wait_idle(pipeline)
+        self.assertEqual(sorted(done), ['a', 'b'])
+
+    async def test_error_calls_on_error(self):
+        on_error = AsyncMock()
+        handlers = passthrough_handlers(overrides={STAGE_POSTPROCESS: AsyncMock(side_effect=OSError('boom'))})
+        pipeline = await self._start(handlers, on_error=on_error)
+        job = await self._submit(pipeline, 'a')
+        await wait_idle(pipeline)
+        on_error.assert_awaited_once_with(job)
+        self.assertEqual(pipeline.dropped, 1)
+        self.assertEqual(job.outcome, 'error')
+
+    async def test_cancel_stops_running_stage(self):
+        log = []
+        started = asyncio.Event()
+
+        async def upload(job):
+            started.set()
+            await asyncio.Event().wait()
+
+        on_error = AsyncMock()
+        pipeline = await self._start(passthrough_handlers(log, {STAGE_UPLOAD: upload}), on_error=on_error)
+        job = await self._submit(pipeline, 'a')
+        await asyncio.wait_for(started.wait(), 1)
+        self.assertTrue(pipeline.cancel('a'))
+        await wait_idle(pipeline)
+        on_error.assert_awaited_once_with(job)
+        self.assertEqual(job.outcome, 'cancelled')
+        self.assertNotIn((STAGE_DELIVER, 'a'), log)
+        self.assertEqual(pipeline.dropped, 1)
+        self.assertFalse(pipeline.cancel('a'))
+
+    async def test_cancel_between_stages(self):
+        log = []
+        gate = asyncio.Event()
+
+        async def download(job):
+            await gate.wait()
+            return STAGE_POSTPROCESS
+
+        pipeline = await self._start(passthrough_handlers(log, {STAGE_DOWNLOAD: download}))
+        job = await self._submit(pipeline, 'a')
+        await asyncio.sleep(0.01)
+        job.cancelled = True
+        gate.set()
+        await wait_idle(pipeline)
+        self.assertEqual(log, [(STAGE_RESOLVE, 'a')])
+        self.assertEqual(job.outcome, 'cancelled')
+
+    async def test_slots_bound_admission(self):
+        gate = asyncio.Event()
+
+        async def resolve(job):
+            await gate.wait()
+            return None
+
+        pipeline = await self._start(passthrough_handlers(overrides={STAGE_RESOLVE: resolve}), queue_size=1)
+        await self._submit(pipeline, 'a')
+        await asyncio.sleep(0)
+        await self._submit(pipeline, 'b')
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(pipeline.acquire(), 0.05)
+        gate.set()
+        await wait_idle(pipeline)
+
+    async def test_stats(self):
+        pipeline = await self._start(passthrough_handlers())
+        stats = pipeline.stats()
+        self.assertEqual([stage['name'] for stage in stats['stages']], list(STAGES))
+        self.assertEqual(stats['jobs'], [])
+        self.assertEqual(stats['completed'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
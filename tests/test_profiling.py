@@ -0,0 +1,101 @@
+import asyncio
+import marshal
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+
+from dasovbot.profiling import MAX_PROFILE_SECONDS, Profiler, dump_tasks
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+class TestCpuProfile(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.profiler = Profiler()
+        self.addCleanup(self.profiler.stop)
+
+    async def test_start_and_stop(self):
+        self.assertTrue(self.profiler.start(30))
+        self.assertTrue(self.profiler.running)
+        self.assertGreater(self.profiler.remaining(), 0)
+        busy_work()
+        result = self.profiler.stop()
+        self.assertFalse(self.profiler.running)
+        self.assertIs(self.profiler.result, result)
+        self.assertIn('busy_work', result.text)
+        self.assertIn('busy_work', result.preview)
+
+    async def test_stats_load_in_pstats(self):
+        self.profiler.start(30)
+        busy_work()
+        result = self.profiler.stop()
+        with tempfile.NamedTemporaryFile(suffix='.prof') as file:
+            file.write(result.stats)
+            file.flush()
+            stats = pstats.Stats(file.name)
+        self.assertTrue(any(name == 'busy_work' for _, _, name in stats.stats))
+        self.assertEqual(marshal.loads(result.stats), stats.stats)
+
+    async def test_single_session(self):
+        self.assertTrue(self.profiler.start(30))
+        self.assertFalse(self.profiler.start(30))
+
+    async def test_stops_after_duration(self):
+        self.profiler.start(1)
+        self.profiler._timer.cancel()
+        self.profiler._timer = asyncio.get_running_loop().call_later(0.01, self.profiler.stop)
+        await asyncio.sleep(0.05)
+        self.assertFalse(self.profiler.running)
+        self.assertIsNotNone(self.profiler.result)
+
+    async def test_duration_clamped(self):
+        self.profiler.start(10 ** 6)
+        self.assertLessEqual(self.profiler.remaining(), MAX_PROFILE_SECONDS)
+
+    async def test_stop_without_session(self):
+        self.assertIsNone(self.profiler.stop())
+
+
+class TestMemorySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.profiler = Profiler()
+        self.addCleanup(self.profiler.stop_memory)
+
+    def test_requires_tracing(self):
+        self.assertIsNone(self.profiler.snapshot_memory())
+
+    def test_top_allocators_and_growth(self):
+        self.profiler.start_memory()
+        self.assertTrue(tracemalloc.is_tracing())
+        first = self.profiler.snapshot_memory()
+        self.assertIn('Top 30 allocators', first)
+        self.assertNotIn('since previous snapshot', first)
+        kept = [bytearray(1024) for _ in range(100)]
+        second = self.profiler.snapshot_memory()
+        self.assertIn('since previous snapshot', second)
+        self.assertTrue(kept)
+        self.profiler.stop_memory()
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class TestDumpTasks(unittest.IsolatedAsyncioTestCase):
+    async def test_lists_tasks_and_threads(self):
+        async def sleeper():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(sleeper(), name='sleeper-task')
+        await asyncio.sleep(0)
+        try:
+            text = dump_tasks()
+        finally:
+            task.cancel()
+        self.assertIn('sleeper-task', text)
+        self.assertIn('in sleeper', text)
+        self.assertIn('Thread MainThread', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from dasovbot.models import VideoInfo
+from dasovbot.search import VideoIndex, tokenize, uploader_tokens
+
+
+class TestTokenize(unittest.TestCase):
+    def test_lowercases_words(self):
+        self.assertEqual(tokenize('Hello, World!'), ['hello', 'world'])
+
+    def test_none(self):
+        self.assertEqual(tokenize(None), [])
+
+
+class TestUploaderTokens(unittest.TestCase):
+    def test_handle(self):
+        self.assertEqual(uploader_tokens('https://www.youtube.com/@SomeChannel'), ['somechannel'])
+
+    def test_last_segment_only(self):
+        self.assertEqual(uploader_tokens('https://www.youtube.com/channel/UC123'), ['uc123'])
+
+    def test_none(self):
+        self.assertEqual(uploader_tokens(None), [])
+
+
+class TestVideoIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VideoIndex()
+        self.index.add(VideoInfo(title='Funny cats compilation', file_id='f1', processed_at='20240101_000000'))
+        self.index.add(VideoInfo(title='Cat food review', file_id='f2', processed_at='20240301_000000',
+                                 uploader_url='https://www.youtube.com/@PetChannel'))
+        self.index.add(VideoInfo(title='Dogs', file_id='f3'))
+
+    def _search(self, query, **kwargs):
+        videos, next_offset = self.index.search(query, **kwargs)
+        return [v.file_id for v in videos], next_offset
+
+    def test_prefix_match_sorted_by_processed_at(self):
+        self.assertEqual(self._search('cat'), (['f2', 'f1'], None))
+
+    def test_all_tokens_must_match(self):
+        self.assertEqual(self._search('cat fun'), (['f1'], None))
+
+    def test_uploader_match(self):
+        self.assertEqual(self._search('petch'), (['f2'], None))
+
+    def test_no_match(self):
+        self.assertEqual(self._search('horse'), ([], None))
+
+    def test_empty_query(self):
+        self.assertEqual(self._search('  '), ([], None))
+
+    def test_skips_videos_without_file_id(self):
+        self.index.add(VideoInfo(title='Cats again'))
+        self.assertEqual(len(self.index), 3)
+
+    def test_readd_replaces_tokens(self):
+        self.index.add(VideoInfo(title='Horses', file_id='f3'))
+        self.assertEqual(self._search('dogs'), ([], None))
+        self.assertEqual(self._search('horse'), (['f3'], None))
+
+    def test_same_video_under_two_keys_indexed_once(self):
+        video = VideoInfo(title='Dogs', file_id='f3')
+        self.index.add(video)
+        self.index.add(video)
+        self.assertEqual(self._search('dog'), (['f3'], None))
+
+    def test_rekeyed_video_drops_old_file_id(self):
+        self.index.add(VideoInfo(title='Dogs', file_id='f3'), 'a')
+        self.index.add(VideoInfo(title='Dogs', file_id='f3'), 'b')
+        self.index.add(VideoInfo(title='Dogs', file_id='f4'), 'a')
+        self.assertEqual(sorted(self._search('dog')[0]), ['f3', 'f4'])
+        self.index.add(VideoInfo(title='Dogs', file_id='f5'), 'b')
+        self.assertEqual(sorted(self._search('dog')[0]), ['f4', 'f5'])
+
+    def test_pagination(self):
+        self.assertEqual(self._search('cat', limit=1), (['f2'], 1))
+        self.assertEqual(self._search('cat', offset=1, limit=1), (['f1'], None))
+
+    def test_remove(self):
+        self.index.remove('f1')
+        self.assertEqual(self._search('funny'), ([], None))
+        self.assertEqual(self._search('cat'), (['f2'], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
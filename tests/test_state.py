@@ -2,7 +2,7 @@ import unittest
 from unittest.mock import AsyncMock, patch
 
 from tests.helpers import make_state
-from dasovbot.models import VideoInfo, Intent, IntentMessage, Subscription
+from dasovbot.models import VideoInfo, Intent, IntentMessage, Subscription, TemporaryInlineQuery
 
 
 class TestSetVideo(unittest.IsolatedAsyncioTestCase):
@@ -14,6 +14,20 @@ class TestSetVideo(unittest.IsolatedAsyncioTestCase):
         self.assertIs(state.videos['k1'], video)
         mock_upsert.assert_awaited_once_with(state.db, 'k1', video)
 
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_indexes_video_with_file_id(self, mock_upsert):
+        state = make_state()
+        await state.set_video('k1', VideoInfo(title='Cat video', file_id='fid1'))
+        videos, _ = state.video_index.search('cat')
+        self.assertEqual([v.file_id for v in videos], ['fid1'])
+
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_indexes_fingerprint(self, mock_upsert):
+        state = make_state()
+        video = VideoInfo(title='T', file_id='fid1', fingerprint='fp')
+        await state.set_video('k1', video)
+        self.assertIs(state.fingerprint_index.lookup('fp'), video)
+
 
 class TestSetIntent(unittest.IsolatedAsyncioTestCase):
     @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
@@ -149,6 +163,39 @@ class TestRemoveSubscriber(unittest.IsolatedAsyncioTestCase):
         mock_delete.assert_not_awaited()
 
 
+class TestSetInlineResults(unittest.TestCase):
+    def test_indexes_with_query(self):
+        state = make_state()
+        state.set_inline_results('q', {'rid1': {'url': 'u1', 'title': 'T', 'upload_date': None}})
+        self.assertEqual(state.inline_results['rid1'], {'url': 'u1', 'title': 'T', 'upload_date': None, 'query': 'q'})
+
+    def test_replaces_previous_results_of_query(self):
+        tiq = TemporaryInlineQuery(inline_queries={'old': {'url': 'u1'}})
+        state = make_state(
+            temporary_inline_queries={'q': tiq},
+            inline_results={'old': {'url': 'u1', 'query': 'q'}},
+        )
+        state.set_inline_results('q', {'new': {'url': 'u1'}})
+        self.assertNotIn('old', state.inline_results)
+        self.assertIn('new', state.inline_results)
+
+
+class TestPopTemporaryInlineQuery(unittest.TestCase):
+    def test_expires_index_entries(self):
+        tiq = TemporaryInlineQuery(inline_queries={'rid1': {'url': 'u1'}})
+        state = make_state(
+            temporary_inline_queries={'q': tiq, 'other': TemporaryInlineQuery()},
+            inline_results={'rid1': {'url': 'u1', 'query': 'q'}, 'rid2': {'url': 'u2', 'query': 'other'}},
+        )
+        self.assertIs(state.pop_temporary_inline_query('q'), tiq)
+        self.assertNotIn('q', state.temporary_inline_queries)
+        self.assertEqual(list(state.inline_results), ['rid2'])
+
+    def test_missing(self):
+        state = make_state()
+        self.assertIsNone(state.pop_temporary_inline_query('q'))
+
+
 class TestClose(unittest.IsolatedAsyncioTestCase):
     async def test_closes_db(self):
         state = make_state()
@@ -160,5 +207,57 @@ class TestClose(unittest.IsolatedAsyncioTestCase):
         await state.close()
 
 
+
+class TestStateEvents(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    async def test_intent_changes(self, mock_delete, mock_upsert):
+        state = make_state()
+        queue = state.events.subscribe()
+        await state.set_intent('q', Intent(title='T', priority=2))
+        state.intents['q'].priority = 4
+        await state.save_intent('q')
+        await state.pop_intent('q')
+        await state.pop_intent('q')
+        events = [queue.get_nowait() for _ in range(queue.qsize())]
+        self.assertEqual([event.type for event in events], ['intent', 'intent', 'intent_removed'])
+        self.assertEqual(events[1].data['priority'], 4)
+        self.assertEqual(events[2].data, {'url': 'q'})
+
+    @patch('dasovbot.database.upsert_video', new_callable=AsyncMock)
+    async def test_counts_on_new_video_only(self, mock_upsert):
+        state = make_state()
+        queue = state.events.subscribe()
+        await state.set_video('k', VideoInfo(title='T'))
+        await state.set_video('k', VideoInfo(title='T2'))
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(queue.get_nowait().data['video_count'], 1)
+
+    async def test_mark_task(self):
+        state = make_state()
+        queue = state.events.subscribe()
+        state.mark_task('populate_subscriptions')
+        event = queue.get_nowait()
+        self.assertEqual(event.type, 'task')
+        self.assertEqual(event.data['last_run'], state.background_task_status['populate_subscriptions'])
+
+
+
+class TestVersions(unittest.IsolatedAsyncioTestCase):
+    @patch('dasovbot.database.upsert_intent', new_callable=AsyncMock)
+    @patch('dasovbot.database.delete_intent', new_callable=AsyncMock)
+    @patch('dasovbot.database.upsert_subscription', new_callable=AsyncMock)
+    async def test_mutations_bump_their_collection(self, mock_sub, mock_delete, mock_upsert):
+        state = make_state()
+        await state.set_intent('q', Intent())
+        await state.save_intent('q')
+        await state.pop_intent('q')
+        await state.pop_intent('q')
+        await state.add_subscriber('missing', '1')
+        self.assertEqual(state.versions['intents'], 3)
+        self.assertEqual(state.versions['subscriptions'], 0)
+        self.assertEqual(state.versions['videos'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -7,7 +7,7 @@ from dasovbot.constants import (
     SUBSCRIBE_URL, SUBSCRIBE_PLAYLIST, SUBSCRIBE_SHOW,
     UNSUBSCRIBE_PLAYLIST,
 )
-from dasovbot.models import Subscription
+from dasovbot.models import Subscription, VideoInfo
 from tests.helpers import (
     make_message, make_callback_query,
     make_update, make_context, make_state,
@@ -332,6 +332,27 @@ class TestSubscribePlaylist(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, SUBSCRIBE_SHOW)
 
 
+class TestSubscribeShow(unittest.IsolatedAsyncioTestCase):
+
+    @patch('dasovbot.handlers.subscription.get_ydl')
+    async def test_sends_every_part_of_split_videos(self, mock_get_ydl):
+        ydl = MagicMock()
+        ydl.extract_info.return_value = {'entries': [{'webpage_url': 'https://example.com/v1'}]}
+        mock_get_ydl.return_value = ydl
+        video = VideoInfo(title='T', file_id='p0', parts=['p0', 'p1'], caption='cap')
+        message = make_message(chat_id=123, text='Playlist\nShow videos?')
+        cq = make_callback_query(data='True', message=message)
+        context = make_context(state=make_state(videos={'https://example.com/v1': video}))
+        context.user_data['subscription_url'] = 'https://example.com/p1'
+
+        from dasovbot.handlers.subscription import subscribe_show
+        result = await subscribe_show(make_update(callback_query=cq), context)
+
+        media = context.bot.send_media_group.call_args[1]['media']
+        self.assertEqual([m.media for m in media], ['p0', 'p1'])
+        self.assertEqual(result, ConversationHandler.END)
+
+
 class TestUnsubscribe(unittest.IsolatedAsyncioTestCase):
 
     @patch('dasovbot.handlers.subscription.unsubscribe_playlist')
@@ -0,0 +1,61 @@
+import unittest
+
+from dasovbot.models import IntentTrace
+from dasovbot.tracing import latency_breakdown, percentile, slowest_traces, trace_durations
+
+
+def make_trace(query='q', source='inline', total=10.0, spans=None):
+    return IntentTrace(
+        query=query, created=1000.0, finished=1000.0 + total, outcome='delivered', source=source,
+        spans=spans if spans is not None else {'resolve': [2.0, 3.0], 'download': [3.0, 7.0]},
+    )
+
+
+class TestPercentile(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 95), 95.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+
+    def test_small_and_empty(self):
+        self.assertEqual(percentile([4.0], 99), 4.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+class TestTraceDurations(unittest.TestCase):
+    def test_queued_stages_and_total(self):
+        durations = trace_durations(make_trace())
+        self.assertEqual(durations, {'queued': 2.0, 'resolve': 1.0, 'download': 4.0, 'total': 10.0})
+        self.assertEqual(list(durations)[0], 'queued')
+
+    def test_no_queue_time_without_creation_time(self):
+        durations = trace_durations(make_trace(spans={'resolve': [0.0, 1.0]}))
+        self.assertNotIn('queued', durations)
+
+
+class TestLatencyBreakdown(unittest.TestCase):
+    def test_rows_per_stage_and_source(self):
+        traces = [make_trace(source='inline'), make_trace(source='inline', total=20.0), make_trace(source=None)]
+        rows = latency_breakdown(traces, ('resolve', 'download'))
+        keys = [(row['stage'], row['source']) for row in rows]
+        self.assertEqual(keys[:3], [('queued', 'all'), ('queued', 'inline'), ('queued', 'unknown')])
+        self.assertEqual(keys[-3:], [('total', 'all'), ('total', 'inline'), ('total', 'unknown')])
+        total = rows[-3]
+        self.assertEqual(total['count'], 3)
+        self.assertEqual(total['p50'], 10.0)
+        self.assertEqual(total['p99'], 20.0)
+
+    def test_extra_stages_before_total(self):
+        rows = latency_breakdown([make_trace(spans={'deliver': [1.0, 2.0], 'fanout': [1.5, 2.0]})], ('deliver',))
+        self.assertEqual([row['stage'] for row in rows if row['source'] == 'all'], ['queued', 'deliver', 'fanout', 'total'])
+
+
+class TestSlowestTraces(unittest.TestCase):
+    def test_sorted_by_total(self):
+        traces = [make_trace('a', total=5.0), make_trace('b', total=50.0), make_trace('c', total=20.0)]
+        self.assertEqual([trace.query for trace in slowest_traces(traces, limit=2)], ['b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from unittest.mock import patch, MagicMock
+
+from dasovbot.transcoder import TranscodePool, TranscodeJob, parse_progress_line, transcode_preset
+
+
+class TestTranscodePreset(unittest.TestCase):
+    def test_short(self):
+        self.assertEqual(transcode_preset(0), 'fast')
+        self.assertEqual(transcode_preset(600), 'fast')
+
+    def test_medium(self):
+        self.assertEqual(transcode_preset(1800), 'veryfast')
+
+    def test_long(self):
+        self.assertEqual(transcode_preset(4 * 3600), 'ultrafast')
+
+
+class TestParseProgressLine(unittest.TestCase):
+    def test_out_time_us(self):
+        self.assertEqual(parse_progress_line('out_time_us=1500000\n'), 1.5)
+
+    def test_out_time_ms(self):
+        self.assertEqual(parse_progress_line('out_time_ms=2000000'), 2.0)
+
+    def test_other_key(self):
+        self.assertIsNone(parse_progress_line('progress=continue'))
+
+    def test_invalid_value(self):
+        self.assertIsNone(parse_progress_line('out_time_us=N/A'))
+
+
+class TestTranscodeJob(unittest.TestCase):
+    def test_progress(self):
+        job = TranscodeJob(id=1, input_path='/media/v.webm', kind='transcode', duration=100, position=25)
+        self.assertEqual(job.progress, 0.25)
+        self.assertEqual(job.to_dict()['filename'], 'v.webm')
+
+    def test_progress_without_duration(self):
+        job = TranscodeJob(id=1, input_path='/media/v.webm', kind='remux', position=25)
+        self.assertEqual(job.progress, 0.0)
+
+
+def _process(returncode=0, lines=()):
+    process = MagicMock()
+    process.stdout = iter(lines)
+    process.wait.return_value = returncode
+    return process
+
+
+class TestRunFfmpeg(unittest.TestCase):
+    def setUp(self):
+        self.pool = TranscodePool(nice=0)
+        self.pool._ionice = None
+        self.job = TranscodeJob(id=1, input_path='/tmp/in.mkv', kind='remux', duration=10)
+
+    @patch('dasovbot.transcoder.os.path.getsize', return_value=1024)
+    @patch('dasovbot.transcoder.os.path.exists', return_value=True)
+    @patch('dasovbot.transcoder.subprocess.Popen')
+    def test_success_tracks_progress(self, mock_popen, mock_exists, mock_size):
+        mock_popen.return_value = _process(lines=['out_time_us=5000000\n', 'progress=end\n'])
+        self.assertTrue(self.pool._run(self.job, '/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy']))
+        args = mock_popen.call_args[0][0]
+        self.assertEqual(args[0], 'ffmpeg')
+        self.assertIn('-progress', args)
+        self.assertIn('+faststart', args)
+        self.assertEqual(self.job.progress, 0.5)
+
+    @patch('dasovbot.transcoder.os.path.exists', return_value=False)
+    @patch('dasovbot.transcoder.subprocess.Popen')
+    def test_failure_nonzero_return(self, mock_popen, mock_exists):
+        mock_popen.return_value = _process(returncode=1)
+        self.assertFalse(self.pool._run(self.job, '/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy']))
+
+    @patch('dasovbot.transcoder.os.path.exists', return_value=False)
+    @patch('dasovbot.transcoder.subprocess.Popen')
+    def test_failure_no_output_file(self, mock_popen, mock_exists):
+        mock_popen.return_value = _process()
+        self.assertFalse(self.pool._run(self.job, '/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy']))
+
+    @patch('dasovbot.transcoder.os.path.getsize', return_value=0)
+    @patch('dasovbot.transcoder.os.path.exists', return_value=True)
+    @patch('dasovbot.transcoder.subprocess.Popen')
+    def test_failure_empty_output(self, mock_popen, mock_exists, mock_size):
+        mock_popen.return_value = _process()
+        self.assertFalse(self.pool._run(self.job, '/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy']))
+
+    @patch('dasovbot.transcoder.subprocess.Popen', side_effect=OSError)
+    def test_missing_ffmpeg(self, mock_popen):
+        self.assertFalse(self.pool._run(self.job, '/tmp/in.mkv', '/tmp/out.mp4', ['-c', 'copy']))
+
+    def test_ionice_prefix(self):
+        self.pool._ionice = '/usr/bin/ionice'
+        command = self.pool._command('/tmp/in.mkv', '/tmp/out.mp4', [])
+        self.assertEqual(command[:5], ['/usr/bin/ionice', '-c', '2', '-n', '7'])
+        self.assertIn('ffmpeg', command)
+
+    def test_nice_prefix(self):
+        self.pool.nice = 10
+        self.pool._nice = '/usr/bin/nice'
+        self.pool._ionice = '/usr/bin/ionice'
+        command = self.pool._command('/tmp/in.mkv', '/tmp/out.mp4', [])
+        self.assertEqual(command[5:9], ['/usr/bin/nice', '-n', '10', 'ffmpeg'])
+
+    def test_segmented_command_passes_faststart_to_segments(self):
+        command = self.pool._command('/tmp/in.mp4', '/tmp/out.part%03d.mp4', ['-f', 'segment'], segmented=True)
+        self.assertIn('movflags=+faststart', command)
+        self.assertNotIn('-movflags', command)
+        self.assertEqual(command[-1], '/tmp/out.part%03d.mp4')
+
+
+class TestTranscodePool(unittest.IsolatedAsyncioTestCase):
+    async def test_limits_concurrency_and_records_stats(self):
+        pool = TranscodePool(concurrency=1)
+        running = []
+        peak = []
+
+        def fake_run(job, input_path, output_path, args, segmented):
+            running.append(job.id)
+            peak.append(len(pool.active))
+            return True
+
+        with patch.object(pool, '_run', side_effect=fake_run):
+            results = await asyncio.gather(
+                pool.run('/tmp/a.mkv', '/tmp/a.mp4', [], duration=30),
+                pool.run('/tmp/b.mkv', '/tmp/b.mp4', [], duration=60),
+            )
+
+        self.assertEqual(results, [True, True])
+        self.assertEqual(max(peak), 1)
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['active'], [])
+        self.assertEqual(stats['media_seconds'], 90)
+
+    async def test_counts_failures(self):
+        pool = TranscodePool()
+        with patch.object(pool, '_run', return_value=False):
+            self.assertFalse(await pool.run('/tmp/a.mkv', '/tmp/a.mp4', []))
+        self.assertEqual(pool.stats()['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from dasovbot.upload_pool import COOLDOWN_BASE_SEC, COOLDOWN_MAX_SEC, UploadPool, get_upload_pool, init_upload_pool
+from tests.helpers import make_config
+
+
+def make_helper(message_id=5):
+    helper = AsyncMock()
+    helper.send_video.return_value = MagicMock(chat_id=-100, message_id=message_id)
+    return helper
+
+
+async def send(bot, chat_id):
+    return await bot.send_video(chat_id=chat_id, video='v.mp4')
+
+
+class TestUploadPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.bot = AsyncMock()
+        self.helpers = [make_helper(), make_helper()]
+        self.pool = UploadPool(self.helpers, '-100', '123', concurrency=1, helper_concurrency=1)
+
+    async def test_main_bot_uploads_directly(self):
+        message = await self.pool.upload(self.bot, send)
+        self.bot.send_video.assert_awaited_once_with(chat_id='123', video='v.mp4')
+        self.bot.forward_message.assert_not_called()
+        self.assertIs(message, self.bot.send_video.return_value)
+
+    async def test_helper_uploads_to_storage_and_main_forwards(self):
+        self.pool.uploaders[0].active = 1
+        message = await self.pool.upload(self.bot, send)
+        self.helpers[0].send_video.assert_awaited_once_with(chat_id='-100', video='v.mp4')
+        self.bot.forward_message.assert_awaited_once_with(chat_id='123', from_chat_id=-100, message_id=5, disable_notification=True)
+        self.helpers[0].delete_message.assert_awaited_once_with(chat_id=-100, message_id=5)
+        self.assertIs(message, self.bot.forward_message.return_value)
+        self.assertEqual(self.pool.uploaders[1].uploads, 1)
+
+    async def test_spreads_concurrent_uploads(self):
+        release = asyncio.Event()
+
+        async def slow_send(bot, chat_id):
+            await release.wait()
+            return await send(bot, chat_id)
+
+        tasks = [asyncio.create_task(self.pool.upload(self.bot, slow_send)) for _ in range(4)]
+        await asyncio.sleep(0)
+        self.assertEqual([uploader.active for uploader in self.pool.uploaders], [1, 1, 1])
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.pool.stats()['active'], 0)
+        self.assertEqual(sum(uploader.uploads for uploader in self.pool.uploaders), 4)
+
+    async def test_failed_helper_cools_down_and_main_retries(self):
+        # busier than the helpers, but with a slot left for the retry
+        self.pool.uploaders[0].concurrency = 2
+        self.pool.uploaders[0].active = 1
+        self.helpers[0].send_video.side_effect = NetworkError('boom')
+        message = await self.pool.upload(self.bot, send)
+        self.assertIs(message, self.bot.send_video.return_value)
+        helper = self.pool.uploaders[1]
+        self.assertFalse(helper.healthy)
+        self.assertEqual(helper.failures, 1)
+        self.assertIn('boom', helper.last_error)
+        await self.pool.upload(self.bot, send)
+        self.helpers[1].send_video.assert_awaited_once()
+
+    async def test_main_bot_retry_waits_for_main_slot(self):
+        main = self.pool.uploaders[0]
+        main.active = 1
+        self.helpers[0].send_video.side_effect = NetworkError('boom')
+        task = asyncio.create_task(self.pool.upload(self.bot, send))
+        await asyncio.sleep(0.01)
+        self.assertFalse(task.done())
+        self.bot.send_video.assert_not_called()
+        self.assertEqual(self.pool.uploaders[1].active, 0)
+        await self.pool.release(main)
+        message = await asyncio.wait_for(task, 1)
+        self.assertIs(message, self.bot.send_video.return_value)
+        self.assertEqual(main.active, 0)
+        self.assertEqual(main.uploads, 1)
+
+    def test_cooldowns(self):
+        helper = self.pool.uploaders[1]
+        helper.failed(NetworkError('x'))
+        first = helper.cooldown_until
+        helper.failed(NetworkError('x'))
+        self.assertAlmostEqual(helper.cooldown_until - first, COOLDOWN_BASE_SEC, delta=1)
+        helper.failed(RetryAfter(7))
+        self.assertLessEqual(helper.to_dict()['cooldown'], 7)
+        helper.failed(Forbidden('bot was kicked'))
+        self.assertGreater(helper.to_dict()['cooldown'], COOLDOWN_MAX_SEC - 1)
+        helper.succeeded()
+        self.assertTrue(helper.healthy)
+        self.assertEqual(helper.consecutive_failures, 0)
+
+
+class TestInitUploadPool(unittest.TestCase):
+    def test_needs_tokens_and_storage_chat(self):
+        init_upload_pool(make_config(helper_bot_tokens=['1:a']))
+        self.assertIsNone(get_upload_pool())
+        init_upload_pool(make_config(helper_bot_tokens=['1:a', '2:b'], storage_chat_id='-100', upload_concurrency=3))
+        pool = get_upload_pool()
+        self.assertEqual([uploader.name for uploader in pool.uploaders], ['main', 'helper1', 'helper2'])
+        self.assertEqual(pool.capacity, 5)
+        self.assertEqual(pool.target_chat_id, '123')
+
+    def tearDown(self):
+        init_upload_pool(make_config())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+from telegram import Update
+
+from dasovbot.constants import WEBHOOK_PATH
+from dasovbot.dashboard.auth import auth_middleware
+from dasovbot.webhook import SECRET_HEADER, WebhookReceiver, get_webhook, init_webhook, serve_webhook
+from tests.helpers import make_config
+
+UPDATE = {'update_id': 1, 'message': {'message_id': 2, 'date': 0, 'chat': {'id': 3, 'type': 'private'}, 'text': 'hi'}}
+
+
+def make_request(body=UPDATE, secret='s3cret'):
+    request = make_mocked_request('POST', WEBHOOK_PATH, headers={SECRET_HEADER: secret} if secret else {})
+    request.json = AsyncMock(return_value=body) if not isinstance(body, Exception) else AsyncMock(side_effect=body)
+    return request
+
+
+def make_application():
+    application = MagicMock()
+    application.update_queue = asyncio.Queue()
+    application.bot = None
+    return application
+
+
+class TestWebhookReceiver(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.receiver = WebhookReceiver('s3cret', max_pending=2)
+        self.receiver.application = make_application()
+
+    async def test_enqueues_update(self):
+        response = await self.receiver.handle(make_request())
+        self.assertEqual(response.status, 200)
+        update = self.receiver.application.update_queue.get_nowait()
+        self.assertIsInstance(update, Update)
+        self.assertEqual(update.update_id, 1)
+
+    async def test_rejects_wrong_secret(self):
+        for secret in ('nope', None):
+            with self.assertRaises(web.HTTPForbidden):
+                await self.receiver.handle(make_request(secret=secret))
+        self.assertTrue(self.receiver.application.update_queue.empty())
+
+    async def test_busy_when_backlog_full(self):
+        await self.receiver.handle(make_request())
+        await self.receiver.handle(make_request())
+        with self.assertRaises(web.HTTPServiceUnavailable) as ctx:
+            await self.receiver.handle(make_request())
+        self.assertEqual(ctx.exception.headers['Retry-After'], '1')
+
+    async def test_busy_until_application_started(self):
+        self.receiver.application = None
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            await self.receiver.handle(make_request())
+
+    async def test_invalid_body(self):
+        for body in (ValueError('bad json'), {'message': {}}, ['x']):
+            with self.assertRaises(web.HTTPBadRequest):
+                await self.receiver.handle(make_request(body))
+
+
+class TestWebhookAuth(unittest.IsolatedAsyncioTestCase):
+    async def test_bypasses_session(self):
+        handler = AsyncMock(return_value=web.Response())
+        await auth_middleware(make_mocked_request('POST', WEBHOOK_PATH), handler)
+        handler.assert_awaited_once()
+
+
+class TestInitWebhook(unittest.TestCase):
+    def test_disabled_without_url(self):
+        init_webhook(make_config())
+        self.assertIsNone(get_webhook())
+
+    def test_generates_secret(self):
+        init_webhook(make_config(webhook_url='https://bot.example.com'))
+        self.assertGreaterEqual(len(get_webhook().secret), 32)
+        init_webhook(make_config(webhook_url='https://bot.example.com', webhook_secret='fixed'))
+        self.assertEqual(get_webhook().secret, 'fixed')
+
+
+class TestServeWebhook(unittest.IsolatedAsyncioTestCase):
+    async def test_registers_webhook_and_shuts_down(self):
+        config = make_config(webhook_url='https://bot.example.com/', webhook_secret='s3cret', webhook_concurrency=4)
+        init_webhook(config)
+        application = AsyncMock()
+        application.running = True
+        stop = asyncio.Event()
+        task = asyncio.create_task(serve_webhook(application, config, stop))
+        await asyncio.sleep(0)
+        self.assertIs(get_webhook().application, application)
+        application.post_init.assert_awaited_once_with(application)
+        application.bot.set_webhook.assert_awaited_once_with(
+            f'https://bot.example.com{WEBHOOK_PATH}',
+            secret_token='s3cret',
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=4,
+        )
+        stop.set()
+        await task
+        self.assertIsNone(get_webhook().application)
+        application.stop.assert_awaited_once()
+        application.shutdown.assert_awaited_once()
+        application.bot.delete_webhook.assert_not_called()
+
+    def tearDown(self):
+        init_webhook(make_config())
+
+
+if __name__ == '__main__':
+    unittest.main()